@@ -36,17 +36,175 @@ class Settings(BaseSettings):
     SUPABASE_URL: str
     SUPABASE_ANON_KEY: str
     SUPABASE_SERVICE_ROLE_KEY: str
-    
+
+    # Direct Postgres connection (asyncpg pool) for hot paths
+    # Leave empty to fall back to the Supabase REST client
+    # Supabase: Settings → Database → Connection string (URI)
+    DATABASE_URL: str = ""
+    DB_POOL_MIN_SIZE: int = 2
+    DB_POOL_MAX_SIZE: int = 10
+    DB_POOL_ACQUIRE_TIMEOUT: float = 10.0  # Seconds to wait for a free connection
+    DB_COMMAND_TIMEOUT: float = 30.0  # Seconds per statement
+    DB_POOL_MAX_INACTIVE_LIFETIME: float = 300.0
+    # Set to 0 when connecting through PgBouncer in transaction mode (port 6543)
+    DB_STATEMENT_CACHE_SIZE: int = 100
+
     # OpenAI settings
     OPENAI_API_KEY: str
     OPENAI_MODEL: str = "gpt-4o-mini"
     OPENAI_EMBEDDING_MODEL: str = "text-embedding-3-small"
     
+    # LLM gateway: concurrency caps, time budgets, retries and circuit breaker
+    # for every OpenAI call. LLM_PROVIDER=fake simulates the API offline
+    LLM_PROVIDER: str = "openai"
+    LLM_CHAT_CONCURRENCY: int = 16
+    LLM_EMBEDDING_CONCURRENCY: int = 8
+    LLM_CHAT_TIMEOUT_SECONDS: float = 60.0  # Per attempt (and per stream delta)
+    LLM_EMBEDDING_TIMEOUT_SECONDS: float = 20.0
+    LLM_CHAT_DEADLINE_SECONDS: float = 120.0  # Total across retries
+    LLM_EMBEDDING_DEADLINE_SECONDS: float = 45.0
+    LLM_MAX_RETRIES: int = 3
+    LLM_BACKOFF_BASE_SECONDS: float = 0.5
+    LLM_BACKOFF_MAX_SECONDS: float = 8.0
+    LLM_HEDGE_AFTER_SECONDS: float = 0.0  # 0 disables hedged requests
+    LLM_BREAKER_FAILURE_THRESHOLD: int = 5  # Consecutive failed calls to open
+    LLM_BREAKER_RESET_SECONDS: float = 30.0
+    LLM_FAKE_LATENCY_SECONDS: float = 0.05
+    LLM_FAKE_FAILURE_RATE: float = 0.0
+    
     # RAG Configuration
     RAG_CHUNK_SIZE: int = 500
     RAG_CHUNK_OVERLAP: int = 50
     RAG_TOP_K: int = 5
     RAG_SIMILARITY_THRESHOLD: float = 0.7
+    RAG_CONTEXT_TOKEN_BUDGET: int = 3000  # Max tokens of chunk text in the prompt
+    
+    # Streaming ingestion: chunks per embedding request / insert, and max
+    # items waiting between pipeline stages (bounds memory per upload)
+    INGEST_BATCH_SIZE: int = 64
+    INGEST_QUEUE_SIZE: int = 2
+    # With the asyncpg pool: write a material's chunks with binary COPY in one
+    # transaction (no partial chunks on failure, atomic replace on
+    # re-processing; chunks become searchable at commit)
+    INGEST_BULK_COPY: bool = True
+    # Near-duplicate chunks across materials of a course (MinHash + LSH):
+    # linked to the canonical chunk (canonical_chunk_id) and stored without
+    # an embedding. Needs sql/near_duplicate_chunks.sql. Jaccard threshold
+    # on word 5-shingles; NEAR_DUP_NUM_PERM must be a multiple of NEAR_DUP_BANDS
+    NEAR_DUP_ENABLED: bool = False
+    NEAR_DUP_INDEX_PATH: str = "near_duplicates.sqlite"
+    NEAR_DUP_THRESHOLD: float = 0.8
+    NEAR_DUP_NUM_PERM: int = 128
+    NEAR_DUP_BANDS: int = 16
+    # Bulk embedding: requests packed by tokens (OpenAI limit 300k/request),
+    # several in flight, each retried on its own after the gateway gives up
+    INGEST_EMBED_MAX_BATCH_TOKENS: int = 250000
+    INGEST_EMBED_CONCURRENCY: int = 4
+    INGEST_EMBED_MAX_ATTEMPTS: int = 4
+    INGEST_EMBED_BACKOFF_SECONDS: float = 2.0
+    # SQLite file with embeddings of finished requests, so re-processing a
+    # failed material resumes (empty = no checkpoints)
+    INGEST_CHECKPOINT_PATH: str = "ingest_checkpoints.sqlite"
+    # Reuse chunks/embeddings of an already processed PDF with the same
+    # SHA-256. Needs materials.content_hash: enable it only after running
+    # sql/material_content_hash.sql
+    UPLOAD_DEDUP_ENABLED: bool = False
+    
+    # Durable ingestion job queue (SQLite) and worker. With
+    # JOB_WORKER_EMBEDDED the web process also runs jobs; set it to false
+    # and run `python -m app.worker` on the same host to keep ingestion
+    # off the query-serving process
+    JOB_QUEUE_PATH: str = "job_queue.sqlite"
+    JOB_SPOOL_DIR: str = ".job_spool"  # Uploaded PDFs waiting for their job
+    JOB_WORKER_EMBEDDED: bool = True
+    JOB_WORKER_CONCURRENCY: int = 2
+    JOB_LEASE_SECONDS: float = 300.0  # A job whose lease expires is retried elsewhere
+    JOB_POLL_INTERVAL_SECONDS: float = 2.0
+    JOB_MAX_ATTEMPTS: int = 3  # Then dead-lettered
+    JOB_BACKOFF_SECONDS: float = 30.0
+    # Ingestion progress streamed by GET /api/materials/{id}/progress; the
+    # SQLite file is shared by the worker (writes) and web processes (reads)
+    PROGRESS_STORE_PATH: str = "ingestion_progress.sqlite"
+    PROGRESS_MIN_INTERVAL_SECONDS: float = 0.5  # Throttle for progress writes
+    
+    # OCR of scanned PDFs: page ranges rasterized lazily and recognized in a
+    # process pool (one Tesseract pass per page)
+    OCR_WORKERS: int = 0  # 0 = one per CPU core
+    OCR_DPI: int = 300
+    OCR_PAGES_PER_TASK: int = 2  # Pages rasterized at once by each worker
+    # Ingestion OCRs only pages with (almost) no text layer that are mostly
+    # covered by images; other pages keep using pdfplumber
+    OCR_ENABLED: bool = True
+    OCR_MIN_TEXT_DENSITY: float = 1.0  # Text-layer chars per square inch
+    OCR_MIN_IMAGE_COVERAGE: float = 0.3  # Share of the page area
+    # Tesseract results cached by page-image hash (empty = no cache)
+    OCR_CACHE_PATH: str = "ocr_cache.sqlite"
+    # OCR at OCR_LOW_DPI first; only pages below OCR_MIN_CONFIDENCE (mean
+    # word confidence, 0-100) are rendered again at OCR_DPI
+    OCR_ADAPTIVE_DPI: bool = True
+    OCR_LOW_DPI: int = 200
+    OCR_MIN_CONFIDENCE: float = 75.0
+
+    # CPU pool: PDF text extraction and tokenization run in worker processes
+    # so they do not hold the GIL of the process serving queries
+    CPU_POOL_ENABLED: bool = True  # false = threads in the web process
+    CPU_POOL_WORKERS: int = 0  # 0 = one per CPU core minus one (at least 1)
+    CPU_POOL_PAGES_PER_TASK: int = 8  # Pages extracted per task (one document uses several workers)
+    
+    # Hybrid retrieval: BM25 (SQLite inverted index) + vector, fused with RRF
+    RAG_HYBRID_SEARCH: bool = True
+    BM25_INDEX_PATH: str = "bm25_index.sqlite"
+    BM25_K1: float = 1.2
+    BM25_B: float = 0.75
+    RAG_RRF_K: int = 60
+    # Max seconds to wait for the question embedding before answering
+    # from BM25 alone (degraded mode)
+    RAG_EMBEDDING_DEADLINE_SECONDS: float = 2.0
+    
+    # Re-ranking: over-fetch fetch_k = top_k * RAG_FETCH_K_MULTIPLIER
+    # candidates, then keep top_k with MMR (diversity 0 = relevance only)
+    RAG_RERANK_ENABLED: bool = True
+    RAG_FETCH_K_MULTIPLIER: int = 4
+    RAG_MMR_DIVERSITY: float = 0.3
+    RAG_LEXICAL_RERANK_WEIGHT: float = 0.2  # Weight of query-term overlap in relevance
+    
+    # Retriever backend: "rpc" (match_material_chunks in Postgres) or
+    # "local" (in-process IVF index over an mmap'd matrix, needs DATABASE_URL)
+    RAG_RETRIEVER: str = "rpc"
+    LOCAL_INDEX_DIR: str = ".local_index"
+    LOCAL_INDEX_DTYPE: str = "float16"  # float16 halves RAM, float32 is exact
+    LOCAL_INDEX_TYPE: str = "ivf"  # "ivf" or "flat" (brute force)
+    LOCAL_INDEX_NLIST: int = 0  # IVF lists, 0 = sqrt(n_chunks)
+    LOCAL_INDEX_NPROBE: int = 16  # IVF lists scanned per query
+    LOCAL_INDEX_SYNC_INTERVAL_SECONDS: int = 60
+    # Postgres vector search profile: "full" (HNSW over the 1536-dim vectors),
+    # or a first pass on a smaller index - "halfvec" (float16), "matryoshka"
+    # (first RAG_VECTOR_DIMENSIONS dims as halfvec) or "binary" (1 bit/dim) -
+    # with exact rescoring of RAG_VECTOR_CANDIDATES candidates. Needs
+    # sql/embedding_profiles.sql and the index from migrate_embedding_profile.py
+    RAG_VECTOR_PROFILE: str = "full"
+    RAG_VECTOR_DIMENSIONS: int = 512
+    RAG_VECTOR_CANDIDATES: int = 100
+    
+    # Embedding cache (query and chunk embeddings)
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 10000  # In-process LRU size
+    EMBEDDING_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    EMBEDDING_CACHE_DISK_PATH: str = ""  # SQLite file, empty = memory only
+    EMBEDDING_CACHE_DISK_MAX_ENTRIES: int = 100000  # Oldest rows evicted beyond this, 0 = unbounded
+    
+    # Micro-batching of concurrent question embeddings
+    EMBEDDING_BATCHING_ENABLED: bool = True
+    EMBEDDING_BATCH_WINDOW_MS: float = 8.0  # Wait this long for more texts
+    EMBEDDING_BATCH_MAX_TEXTS: int = 64  # Or until this many are queued
+    
+    # Semantic answer cache for /api/rag/query
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.95  # Cosine similarity for a hit
+    ANSWER_CACHE_MAX_ENTRIES_PER_SCOPE: int = 500
+    ANSWER_CACHE_TTL_SECONDS: int = 24 * 3600
+    # Invalidation counters shared with the ingestion worker process(es)
+    ANSWER_CACHE_VERSIONS_PATH: str = "answer_cache_versions.sqlite"
     
     # Server Configuration
     API_PREFIX: str = "/api"
@@ -1,10 +1,25 @@
 """
 Database connection management for Supabase
+
+Two access paths are available:
+- asyncpg connection pool (DATABASE_URL): used by the hot paths (vector search,
+  chunk inserts, material/evaluation lookups) so DB round trips never block
+  the event loop.
+- Supabase REST client: used by the rest of the routers, and as a fallback for
+  the hot paths when DATABASE_URL is not configured. Fallback calls run in a
+  worker thread because supabase-py is synchronous.
 """
 
 from supabase import create_client, Client
-from typing import Optional
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import datetime
+import json
 import logging
+import uuid
+
+import asyncpg
+from pgvector.asyncpg import register_vector
 
 from app.core.config import settings
 
@@ -13,9 +28,71 @@ logger = logging.getLogger(__name__)
 # Global Supabase client instance
 _supabase_client: Optional[Client] = None
 
+# Global asyncpg pool (None when DATABASE_URL is not set)
+_db_pool: Optional[asyncpg.Pool] = None
+
+
+def _encode_jsonb(value: Any) -> bytes:
+    # jsonb binary format: version byte 1, then the JSON text
+    return b"\x01" + json.dumps(value).encode("utf-8")
+
+
+def _decode_jsonb(data: bytes) -> Any:
+    return json.loads(data[1:])
+
+
+async def _init_connection(conn: asyncpg.Connection):
+    """
+    Register pgvector and JSON codecs on every new pooled connection
+
+    All of them use the binary format: binary COPY (MaterialChunkLoader)
+    needs a binary encoder for every column.
+    """
+    await register_vector(conn)
+    await conn.set_type_codec(
+        "json",
+        encoder=lambda value: json.dumps(value).encode("utf-8"),
+        decoder=json.loads,
+        schema="pg_catalog",
+        format="binary"
+    )
+    await conn.set_type_codec(
+        "jsonb",
+        encoder=_encode_jsonb,
+        decoder=_decode_jsonb,
+        schema="pg_catalog",
+        format="binary"
+    )
+
+
+async def init_pool():
+    """Create the asyncpg connection pool if DATABASE_URL is configured"""
+    global _db_pool
+    if not settings.DATABASE_URL:
+        logger.info("DATABASE_URL not set, hot paths will use the Supabase REST client")
+        return
+    try:
+        _db_pool = await asyncpg.create_pool(
+            dsn=settings.DATABASE_URL,
+            min_size=settings.DB_POOL_MIN_SIZE,
+            max_size=settings.DB_POOL_MAX_SIZE,
+            command_timeout=settings.DB_COMMAND_TIMEOUT,
+            max_inactive_connection_lifetime=settings.DB_POOL_MAX_INACTIVE_LIFETIME,
+            statement_cache_size=settings.DB_STATEMENT_CACHE_SIZE,
+            init=_init_connection
+        )
+        logger.info(
+            f"asyncpg pool initialized (min={settings.DB_POOL_MIN_SIZE}, "
+            f"max={settings.DB_POOL_MAX_SIZE})"
+        )
+    except Exception as e:
+        # Not fatal: the Supabase client still works
+        logger.error(f"Failed to initialize asyncpg pool, using Supabase fallback: {e}")
+        _db_pool = None
+
 
 async def init_db():
-    """Initialize Supabase client"""
+    """Initialize Supabase client and the asyncpg pool"""
     global _supabase_client
     try:
         _supabase_client = create_client(
@@ -26,6 +103,7 @@ async def init_db():
     except Exception as e:
         logger.error(f"Failed to initialize Supabase client: {e}")
         raise
+    await init_pool()
 
 
 def get_supabase_client() -> Client:
@@ -35,9 +113,716 @@ def get_supabase_client() -> Client:
     return _supabase_client
 
 
+def get_db_pool() -> Optional[asyncpg.Pool]:
+    """Get the asyncpg pool, or None if only the Supabase client is available"""
+    return _db_pool
+
+
 async def close_db():
-    """Close Supabase connection"""
-    global _supabase_client
+    """Close Supabase connection and the asyncpg pool"""
+    global _supabase_client, _db_pool
+    if _db_pool:
+        logger.info("Closing asyncpg pool")
+        await _db_pool.close()
+        _db_pool = None
     if _supabase_client:
         logger.info("Closing Supabase connection")
         _supabase_client = None
+
+
+# ============================================================================
+# ASYNC REPOSITORY (hot paths)
+# ============================================================================
+
+def _to_jsonable(value: Any) -> Any:
+    """Convert asyncpg values to the same shapes PostgREST returns"""
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+def _record_to_dict(record: asyncpg.Record) -> Dict:
+    return {key: _to_jsonable(value) for key, value in record.items()}
+
+
+async def _run_supabase(fn):
+    """Run a blocking supabase-py call in a worker thread"""
+    return await asyncio.to_thread(fn)
+
+
+async def match_material_chunks(
+    query_embedding: List[float],
+    match_threshold: float,
+    match_count: int,
+    course_id: Optional[str] = None,
+    material_id: Optional[str] = None
+) -> List[Dict]:
+    """
+    Vector similarity search over material_chunks
+
+    Calls the same SQL function as the RPC, so threshold and filter
+    semantics are identical on both paths: `match_material_chunks`, or
+    with a RAG_VECTOR_PROFILE other than "full" `match_material_chunks_rerank`
+    (first pass on the profile's reduced/quantized index, exact rescoring
+    of RAG_VECTOR_CANDIDATES candidates; see sql/embedding_profiles.sql).
+
+    Near-duplicate chunks (NEAR_DUP_ENABLED) have no embedding, so only
+    their canonical row can match. A search filtered by material also
+    scores the material's own duplicate rows with their canonical's
+    embedding, so it still finds content shared with other materials.
+    """
+    profile = settings.RAG_VECTOR_PROFILE
+    params = {
+        'query_embedding': query_embedding,
+        'match_threshold': match_threshold,
+        'match_count': match_count,
+        'filter_course_id': course_id,
+        'filter_material_id': material_id
+    }
+    if profile != "full":
+        params.update({
+            'search_profile': profile,
+            'search_dimensions': settings.RAG_VECTOR_DIMENSIONS,
+            'candidate_count': settings.RAG_VECTOR_CANDIDATES
+        })
+    function = 'match_material_chunks' if profile == "full" else 'match_material_chunks_rerank'
+
+    pool = get_db_pool()
+    if pool is None:
+        supabase = get_supabase_client()
+        result = await _run_supabase(lambda: supabase.rpc(function, params).execute())
+        matches = result.data if result.data else []
+    else:
+        matches = await _fetch_matches(pool, profile, params)
+
+    if settings.NEAR_DUP_ENABLED and material_id:
+        duplicates = await _match_duplicate_chunks(query_embedding, match_threshold, match_count, material_id)
+        if duplicates:
+            matches = sorted(matches + duplicates, key=lambda match: match["similarity"], reverse=True)[:match_count]
+    return matches
+
+
+async def _fetch_matches(pool, profile: str, params: Dict) -> List[Dict]:
+    async with pool.acquire(timeout=settings.DB_POOL_ACQUIRE_TIMEOUT) as conn:
+        if profile == "full":
+            rows = await conn.fetch(
+                """
+                SELECT * FROM match_material_chunks(
+                    query_embedding => $1,
+                    match_threshold => $2,
+                    match_count => $3,
+                    filter_course_id => $4::uuid,
+                    filter_material_id => $5::uuid
+                )
+                """,
+                *params.values()
+            )
+        else:
+            rows = await conn.fetch(
+                """
+                SELECT * FROM match_material_chunks_rerank(
+                    query_embedding => $1,
+                    match_threshold => $2,
+                    match_count => $3,
+                    filter_course_id => $4::uuid,
+                    filter_material_id => $5::uuid,
+                    search_profile => $6,
+                    search_dimensions => $7,
+                    candidate_count => $8
+                )
+                """,
+                *params.values()
+            )
+    return [_record_to_dict(row) for row in rows]
+
+
+async def _match_duplicate_chunks(
+    query_embedding: List[float],
+    match_threshold: float,
+    match_count: int,
+    material_id: str
+) -> List[Dict]:
+    """A material's near-duplicate rows, scored by their canonical chunk's embedding"""
+    params = {
+        'query_embedding': query_embedding,
+        'match_threshold': match_threshold,
+        'match_count': match_count,
+        'filter_material_id': material_id
+    }
+    pool = get_db_pool()
+    if pool is None:
+        supabase = get_supabase_client()
+        result = await _run_supabase(lambda: supabase.rpc('match_material_duplicate_chunks', params).execute())
+        return result.data if result.data else []
+
+    async with pool.acquire(timeout=settings.DB_POOL_ACQUIRE_TIMEOUT) as conn:
+        rows = await conn.fetch(
+            """
+            SELECT * FROM match_material_duplicate_chunks(
+                query_embedding => $1,
+                match_threshold => $2,
+                match_count => $3,
+                filter_material_id => $4::uuid
+            )
+            """,
+            *params.values()
+        )
+    return [_record_to_dict(row) for row in rows]
+
+
+def _chunk_columns(chunk_records: List[Dict]) -> Tuple[str, ...]:
+    """MATERIAL_CHUNK_COLUMNS, plus canonical_chunk_id when the records carry it"""
+    if chunk_records and "canonical_chunk_id" in chunk_records[0]:
+        return MATERIAL_CHUNK_COLUMNS + ("canonical_chunk_id",)
+    return MATERIAL_CHUNK_COLUMNS
+
+
+async def insert_material_chunks(chunk_records: List[Dict], batch_size: int = 100) -> int:
+    """
+    Insert chunk rows (id, material_id, chunk_text, chunk_index, token_count,
+    embedding, metadata and optionally canonical_chunk_id) into material_chunks
+
+    With the pool all rows are written in a single transaction.
+    """
+    if not chunk_records:
+        return 0
+
+    pool = get_db_pool()
+    if pool is None:
+        supabase = get_supabase_client()
+        for i in range(0, len(chunk_records), batch_size):
+            batch = chunk_records[i:i + batch_size]
+            await _run_supabase(lambda: supabase.table("material_chunks").insert(batch).execute())
+        return len(chunk_records)
+
+    columns = _chunk_columns(chunk_records)
+    placeholders = ", ".join(
+        f"${i}::uuid" if column in ("id", "material_id", "canonical_chunk_id") else f"${i}"
+        for i, column in enumerate(columns, start=1)
+    )
+    async with pool.acquire(timeout=settings.DB_POOL_ACQUIRE_TIMEOUT) as conn:
+        async with conn.transaction():
+            await conn.executemany(
+                f"""
+                INSERT INTO material_chunks ({", ".join(columns)})
+                VALUES ({placeholders})
+                """,
+                [tuple(record[column] for column in columns) for record in chunk_records]
+            )
+    return len(chunk_records)
+
+
+# Column order of material_chunks rows written by MaterialChunkLoader
+MATERIAL_CHUNK_COLUMNS = ("id", "material_id", "chunk_text", "chunk_index", "token_count", "embedding", "metadata")
+
+
+class MaterialChunkLoader:
+    """
+    Bulk writer for the chunks of one material
+
+    Rows go in with binary COPY (copy_records_to_table; embeddings use
+    pgvector's binary codec instead of 1536 floats as JSON text) on one
+    pooled connection, inside one transaction for the whole material: a
+    failed run rolls back and leaves no partial chunks behind.
+
+    With replace=True the material's existing rows are deleted in the same
+    transaction, so a re-processed material switches from the old chunks
+    to the new ones at commit; readers never see a mix of both or a gap.
+
+    Usage:
+        async with MaterialChunkLoader(pool, material_id) as loader:
+            await loader.copy(records)
+    """
+
+    def __init__(self, pool: asyncpg.Pool, material_id: str, replace: bool = True):
+        self.pool = pool
+        self.material_id = material_id
+        self.replace = replace
+        self.replaced = 0
+        self.copied = 0
+        self._conn: Optional[asyncpg.Connection] = None
+        self._transaction = None
+
+    async def __aenter__(self) -> "MaterialChunkLoader":
+        self._conn = await self.pool.acquire(timeout=settings.DB_POOL_ACQUIRE_TIMEOUT)
+        try:
+            transaction = self._conn.transaction()
+            await transaction.start()
+            self._transaction = transaction
+            if self.replace:
+                status = await self._conn.execute(
+                    "DELETE FROM material_chunks WHERE material_id = $1::uuid",
+                    self.material_id
+                )
+                self.replaced = int(status.split()[-1])
+        except BaseException:
+            await self._release(commit=False)
+            raise
+        return self
+
+    async def copy(self, chunk_records: List[Dict]) -> int:
+        """COPY chunk rows (see insert_material_chunks), returns rows written"""
+        if not chunk_records:
+            return 0
+        columns = _chunk_columns(chunk_records)
+        await self._conn.copy_records_to_table(
+            "material_chunks",
+            records=[tuple(record[column] for column in columns) for record in chunk_records],
+            columns=columns,
+            timeout=settings.DB_COMMAND_TIMEOUT
+        )
+        self.copied += len(chunk_records)
+        return len(chunk_records)
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self._release(commit=exc_type is None)
+
+    async def _release(self, commit: bool) -> None:
+        try:
+            if self._transaction is not None:
+                if commit:
+                    await self._transaction.commit()
+                else:
+                    await self._transaction.rollback()
+        finally:
+            await self.pool.release(self._conn)
+            self._conn = None
+            self._transaction = None
+
+
+async def delete_material_chunk_rows(material_id: str) -> int:
+    """Delete all material_chunks rows of a material, returns rows deleted"""
+    pool = get_db_pool()
+    if pool is None:
+        supabase = get_supabase_client()
+        result = await _run_supabase(lambda: supabase.table("material_chunks").delete().eq(
+            "material_id", material_id
+        ).execute())
+        return len(result.data) if result.data else 0
+
+    async with pool.acquire(timeout=settings.DB_POOL_ACQUIRE_TIMEOUT) as conn:
+        status = await conn.execute(
+            "DELETE FROM material_chunks WHERE material_id = $1::uuid",
+            material_id
+        )
+    # status looks like "DELETE 42"
+    return int(status.split()[-1])
+
+
+async def copy_material_chunks(source_material_id: str, target_material_id: str, page_size: int = 500) -> List[Dict]:
+    """
+    Copy every chunk row (text, embedding, metadata) of a material to another
+
+    With the pool this is a single INSERT ... SELECT inside Postgres; the
+    REST fallback pages the rows through the API.
+
+    Returns:
+        The new rows (id, chunk_text, chunk_index, metadata and with
+        NEAR_DUP_ENABLED canonical_chunk_id), without embeddings
+    """
+    pool = get_db_pool()
+    if pool is None:
+        supabase = get_supabase_client()
+        copied = []
+        offset = 0
+        while True:
+            result = await _run_supabase(lambda: supabase.table("material_chunks").select(
+                "chunk_text, chunk_index, token_count, embedding, metadata"
+                + (", canonical_chunk_id" if settings.NEAR_DUP_ENABLED else "")
+            ).eq("material_id", source_material_id).order("chunk_index").range(
+                offset, offset + page_size - 1
+            ).execute())
+            rows = result.data or []
+            records = [
+                {**row, "id": str(uuid.uuid4()), "material_id": target_material_id}
+                for row in rows
+            ]
+            if records:
+                await _run_supabase(lambda: supabase.table("material_chunks").insert(records).execute())
+            copied.extend(
+                {
+                    key: record[key]
+                    for key in ("id", "chunk_text", "chunk_index", "metadata", "canonical_chunk_id")
+                    if key in record
+                }
+                for record in records
+            )
+            if len(rows) < page_size:
+                return copied
+            offset += page_size
+
+    # Near-duplicate rows stay linked to the same canonical chunk
+    linked = ", canonical_chunk_id" if settings.NEAR_DUP_ENABLED else ""
+    async with pool.acquire(timeout=settings.DB_POOL_ACQUIRE_TIMEOUT) as conn:
+        rows = await conn.fetch(
+            f"""
+            INSERT INTO material_chunks
+                (id, material_id, chunk_text, chunk_index, token_count, embedding, metadata{linked})
+            SELECT gen_random_uuid(), $2::uuid, chunk_text, chunk_index, token_count, embedding, metadata{linked}
+            FROM material_chunks
+            WHERE material_id = $1::uuid
+            RETURNING id::text AS id, chunk_text, chunk_index, metadata{linked}
+            """,
+            source_material_id,
+            target_material_id
+        )
+    return [_record_to_dict(row) for row in rows]
+
+
+async def fetch_material_chunk_rows(material_id: str, page_size: int = 500) -> List[Dict]:
+    """
+    Committed chunk rows of a material, without embeddings (id, chunk_text,
+    chunk_index, metadata and with NEAR_DUP_ENABLED canonical_chunk_id)
+    """
+    linked = ", canonical_chunk_id" if settings.NEAR_DUP_ENABLED else ""
+    pool = get_db_pool()
+    if pool is None:
+        supabase = get_supabase_client()
+        rows = []
+        offset = 0
+        while True:
+            result = await _run_supabase(lambda: supabase.table("material_chunks").select(
+                "id, chunk_text, chunk_index, metadata" + linked
+            ).eq("material_id", material_id).order("chunk_index").range(
+                offset, offset + page_size - 1
+            ).execute())
+            page = result.data or []
+            rows.extend(page)
+            if len(page) < page_size:
+                return rows
+            offset += page_size
+
+    async with pool.acquire(timeout=settings.DB_POOL_ACQUIRE_TIMEOUT) as conn:
+        rows = await conn.fetch(
+            f"""
+            SELECT id::text AS id, chunk_text, chunk_index, metadata{linked}
+            FROM material_chunks
+            WHERE material_id = $1::uuid
+            ORDER BY chunk_index
+            """,
+            material_id
+        )
+    return [_record_to_dict(row) for row in rows]
+
+
+def _parse_vector(value: Any) -> Optional[List[float]]:
+    """pgvector values arrive as numpy arrays (asyncpg) or "[...]" strings (PostgREST)"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return json.loads(value)
+    return list(value)
+
+
+async def fetch_chunk_embeddings(keys: List[Tuple[str, int]]) -> Dict[Tuple[str, int], List[float]]:
+    """
+    Fetch stored embeddings of chunks identified by (material_id, chunk_index)
+
+    Keys with no matching row are absent from the result. Near-duplicate
+    rows (NEAR_DUP_ENABLED) get the embedding of their canonical chunk.
+    """
+    if not keys:
+        return {}
+
+    material_ids = [material_id for material_id, _ in keys]
+    chunk_indices = [chunk_index for _, chunk_index in keys]
+
+    pool = get_db_pool()
+    if pool is None:
+        supabase = get_supabase_client()
+        # PostgREST has no tuple IN: filter both columns, drop the cross-product extras
+        result = await _run_supabase(
+            lambda: supabase.table("material_chunks").select(
+                "material_id, chunk_index, embedding"
+                + (", canonical_chunk_id" if settings.NEAR_DUP_ENABLED else "")
+            ).in_("material_id", list(set(material_ids))).in_(
+                "chunk_index", list(set(chunk_indices))
+            ).execute()
+        )
+        wanted = set(keys)
+        rows = [row for row in result.data or [] if (row["material_id"], row["chunk_index"]) in wanted]
+        linked = [row["canonical_chunk_id"] for row in rows if row.get("canonical_chunk_id")]
+        if linked:
+            canonical = await _run_supabase(
+                lambda: supabase.table("material_chunks").select("id, embedding").in_("id", linked).execute()
+            )
+            embeddings = {row["id"]: row["embedding"] for row in canonical.data or []}
+            for row in rows:
+                if row.get("canonical_chunk_id"):
+                    row["embedding"] = embeddings.get(row["canonical_chunk_id"])
+        return {
+            (row["material_id"], row["chunk_index"]): _parse_vector(row["embedding"])
+            for row in rows
+        }
+
+    # Near-duplicate rows have no embedding of their own
+    embedding = "COALESCE(c.embedding, canonical.embedding)" if settings.NEAR_DUP_ENABLED else "c.embedding"
+    canonical_join = (
+        "LEFT JOIN material_chunks canonical ON canonical.id = c.canonical_chunk_id"
+        if settings.NEAR_DUP_ENABLED else ""
+    )
+    async with pool.acquire(timeout=settings.DB_POOL_ACQUIRE_TIMEOUT) as conn:
+        rows = await conn.fetch(
+            f"""
+            SELECT c.material_id, c.chunk_index, {embedding} AS embedding
+            FROM material_chunks c
+            JOIN unnest($1::uuid[], $2::int[]) AS k(material_id, chunk_index)
+              ON c.material_id = k.material_id AND c.chunk_index = k.chunk_index
+            {canonical_join}
+            """,
+            material_ids,
+            chunk_indices
+        )
+    return {
+        (str(row["material_id"]), row["chunk_index"]): _parse_vector(row["embedding"])
+        for row in rows
+    }
+
+
+async def fetch_material(material_id: str, columns: str = "*") -> Optional[Dict]:
+    """
+    Fetch a single material row
+
+    Args:
+        material_id: UUID of the material
+        columns: Comma-separated column list (trusted, never user input)
+    """
+    pool = get_db_pool()
+    if pool is None:
+        supabase = get_supabase_client()
+        result = await _run_supabase(
+            lambda: supabase.table("materials").select(columns).eq("id", material_id).execute()
+        )
+        return result.data[0] if result.data else None
+
+    async with pool.acquire(timeout=settings.DB_POOL_ACQUIRE_TIMEOUT) as conn:
+        row = await conn.fetchrow(
+            f"SELECT {columns} FROM materials WHERE id = $1::uuid",
+            material_id
+        )
+    return _record_to_dict(row) if row else None
+
+
+async def find_processed_material_by_hash(content_hash: str, columns: str = "*") -> Optional[Dict]:
+    """
+    Most recently processed material whose PDF has this SHA-256
+
+    Args:
+        content_hash: Hex SHA-256 of the uploaded file
+        columns: Comma-separated column list (trusted, never user input)
+    """
+    pool = get_db_pool()
+    if pool is None:
+        supabase = get_supabase_client()
+        result = await _run_supabase(
+            lambda: supabase.table("materials").select(columns).eq(
+                "content_hash", content_hash
+            ).eq("processing_status", "completed").order(
+                "processed_at", desc=True
+            ).limit(1).execute()
+        )
+        return result.data[0] if result.data else None
+
+    async with pool.acquire(timeout=settings.DB_POOL_ACQUIRE_TIMEOUT) as conn:
+        row = await conn.fetchrow(
+            f"SELECT {columns} FROM materials "
+            "WHERE content_hash = $1 AND processing_status = 'completed' "
+            "ORDER BY processed_at DESC LIMIT 1",
+            content_hash
+        )
+    return _record_to_dict(row) if row else None
+
+
+async def fetch_materials_by_status(statuses: List[str], columns: str = "*") -> List[Dict]:
+    """
+    Materials whose processing_status is one of `statuses`
+
+    Args:
+        statuses: e.g. ["failed", "processing"]
+        columns: Comma-separated column list (trusted, never user input)
+    """
+    pool = get_db_pool()
+    if pool is None:
+        supabase = get_supabase_client()
+        result = await _run_supabase(
+            lambda: supabase.table("materials").select(columns).in_(
+                "processing_status", statuses
+            ).execute()
+        )
+        return result.data or []
+
+    async with pool.acquire(timeout=settings.DB_POOL_ACQUIRE_TIMEOUT) as conn:
+        rows = await conn.fetch(
+            f"SELECT {columns} FROM materials WHERE processing_status = ANY($1::text[])",
+            statuses
+        )
+    return [_record_to_dict(row) for row in rows]
+
+
+async def material_file_in_use(file_url: str, exclude_material_id: str) -> bool:
+    """Whether another material points at the same stored file (deduplicated uploads)"""
+    pool = get_db_pool()
+    if pool is None:
+        supabase = get_supabase_client()
+        result = await _run_supabase(
+            lambda: supabase.table("materials").select("id").eq(
+                "file_url", file_url
+            ).neq("id", exclude_material_id).limit(1).execute()
+        )
+        return bool(result.data)
+
+    async with pool.acquire(timeout=settings.DB_POOL_ACQUIRE_TIMEOUT) as conn:
+        return await conn.fetchval(
+            "SELECT EXISTS (SELECT 1 FROM materials WHERE file_url = $1 AND id <> $2::uuid)",
+            file_url,
+            exclude_material_id
+        )
+
+
+async def fetch_material_info(material_id: str) -> Optional[Dict]:
+    """
+    Material fields denormalized into search results: course_id,
+    material_title, author, course_code, course_name
+    """
+    pool = get_db_pool()
+    if pool is None:
+        supabase = get_supabase_client()
+        result = await _run_supabase(
+            lambda: supabase.table("materials").select(
+                "course_id, title, author, courses(code, name)"
+            ).eq("id", material_id).execute()
+        )
+        if not result.data:
+            return None
+        row = result.data[0]
+        course = row.get("courses") or {}
+        return {
+            "course_id": row.get("course_id"),
+            "material_title": row.get("title"),
+            "author": row.get("author"),
+            "course_code": course.get("code"),
+            "course_name": course.get("name")
+        }
+
+    async with pool.acquire(timeout=settings.DB_POOL_ACQUIRE_TIMEOUT) as conn:
+        row = await conn.fetchrow(
+            """
+            SELECT m.course_id, m.title AS material_title, m.author,
+                   c.code AS course_code, c.name AS course_name
+            FROM materials m
+            LEFT JOIN courses c ON c.id = m.course_id
+            WHERE m.id = $1::uuid
+            """,
+            material_id
+        )
+    return _record_to_dict(row) if row else None
+
+
+async def update_material(material_id: str, fields: Dict) -> None:
+    """
+    Update columns of a material row
+
+    The literal string "now()" is translated to NOW() on the pool path so
+    callers can keep using the PostgREST idiom.
+    """
+    if not fields:
+        return
+
+    pool = get_db_pool()
+    if pool is None:
+        supabase = get_supabase_client()
+        await _run_supabase(
+            lambda: supabase.table("materials").update(fields).eq("id", material_id).execute()
+        )
+        return
+
+    assignments = []
+    values = []
+    for column, value in fields.items():
+        if value == "now()":
+            assignments.append(f"{column} = NOW()")
+        else:
+            values.append(value)
+            assignments.append(f"{column} = ${len(values)}")
+    values.append(material_id)
+
+    async with pool.acquire(timeout=settings.DB_POOL_ACQUIRE_TIMEOUT) as conn:
+        await conn.execute(
+            f"UPDATE materials SET {', '.join(assignments)} WHERE id = ${len(values)}::uuid",
+            *values
+        )
+
+
+async def fetch_material_evaluations(material_id: str, columns: str = "*") -> List[Dict]:
+    """Fetch evaluations of a material, oldest first"""
+    pool = get_db_pool()
+    if pool is None:
+        supabase = get_supabase_client()
+        result = await _run_supabase(
+            lambda: supabase.table("material_evaluations").select(columns).eq(
+                "material_id", material_id
+            ).order("created_at").execute()
+        )
+        return result.data or []
+
+    async with pool.acquire(timeout=settings.DB_POOL_ACQUIRE_TIMEOUT) as conn:
+        rows = await conn.fetch(
+            f"SELECT {columns} FROM material_evaluations "
+            "WHERE material_id = $1::uuid ORDER BY created_at",
+            material_id
+        )
+    return [_record_to_dict(row) for row in rows]
+
+
+async def insert_material_evaluation(fields: Dict) -> Optional[Dict]:
+    """
+    Insert an evaluation row
+
+    Args:
+        fields: Column values (column names are trusted, never user input)
+
+    Returns:
+        The inserted row, or None if nothing was inserted
+    """
+    pool = get_db_pool()
+    if pool is None:
+        supabase = get_supabase_client()
+        result = await _run_supabase(
+            lambda: supabase.table("material_evaluations").insert(fields).execute()
+        )
+        return result.data[0] if result.data else None
+
+    columns = list(fields)
+    placeholders = ", ".join(f"${i}" for i in range(1, len(columns) + 1))
+    async with pool.acquire(timeout=settings.DB_POOL_ACQUIRE_TIMEOUT) as conn:
+        row = await conn.fetchrow(
+            f"INSERT INTO material_evaluations ({', '.join(columns)}) "
+            f"VALUES ({placeholders}) RETURNING *",
+            *fields.values()
+        )
+    return _record_to_dict(row) if row else None
+
+
+async def delete_material_evaluation(evaluation_id: str) -> Optional[str]:
+    """
+    Delete an evaluation
+
+    Returns:
+        material_id of the deleted evaluation, or None if it did not exist
+    """
+    pool = get_db_pool()
+    if pool is None:
+        supabase = get_supabase_client()
+        result = await _run_supabase(
+            lambda: supabase.table("material_evaluations").delete().eq("id", evaluation_id).execute()
+        )
+        return result.data[0]["material_id"] if result.data else None
+
+    async with pool.acquire(timeout=settings.DB_POOL_ACQUIRE_TIMEOUT) as conn:
+        material_id = await conn.fetchval(
+            "DELETE FROM material_evaluations WHERE id = $1::uuid RETURNING material_id",
+            evaluation_id
+        )
+    return _to_jsonable(material_id) if material_id is not None else None
@@ -7,10 +7,18 @@ from fastapi import APIRouter, HTTPException, Response
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict
 from decimal import Decimal
+import asyncio
 import logging
 from datetime import datetime
 
-from app.core.database import get_supabase_client
+from app.core.database import (
+    get_supabase_client,
+    delete_material_evaluation,
+    fetch_material,
+    fetch_material_evaluations,
+    insert_material_evaluation,
+    update_material
+)
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -99,7 +107,7 @@ async def get_pending_materials(
             {'limit_count': limit}
         )
         
-        result = query.execute()
+        result = await asyncio.to_thread(query.execute)
         
         # Filtrar por curso si se especifica
         materials = result.data
@@ -129,21 +137,19 @@ async def create_evaluation(evaluation: EvaluationCreate):
         Evaluación creada
     """
     try:
-        supabase = get_supabase_client()
-        
         # Verificar que el material existe
-        material_check = supabase.table("materials").select("id, title").eq("id", evaluation.material_id).execute()
+        material_check = await fetch_material(evaluation.material_id, "id, title")
         
-        if not material_check.data:
+        if not material_check:
             raise HTTPException(
                 status_code=404,
                 detail=f"Material with ID {evaluation.material_id} not found"
             )
         
         # Verificar si ya tiene evaluación (opcional: permitir re-evaluación)
-        existing = supabase.table("material_evaluations").select("id").eq("material_id", evaluation.material_id).execute()
+        existing = await fetch_material_evaluations(evaluation.material_id, "id")
         
-        if existing.data:
+        if existing:
             logger.warning(f"Material {evaluation.material_id} already has an evaluation. Creating new one.")
         
         # Crear evaluación
@@ -161,19 +167,19 @@ async def create_evaluation(evaluation: EvaluationCreate):
             "ocr_confidence": float(evaluation.ocr_confidence) if evaluation.ocr_confidence else None
         }
         
-        result = supabase.table("material_evaluations").insert(evaluation_data).execute()
+        created = await insert_material_evaluation(evaluation_data)
         
-        if not result.data:
+        if not created:
             raise HTTPException(status_code=500, detail="Failed to create evaluation")
         
         # Actualizar status del material
-        supabase.table("materials").update({
+        await update_material(evaluation.material_id, {
             "evaluation_status": "evaluated"
-        }).eq("id", evaluation.material_id).execute()
+        })
         
         logger.info(f"Created evaluation for material {evaluation.material_id} with score {evaluation.score}")
         
-        return result.data[0]
+        return created
         
     except HTTPException:
         raise
@@ -197,18 +203,16 @@ async def get_material_evaluation(material_id: str):
         Evaluación del material
     """
     try:
-        supabase = get_supabase_client()
-        
-        result = supabase.table("material_evaluations").select("*").eq("material_id", material_id).execute()
+        evaluations = await fetch_material_evaluations(material_id)
         
-        if not result.data:
+        if not evaluations:
             raise HTTPException(
                 status_code=404,
                 detail=f"No evaluation found for material {material_id}"
             )
         
         # Retornar la evaluación más reciente si hay múltiples
-        return result.data[-1] if isinstance(result.data, list) else result.data
+        return evaluations[-1]
         
     except HTTPException:
         raise
@@ -231,7 +235,7 @@ async def get_evaluation_statistics():
     try:
         supabase = get_supabase_client()
         
-        result = supabase.rpc('get_evaluation_stats').execute()
+        result = await asyncio.to_thread(supabase.rpc('get_evaluation_stats').execute)
         
         if not result.data:
             # Retornar estadísticas vacías si no hay datos
@@ -263,26 +267,19 @@ async def delete_evaluation(evaluation_id: str):
         evaluation_id: ID de la evaluación a eliminar
     """
     try:
-        supabase = get_supabase_client()
-        
-        # Obtener material_id antes de eliminar
-        eval_data = supabase.table("material_evaluations").select("material_id").eq("id", evaluation_id).execute()
+        # Eliminar evaluación (devuelve su material_id)
+        material_id = await delete_material_evaluation(evaluation_id)
         
-        if not eval_data.data:
+        if not material_id:
             raise HTTPException(
                 status_code=404,
                 detail=f"Evaluation {evaluation_id} not found"
             )
         
-        material_id = eval_data.data[0]["material_id"]
-        
-        # Eliminar evaluación
-        supabase.table("material_evaluations").delete().eq("id", evaluation_id).execute()
-        
         # Actualizar status del material a pending
-        supabase.table("materials").update({
+        await update_material(material_id, {
             "evaluation_status": "pending"
-        }).eq("id", material_id).execute()
+        })
         
         logger.info(f"Deleted evaluation {evaluation_id} for material {material_id}")
         
@@ -2,21 +2,41 @@
 Materials Router - Manage course materials with PDF upload support
 """
 
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, BackgroundTasks
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import json
 import logging
-import tempfile
 import os
 import uuid
 
-from app.core.database import get_supabase_client
-from app.services.pdf_processor import process_pdf_file, delete_material_chunks
-from app.services.storage import upload_pdf_to_storage, delete_pdf_from_storage
+from app.core.config import settings
+from app.core.database import (
+    get_supabase_client,
+    fetch_material,
+    update_material,
+    find_processed_material_by_hash,
+    material_file_in_use
+)
+from app.services.pdf_processor import delete_material_chunks, link_duplicate_material
+from app.services.ingestion_worker import cancel_pdf_processing, enqueue_pdf_processing, spool_path
+from app.services.job_queue import PROCESS_PDF, job_queue
+from app.services.progress_store import FINAL_STAGES, progress_store
+from app.services.storage import material_storage_path, delete_pdf_from_storage
+from app.services.answer_cache import invalidate_answer_cache
+from app.services.bm25_index import bm25_index
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024  # 50MB
+UPLOAD_READ_BLOCK_BYTES = 1024 * 1024
+PROGRESS_POLL_SECONDS = 0.5
+PROGRESS_KEEPALIVE_SECONDS = 15.0
+
 
 class MaterialCreate(BaseModel):
     """Material creation model"""
@@ -28,43 +48,52 @@ class MaterialCreate(BaseModel):
     raw_text: Optional[str] = None
 
 
-async def process_pdf_background(file_path: str, material_id: str, storage_path: str):
-    """Background task to process PDF after upload"""
+async def spool_upload(file: UploadFile, path: str, max_size: int = MAX_UPLOAD_BYTES) -> Tuple[int, str]:
+    """
+    Stream an uploaded file to disk block by block, hashing it on the way
+    
+    Only one block is held in memory; the file is removed if it is too large.
+    
+    Returns:
+        Tuple of (size in bytes, hex SHA-256)
+    """
+    digest = hashlib.sha256()
+    size = 0
     try:
-        logger.info(f"Starting background PDF processing for material {material_id}")
-        
-        # Process PDF: extract, chunk, embed, store
-        result = await process_pdf_file(file_path, material_id)
-        
-        logger.info(f"PDF processing completed: {result['chunks_created']} chunks created")
-        
-        # Update material with storage path
-        supabase = get_supabase_client()
-        supabase.table("materials").update({
-            "file_url": storage_path
-        }).eq("id", material_id).execute()
-        
-    except Exception as e:
-        logger.error(f"Background PDF processing failed: {str(e)}")
-    finally:
-        # Clean up temporary file
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        with open(path, "wb") as spooled:
+            while block := await file.read(UPLOAD_READ_BLOCK_BYTES):
+                size += len(block)
+                if size > max_size:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"File too large. Maximum size is {max_size // 1024 // 1024}MB"
+                    )
+                digest.update(block)
+                await asyncio.to_thread(spooled.write, block)
+    except BaseException:
+        os.remove(path)
+        raise
+    return size, digest.hexdigest()
+
+
+def _discard_spooled(path: str) -> None:
+    if os.path.exists(path):
+        os.remove(path)
 
 
 @router.post("/upload-pdf", response_model=dict)
 async def upload_pdf_material(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     title: str = Form(...),
     course_id: str = Form(...),
-    author: Optional[str] = Form(None)
+    author: Optional[str] = Form(None),
+    reuse_duplicate: bool = Form(True)
 ):
     """
     Upload a PDF material and process it automatically
     
     Steps:
-    1. Validate PDF file
+    1. Validate PDF file (streamed to a spool file, SHA-256 computed while reading)
     2. Create material record
     3. Upload PDF to Supabase Storage
     4. Extract text from PDF
@@ -72,8 +101,16 @@ async def upload_pdf_material(
     6. Generate embeddings
     7. Store chunks in database
     
-    Processing happens in background, returns immediately
+    Steps 3-7 run in an ingestion worker from the spooled file (the storage
+    upload concurrently with the extraction) through a durable, retried job,
+    so this returns as soon as the material record exists. When the same
+    file was already processed (same SHA-256) and `reuse_duplicate` is set,
+    steps 3-7 are skipped: the material shares the stored file and gets a
+    copy of the existing chunks and embeddings.
     """
+    material_id = str(uuid.uuid4())
+    file_path = spool_path(material_id)
+    queued = False
     try:
         # Validate file type
         if not file.filename.lower().endswith('.pdf'):
@@ -82,23 +119,20 @@ async def upload_pdf_material(
         if not file.content_type == 'application/pdf':
             raise HTTPException(status_code=400, detail="Invalid file type")
         
-        # Read file content
-        file_content = await file.read()
-        
-        # Validate file size (max 50MB)
-        max_size = 50 * 1024 * 1024  # 50MB in bytes
-        if len(file_content) > max_size:
-            raise HTTPException(
-                status_code=400,
-                detail=f"File too large. Maximum size is 50MB, got {len(file_content) / 1024 / 1024:.2f}MB"
-            )
+        # Stream the file to the spool (max 50MB), hashing it on the way
+        file_size, content_hash = await spool_upload(file, file_path)
         
-        if len(file_content) == 0:
+        if file_size == 0:
             raise HTTPException(status_code=400, detail="Empty file")
         
+        duplicate_of = None
+        if settings.UPLOAD_DEDUP_ENABLED and reuse_duplicate:
+            duplicate_of = await find_processed_material_by_hash(content_hash)
+            if duplicate_of and not duplicate_of.get("file_url"):
+                duplicate_of = None
+        
         # Create material record
         supabase = get_supabase_client()
-        material_id = str(uuid.uuid4())
         
         material_data = {
             "id": material_id,
@@ -106,39 +140,53 @@ async def upload_pdf_material(
             "course_id": course_id,
             "mime_type": "application/pdf",
             "author": author,
-            "processing_status": "pending",
+            "processing_status": "processing" if duplicate_of else "pending",
             "chunks_count": 0
         }
+        if settings.UPLOAD_DEDUP_ENABLED:
+            material_data["content_hash"] = content_hash
+        if duplicate_of:
+            material_data["file_url"] = duplicate_of["file_url"]
         
-        result = supabase.table("materials").insert(material_data).execute()
+        result = await asyncio.to_thread(supabase.table("materials").insert(material_data).execute)
         
         if not result.data:
             raise HTTPException(status_code=400, detail="Failed to create material record")
         
-        # Upload to Supabase Storage
-        storage_path = await upload_pdf_to_storage(file_content, file.filename, material_id)
-        
-        # Save to temporary file for processing
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        temp_file.write(file_content)
-        temp_file.close()
+        if duplicate_of:
+            try:
+                summary = await link_duplicate_material(material_id, duplicate_of)
+                logger.info(
+                    f"PDF deduplicated: {title} (material_id: {material_id}, "
+                    f"source: {duplicate_of['id']}, {summary['chunks_created']} chunks reused)"
+                )
+                return {
+                    "message": "PDF already processed. Reused its chunks and embeddings.",
+                    "material_id": material_id,
+                    "title": title,
+                    "file_size_mb": round(file_size / 1024 / 1024, 2),
+                    "status": "completed",
+                    "deduplicated_from": duplicate_of["id"]
+                }
+            except Exception as e:
+                # Fall back to a regular upload and processing
+                logger.warning(f"Could not reuse material {duplicate_of['id']}, processing again: {e}")
+                await update_material(material_id, {"processing_status": "pending", "file_url": None})
         
-        # Schedule background processing
-        background_tasks.add_task(
-            process_pdf_background,
-            temp_file.name,
-            material_id,
-            storage_path
-        )
+        # The worker uploads the spooled file to storage while processing it
+        storage_path = material_storage_path(file.filename, material_id)
+        job_id = await asyncio.to_thread(enqueue_pdf_processing, material_id, storage_path, file_path)
+        queued = True
         
-        logger.info(f"PDF uploaded successfully: {title} (material_id: {material_id})")
+        logger.info(f"PDF uploaded successfully: {title} (material_id: {material_id}, job: {job_id})")
         
         return {
-            "message": "PDF uploaded successfully. Processing in background...",
+            "message": "PDF uploaded successfully. Storage upload and processing queued...",
             "material_id": material_id,
             "title": title,
-            "file_size_mb": round(len(file_content) / 1024 / 1024, 2),
-            "status": "processing"
+            "file_size_mb": round(file_size / 1024 / 1024, 2),
+            "status": "pending",
+            "job_id": job_id
         }
         
     except HTTPException:
@@ -146,6 +194,9 @@ async def upload_pdf_material(
     except Exception as e:
         logger.error(f"Error uploading PDF: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    finally:
+        if not queued:
+            _discard_spooled(file_path)
 
 
 @router.post("/", response_model=dict)
@@ -181,11 +232,10 @@ async def get_materials():
 async def get_material(material_id: str):
     """Get a specific material with processing status"""
     try:
-        supabase = get_supabase_client()
-        result = supabase.table("materials").select("*").eq("id", material_id).execute()
+        material = await fetch_material(material_id)
         
-        if result.data:
-            return result.data[0]
+        if material:
+            return material
         else:
             raise HTTPException(status_code=404, detail="Material not found")
     except HTTPException:
@@ -195,6 +245,91 @@ async def get_material(material_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def format_sse(event: str, data: dict) -> str:
+    """Encode one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def status_progress(material: Dict) -> Dict:
+    """Progress derived from the material row when no run was recorded"""
+    stage = {"pending": "queued"}.get(material.get("processing_status"), material.get("processing_status"))
+    return {
+        "material_id": material["id"],
+        "stage": stage,
+        "chunks_stored": material.get("chunks_count") or 0,
+        "percent": 100.0 if stage == "completed" else None,
+        "eta_seconds": 0.0 if stage == "completed" else None
+    }
+
+
+def _progress_finished(progress: Dict) -> bool:
+    if progress["stage"] == "completed":
+        return True
+    if progress["stage"] != "failed":
+        return False
+    # A failed attempt with a retry pending is not the end of the run
+    return job_queue.find_active(PROCESS_PDF, "material_id", progress["material_id"]) is None
+
+
+async def stream_progress_events(material_id: str, request: Request) -> AsyncIterator[str]:
+    """
+    SSE event stream for /{material_id}/progress
+    
+    Emits a `progress` event whenever the published record changes and
+    closes after the run completes or fails for good. A comment line is
+    sent periodically so proxies keep the connection open.
+    """
+    last_version = None
+    last_sent = asyncio.get_running_loop().time()
+    while not await request.is_disconnected():
+        progress = await asyncio.to_thread(progress_store.get, material_id) if progress_store else None
+        if progress is None:
+            material = await fetch_material(material_id, "id, processing_status, chunks_count")
+            if material is None:
+                yield format_sse("error", {"detail": "Material not found"})
+                return
+            progress = status_progress(material)
+            if progress["stage"] in FINAL_STAGES:
+                yield format_sse("progress", progress)
+                return
+        
+        now = asyncio.get_running_loop().time()
+        version = progress.get("updated_at") or (progress["stage"], progress["chunks_stored"])
+        if version != last_version:
+            last_version = version
+            last_sent = now
+            yield format_sse("progress", progress)
+            if progress["stage"] in FINAL_STAGES and await asyncio.to_thread(_progress_finished, progress):
+                return
+        elif now - last_sent >= PROGRESS_KEEPALIVE_SECONDS:
+            last_sent = now
+            yield ": keep-alive\n\n"
+        
+        await asyncio.sleep(PROGRESS_POLL_SECONDS)
+
+
+@router.get("/{material_id}/progress")
+async def material_progress(material_id: str, request: Request):
+    """
+    Stream ingestion progress of a material as Server-Sent Events
+    
+    Each `progress` event carries the stage (queued, extracting, embedding,
+    completed, failed), pages extracted/OCR'd, chunks created/embedded/stored,
+    percent and ETA. Progress is read from the local progress store, so
+    clients do not have to poll the materials table.
+    """
+    if progress_store is None or await asyncio.to_thread(progress_store.get, material_id) is None:
+        material = await fetch_material(material_id, "id")
+        if material is None:
+            raise HTTPException(status_code=404, detail="Material not found")
+    
+    return StreamingResponse(
+        stream_progress_events(material_id, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.delete("/{material_id}", response_model=dict)
 async def delete_material(material_id: str):
     """Delete a material and all its chunks"""
@@ -202,21 +337,28 @@ async def delete_material(material_id: str):
         supabase = get_supabase_client()
         
         # Get material to find storage path
-        material_result = supabase.table("materials").select("*").eq("id", material_id).execute()
+        material = await fetch_material(material_id, "id, course_id, file_url")
         
-        if not material_result.data:
+        if not material:
             raise HTTPException(status_code=404, detail="Material not found")
         
-        material = material_result.data[0]
+        # Stop its processing job, which would keep writing chunks
+        cancelled = await cancel_pdf_processing(material_id)
+        if cancelled:
+            logger.info(f"Cancelled processing jobs {cancelled} of material {material_id}")
         
-        # Delete chunks (CASCADE should handle this, but being explicit)
+        # Delete chunks (CASCADE should handle this, but being explicit);
+        # this also drops them from the BM25 and near-duplicate indexes
         try:
             await delete_material_chunks(material_id)
         except Exception as e:
             logger.warning(f"Error deleting chunks: {e}")
+            if bm25_index is not None:
+                # The rows go with the material (CASCADE); the postings must too
+                await asyncio.to_thread(bm25_index.remove_material, material_id)
         
-        # Delete from storage if exists
-        if material.get("file_url"):
+        # Delete from storage if exists (and no deduplicated copy shares it)
+        if material.get("file_url") and not await material_file_in_use(material["file_url"], material_id):
             try:
                 await delete_pdf_from_storage(material["file_url"])
             except Exception as e:
@@ -224,6 +366,7 @@ async def delete_material(material_id: str):
         
         # Delete material record
         supabase.table("materials").delete().eq("id", material_id).execute()
+        await asyncio.to_thread(invalidate_answer_cache, material.get("course_id"), material_id)
         
         logger.info(f"Material deleted: {material_id}")
         return {"message": "Material deleted successfully"}
@@ -7,16 +7,13 @@ from pydantic import BaseModel
 from typing import Optional
 from ..core.database import get_supabase_client
 from ..core.config import Settings
+from ..services.llm_gateway import LLMGatewayError, llm_gateway
 import logging
-import openai
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 settings = Settings()
 
-# Configure OpenAI
-openai.api_key = settings.OPENAI_API_KEY
-
 
 class QueryRequest(BaseModel):
     """Query request model"""
@@ -114,18 +111,16 @@ CONTEXTO DE LOS MATERIALES:
             # Call OpenAI API
             logger.info(f"Calling OpenAI API with model: {settings.OPENAI_MODEL}")
             
-            response = openai.chat.completions.create(
-                model=settings.OPENAI_MODEL,
-                messages=[
+            ai_answer = await llm_gateway.chat(
+                [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": request.question}
                 ],
+                model=settings.OPENAI_MODEL,
                 temperature=0.7,
                 max_tokens=800,
                 top_p=0.9
             )
-            
-            ai_answer = response.choices[0].message.content
             logger.info(f"OpenAI response received: {len(ai_answer)} characters")
             
             return {
@@ -134,7 +129,7 @@ CONTEXTO DE LOS MATERIALES:
                 "context": f"✨ Respuesta generada por IA • Consultados {len(materials)} materiales • {len(combined_text)} caracteres de contexto"
             }
             
-        except openai.OpenAIError as e:
+        except LLMGatewayError as e:
             logger.error(f"OpenAI API error: {e}")
             # Fallback to keyword search if OpenAI fails
             return await fallback_keyword_search(request.question, combined_text, sources, len(materials))
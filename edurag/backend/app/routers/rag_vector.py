@@ -2,21 +2,54 @@
 RAG Router - Retrieval Augmented Generation with Vector Search
 """
 
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import Optional, List
-from openai import AsyncOpenAI
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import AsyncIterator, Optional, List, Tuple
+import asyncio
+import json
 import logging
 
-from app.core.database import get_supabase_client
+from app.core.database import get_supabase_client, match_material_chunks
 from app.core.config import settings
-from app.services.pdf_processor import generate_embeddings
+from app.services.pdf_processor import generate_embeddings, embedding_batcher, embedding_dispatcher
+from app.services.embedding_cache import embedding_cache
+from app.services.answer_cache import answer_cache
+from app.services.job_queue import job_queue
+from app.services.cpu_pool import cpu_pool_stats
+from app.services.ocr_service import ocr_stats
+from app.services.local_retriever import get_local_retriever
+from app.services.bm25_index import bm25_index, reciprocal_rank_fusion
+from app.services.near_duplicates import near_duplicate_index
+from app.services.context_builder import build_context
+from app.services.reranker import rerank_chunks
+from app.services.llm_gateway import CHAT, CircuitOpenError, llm_gateway
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+# Completion parameters shared by /query and /query/stream
+ANSWER_TEMPERATURE = 0.3  # Lower temperature for more focused answers
+ANSWER_MAX_TOKENS = 1000
+
+# Prefix of answers produced when the completion fails (never cached)
+ANSWER_ERROR_PREFIX = "❌ Error al generar respuesta"
+
+# Degraded mode (LLM circuit open): show the best chunks instead of an answer
+DEGRADED_ANSWER_HEADER = (
+    "⚠️ El servicio de IA no está disponible en este momento. "
+    "Estos son los fragmentos más relevantes de tus materiales:"
+)
+DEGRADED_ANSWER_CHUNKS = 3
+DEGRADED_EXCERPT_CHARS = 600
+
+NO_RELEVANT_CHUNKS_ANSWER = (
+    "❌ No encontré información relevante para responder tu pregunta.\n\n"
+    "💡 Consejos:\n"
+    "• Verifica que hay materiales subidos en el curso seleccionado\n"
+    "• Intenta reformular tu pregunta de manera más específica\n"
+    "• Asegúrate de que los PDFs contienen información sobre el tema"
+)
 
 
 class QueryRequest(BaseModel):
@@ -25,113 +58,269 @@ class QueryRequest(BaseModel):
     course_id: Optional[str] = None
     material_id: Optional[str] = None
     top_k: int = 5  # Number of chunks to retrieve
+    # Re-ranking overrides (None = server defaults)
+    diversity: Optional[float] = Field(None, ge=0, le=1)
+    fetch_k: Optional[int] = Field(None, ge=1, le=200)
+
+
+def uses_answer_cache(request: QueryRequest, question_embedding: Optional[List[float]]) -> bool:
+    """Answers are cached only for requests with the default re-ranking settings"""
+    return (
+        answer_cache is not None
+        and question_embedding is not None
+        and request.diversity is None
+        and request.fetch_k is None
+    )
+
+
+async def embed_question(question: str) -> List[float]:
+    """Embed a user question (cache keyed on the normalized question)"""
+    question_embeddings = await generate_embeddings([question], normalize_keys=True)
+    return question_embeddings[0]
+
+
+async def embed_question_within_deadline(question: str) -> Optional[List[float]]:
+    """
+    Embed the question, giving up after RAG_EMBEDDING_DEADLINE_SECONDS
+    
+    Returns None on timeout or error so the caller can answer from BM25
+    alone. A timed-out embedding keeps running in the background and lands
+    in the embedding cache for the next identical question. Without the
+    BM25 index there is nothing to degrade to, so no deadline is applied.
+    """
+    task = asyncio.ensure_future(embed_question(question))
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    deadline = settings.RAG_EMBEDDING_DEADLINE_SECONDS if bm25_index is not None else None
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), timeout=deadline)
+    except asyncio.TimeoutError:
+        logger.warning(f"Question embedding exceeded {deadline}s, using keyword search only")
+        return None
+    except Exception as e:
+        logger.error(f"Error embedding question: {str(e)}")
+        return None
+
+
+async def vector_search(
+    question_embedding: List[float],
+    course_id: Optional[str],
+    material_id: Optional[str],
+    top_k: int
+) -> List[dict]:
+    """
+    Vector search: local index when RAG_RETRIEVER=local, otherwise
+    match_material_chunks (asyncpg pool, Supabase RPC as fallback)
+    """
+    local_retriever = get_local_retriever()
+    search = local_retriever.search if local_retriever else match_material_chunks
+    # Lower threshold to 0.3 for better results
+    return await search(
+        query_embedding=question_embedding,
+        match_threshold=0.3,  # Lowered from 0.7 to get more results
+        match_count=top_k,
+        course_id=course_id,
+        material_id=material_id
+    )
+
+
+def resolve_fetch_k(top_k: int, hybrid: bool, rerank: bool, fetch_k: Optional[int] = None) -> int:
+    """Candidates fetched per retrieval leg (default top_k * RAG_FETCH_K_MULTIPLIER when re-ranking)"""
+    if fetch_k is None:
+        if rerank:
+            fetch_k = top_k * settings.RAG_FETCH_K_MULTIPLIER
+        else:
+            fetch_k = top_k * 2 if hybrid else top_k
+    return max(fetch_k, top_k)
+
+
+def start_keyword_search(
+    question: str,
+    course_id: Optional[str],
+    material_id: Optional[str],
+    top_k: int,
+    fetch_k: Optional[int] = None
+) -> Optional[asyncio.Task]:
+    """
+    Start the BM25 leg in the background (None without the BM25 index)
+    
+    Started before the question embedding is awaited, so both overlap;
+    it fetches as many candidates as a hybrid, re-ranked retrieval needs.
+    """
+    if bm25_index is None:
+        return None
+    fetch_k = resolve_fetch_k(top_k, True, settings.RAG_RERANK_ENABLED, fetch_k)
+    task = asyncio.create_task(
+        asyncio.to_thread(bm25_index.search, question, fetch_k, course_id, material_id)
+    )
+    # Not awaited when the answer cache hits
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return task
+
+
+def retrieval_mode(question_embedding: Optional[List[float]]) -> str:
+    """How chunks are retrieved for a request: hybrid, vector or keyword"""
+    if question_embedding is None:
+        return "keyword" if bm25_index is not None else "none"
+    return "hybrid" if bm25_index is not None else "vector"
+
+
+async def retrieve_chunks(
+    question: str,
+    question_embedding: Optional[List[float]],
+    course_id: Optional[str] = None,
+    material_id: Optional[str] = None,
+    top_k: int = 5,
+    diversity: Optional[float] = None,
+    fetch_k: Optional[int] = None,
+    keyword_task: Optional[asyncio.Task] = None
+) -> Tuple[List[dict], dict]:
+    """
+    Run BM25 and vector search concurrently, fuse them with RRF and re-rank
+    
+    Both legs over-fetch `fetch_k` candidates (default top_k *
+    RAG_FETCH_K_MULTIPLIER) and MMR keeps top_k of them. With no question
+    embedding (embedding API slow or down) only the BM25 leg runs (degraded
+    mode) and there is nothing to re-rank with. Without the BM25 index only
+    the vector leg runs. Pass the task of start_keyword_search as
+    keyword_task when the BM25 leg was started before the embedding.
+    
+    Returns:
+        Tuple of (chunks, stats) where stats has fetch_k and the re-rank
+        latency
+    """
+    hybrid = bm25_index is not None and question_embedding is not None
+    rerank = settings.RAG_RERANK_ENABLED and question_embedding is not None
+    if diversity is None:
+        diversity = settings.RAG_MMR_DIVERSITY
+    fetch_k = resolve_fetch_k(top_k, hybrid, rerank, fetch_k)
+    stats = {"fetch_k": fetch_k}
+    
+    if keyword_task is None:
+        keyword_task = start_keyword_search(question, course_id, material_id, top_k, fetch_k)
+    
+    vector_chunks = []
+    if question_embedding is not None:
+        try:
+            vector_chunks = await vector_search(question_embedding, course_id, material_id, fetch_k)
+        except Exception as e:
+            logger.error(f"Vector search failed: {str(e)}")
+    
+    keyword_chunks = []
+    if keyword_task is not None:
+        try:
+            # A task started before the embedding may have over-fetched
+            keyword_chunks = (await keyword_task)[:fetch_k]
+        except Exception as e:
+            logger.error(f"Keyword search failed: {str(e)}")
+    
+    if not keyword_chunks:
+        candidates = vector_chunks
+    elif not vector_chunks:
+        candidates = keyword_chunks
+    else:
+        candidates = reciprocal_rank_fusion(
+            [vector_chunks, keyword_chunks],
+            k=settings.RAG_RRF_K,
+            top_k=fetch_k
+        )
+    
+    if not rerank or len(candidates) <= 1:
+        return candidates[:top_k], stats
+    
+    try:
+        chunks, rerank_stats = await rerank_chunks(
+            question,
+            question_embedding,
+            candidates,
+            top_k,
+            diversity,
+            settings.RAG_LEXICAL_RERANK_WEIGHT
+        )
+    except Exception as e:
+        logger.error(f"Re-ranking failed, keeping retrieval order: {str(e)}")
+        return candidates[:top_k], stats
+    return chunks, {**stats, **rerank_stats}
 
 
 async def get_relevant_chunks(
     question: str,
     course_id: Optional[str] = None,
     material_id: Optional[str] = None,
-    top_k: int = 5
+    top_k: int = 5,
+    question_embedding: Optional[List[float]] = None
 ) -> List[dict]:
     """
-    Retrieve most relevant chunks using vector similarity search
+    Retrieve most relevant chunks (hybrid BM25 + vector search)
     
     Args:
         question: User's question
         course_id: Optional course filter
         material_id: Optional material filter
         top_k: Number of chunks to retrieve
+        question_embedding: Precomputed question embedding (optional)
         
     Returns:
         List of relevant chunk dictionaries
     """
     try:
-        supabase = get_supabase_client()
+        keyword_task = start_keyword_search(question, course_id, material_id, top_k)
+        # Generate embedding for the question (the BM25 leg runs meanwhile)
+        if question_embedding is None:
+            question_embedding = await embed_question_within_deadline(question)
         
-        # Generate embedding for the question
-        question_embeddings = await generate_embeddings([question])
-        question_embedding = question_embeddings[0]
-        
-        # Build the query with filters
-        # Use the view that includes course and material metadata
-        # Lower threshold to 0.3 for better results
-        query = supabase.rpc(
-            'match_material_chunks',
-            {
-                'query_embedding': question_embedding,
-                'match_threshold': 0.3,  # Lowered from 0.7 to get more results
-                'match_count': top_k,
-                'filter_course_id': course_id,
-                'filter_material_id': material_id
-            }
+        chunks, _ = await retrieve_chunks(
+            question, question_embedding, course_id, material_id, top_k, keyword_task=keyword_task
         )
         
-        result = query.execute()
-        
-        logger.info(f"RPC response status: {result.count if hasattr(result, 'count') else 'N/A'}")
-        logger.info(f"Chunks returned: {len(result.data) if result.data else 0}")
-        if result.data and len(result.data) > 0:
-            logger.info(f"First chunk similarity: {result.data[0].get('similarity', 'N/A')}")
+        logger.info(f"Chunks returned: {len(chunks)} ({retrieval_mode(question_embedding)})")
+        if chunks:
+            logger.info(f"First chunk similarity: {chunks[0].get('similarity', 'N/A')}")
         
-        return result.data if result.data else []
+        return chunks
         
     except Exception as e:
         logger.error(f"Error retrieving chunks: {str(e)}")
-        # Fallback to basic search if vector search fails
         return []
 
 
-async def generate_answer_with_context(
-    question: str,
-    chunks: List[dict]
-) -> str:
+def build_answer_messages(question: str, chunks: List[dict]) -> Tuple[List[dict], List[dict]]:
     """
-    Generate answer using OpenAI with retrieved context chunks
+    Build the chat messages (system prompt with context + question)
     
     Args:
         question: User's question
-        chunks: Retrieved context chunks
+        chunks: Retrieved context chunks (non-empty)
         
     Returns:
-        Generated answer
+        Tuple of (messages, sources)
     """
-    try:
-        if not chunks:
-            return (
-                "❌ No encontré información relevante para responder tu pregunta.\n\n"
-                "💡 Consejos:\n"
-                "• Verifica que hay materiales subidos en el curso seleccionado\n"
-                "• Intenta reformular tu pregunta de manera más específica\n"
-                "• Asegúrate de que los PDFs contienen información sobre el tema"
-            )
-        
-        # Build context from chunks
-        context_parts = []
-        sources = []
-        
-        for i, chunk in enumerate(chunks, 1):
-            context_parts.append(
-                f"[Fragmento {i}]\n"
-                f"Fuente: {chunk.get('material_title', 'Desconocido')}\n"
-                f"Curso: {chunk.get('course_code', '')} - {chunk.get('course_name', '')}\n"
-                f"Página: {chunk.get('metadata', {}).get('page', 'N/A')}\n"
-                f"Contenido:\n{chunk.get('chunk_text', '')}\n"
-            )
-            
-            # Track unique sources
-            source_key = chunk.get('material_id')
-            if source_key and not any(s['id'] == source_key for s in sources):
-                sources.append({
-                    'id': source_key,
-                    'title': chunk.get('material_title', 'Sin título'),
-                    'course': f"{chunk.get('course_code', '')} - {chunk.get('course_name', '')}",
-                    'author': chunk.get('author', 'Desconocido')
-                })
-        
-        context = "\n\n".join(context_parts)
+    # Build context from chunks
+    context_parts = []
+    sources = []
+    
+    for i, chunk in enumerate(chunks, 1):
+        context_parts.append(
+            f"[Fragmento {i}]\n"
+            f"Fuente: {chunk.get('material_title', 'Desconocido')}\n"
+            f"Curso: {chunk.get('course_code', '')} - {chunk.get('course_name', '')}\n"
+            f"Página: {chunk.get('metadata', {}).get('page', 'N/A')}\n"
+            f"Contenido:\n{chunk.get('chunk_text', '')}\n"
+        )
         
-        # System prompt
-        system_prompt = f"""Eres un asistente educativo inteligente especializado en responder preguntas sobre materiales académicos.
+        # Track unique sources
+        source_key = chunk.get('material_id')
+        if source_key and not any(s['id'] == source_key for s in sources):
+            sources.append({
+                'id': source_key,
+                'title': chunk.get('material_title', 'Sin título'),
+                'course': f"{chunk.get('course_code', '')} - {chunk.get('course_name', '')}",
+                'author': chunk.get('author', 'Desconocido')
+            })
+    
+    context = "\n\n".join(context_parts)
+    
+    # System prompt
+    system_prompt = f"""Eres un asistente educativo inteligente especializado en responder preguntas sobre materiales académicos.
 
 Tu trabajo es:
 1. Analizar cuidadosamente los fragmentos de texto proporcionados
@@ -154,30 +343,98 @@ Fragmentos de contexto:
 Fuentes disponibles:
 {chr(10).join([f"• {s['title']} ({s['course']})" for s in sources])}
 """
+    
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": question}
+    ]
+    return messages, sources
+
+
+def format_sources_footer(sources: List[dict]) -> str:
+    """Markdown footer listing the consulted sources"""
+    footer = "\n\n---\n\n**📚 Fuentes consultadas:**\n"
+    for source in sources:
+        footer += f"- {source['title']} ({source['course']})\n"
+    return footer
+
+
+def build_degraded_answer(chunks: List[dict]) -> str:
+    """Extractive answer (top chunks verbatim) used while the LLM circuit is open or half-open"""
+    parts = [DEGRADED_ANSWER_HEADER]
+    for chunk in chunks[:DEGRADED_ANSWER_CHUNKS]:
+        text = chunk.get('chunk_text', '').strip()
+        if len(text) > DEGRADED_EXCERPT_CHARS:
+            text = text[:DEGRADED_EXCERPT_CHARS].rsplit(' ', 1)[0] + "..."
+        parts.append(
+            f"**{chunk.get('material_title', 'Sin título')}** "
+            f"(página {chunk.get('metadata', {}).get('page', 'N/A')}):\n> {text}"
+        )
+    return "\n\n".join(parts)
+
+
+async def generate_answer_with_context(
+    question: str,
+    chunks: List[dict]
+) -> str:
+    """
+    Generate answer using OpenAI with retrieved context chunks
+    
+    Args:
+        question: User's question
+        chunks: Retrieved context chunks
+        
+    Returns:
+        Generated answer
+    """
+    try:
+        if not chunks:
+            return NO_RELEVANT_CHUNKS_ANSWER
+        
+        messages, sources = build_answer_messages(question, chunks)
+        
+        # Circuit open: answer from the retrieved chunks without the LLM
+        if llm_gateway.is_degraded(CHAT):
+            return build_degraded_answer(chunks)
         
         # Generate answer with OpenAI
-        response = await openai_client.chat.completions.create(
+        answer = await llm_gateway.chat(
+            messages,
             model=settings.OPENAI_MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": question}
-            ],
-            temperature=0.3,  # Lower temperature for more focused answers
-            max_tokens=1000
+            temperature=ANSWER_TEMPERATURE,
+            max_tokens=ANSWER_MAX_TOKENS
         )
         
-        answer = response.choices[0].message.content
-        
         # Add sources at the end
-        answer += "\n\n---\n\n**📚 Fuentes consultadas:**\n"
-        for source in sources:
-            answer += f"- {source['title']} ({source['course']})\n"
+        answer += format_sources_footer(sources)
         
         return answer
         
+    except CircuitOpenError:
+        # Half-open: another request holds the single probe
+        return build_degraded_answer(chunks)
     except Exception as e:
         logger.error(f"Error generating answer: {str(e)}")
-        return f"❌ Error al generar respuesta: {str(e)}"
+        return f"{ANSWER_ERROR_PREFIX}: {str(e)}"
+
+
+def extract_sources(chunks: List[dict]) -> List[dict]:
+    """Unique source materials of the retrieved chunks, in rank order"""
+    sources = []
+    seen_materials = set()
+    
+    for chunk in chunks:
+        material_id = chunk.get('material_id')
+        if material_id and material_id not in seen_materials:
+            seen_materials.add(material_id)
+            sources.append({
+                'title': chunk.get('material_title', 'Sin título'),
+                'course': f"{chunk.get('course_code', '')} - {chunk.get('course_name', '')}",
+                'author': chunk.get('author', 'Desconocido'),
+                'page': chunk.get('metadata', {}).get('page', 'N/A')
+            })
+    
+    return sources
 
 
 @router.post("/query", response_model=dict)
@@ -187,9 +444,12 @@ async def query_materials(request: QueryRequest):
     
     Process:
     1. Generate embedding for user question
-    2. Retrieve most similar chunks from database (pgvector)
-    3. Use OpenAI to generate answer based on retrieved chunks
-    4. Return answer with sources
+    2. Serve a cached answer if a near-identical question was answered
+       in the same scope
+    3. Retrieve most similar chunks from database (pgvector) and re-rank
+       them with MMR so near-duplicates do not crowd the context
+    4. Use OpenAI to generate answer based on retrieved chunks
+    5. Return answer with sources
     """
     try:
         logger.info(f"RAG query: '{request.question[:50]}...'")
@@ -199,54 +459,249 @@ async def query_materials(request: QueryRequest):
         elif request.course_id:
             logger.info(f"Filtering by course_id: {request.course_id}")
         
-        # Retrieve relevant chunks using vector search
-        chunks = await get_relevant_chunks(
-            question=request.question,
+        cache_versions = None
+        # The BM25 leg runs while the question is embedded
+        keyword_task = start_keyword_search(
+            request.question, request.course_id, request.material_id, request.top_k, request.fetch_k
+        )
+        question_embedding = await embed_question_within_deadline(request.question)
+        
+        if uses_answer_cache(request, question_embedding):
+            cached = answer_cache.lookup(
+                question_embedding,
+                request.course_id,
+                request.material_id,
+                request.top_k
+            )
+            if cached is not None:
+                response, similarity = cached
+                logger.info(f"Answer cache hit (similarity {similarity:.4f})")
+                if keyword_task is not None:
+                    keyword_task.cancel()
+                return {**response, "cached": True, "cache_similarity": round(similarity, 4)}
+            # Snapshot before retrieval so a concurrent invalidation wins
+            cache_versions = answer_cache.current_versions(request.course_id, request.material_id)
+        
+        # Retrieve relevant chunks (hybrid BM25 + vector search)
+        chunks, retrieval_stats = await retrieve_chunks(
+            request.question,
+            question_embedding,
             course_id=request.course_id,
             material_id=request.material_id,
-            top_k=request.top_k
+            top_k=request.top_k,
+            diversity=request.diversity,
+            fetch_k=request.fetch_k,
+            keyword_task=keyword_task
         )
+        mode = retrieval_mode(question_embedding)
+        
+        logger.info(f"Retrieved {len(chunks)} relevant chunks ({mode})")
         
-        logger.info(f"Retrieved {len(chunks)} relevant chunks")
+        # Merge adjacent chunks and fit the prompt token budget
+        context_blocks, context_stats = build_context(chunks)
         
         # Generate answer with context
-        answer = await generate_answer_with_context(request.question, chunks)
-        
-        # Extract sources
-        sources = []
-        seen_materials = set()
-        
-        for chunk in chunks:
-            material_id = chunk.get('material_id')
-            if material_id and material_id not in seen_materials:
-                seen_materials.add(material_id)
-                sources.append({
-                    'title': chunk.get('material_title', 'Sin título'),
-                    'course': f"{chunk.get('course_code', '')} - {chunk.get('course_name', '')}",
-                    'author': chunk.get('author', 'Desconocido'),
-                    'page': chunk.get('metadata', {}).get('page', 'N/A')
-                })
+        answer = await generate_answer_with_context(request.question, context_blocks)
         
-        return {
+        response = {
             "answer": answer,
-            "sources": sources,
+            "sources": extract_sources(chunks),
             "chunks_used": len(chunks),
-            "model": settings.OPENAI_MODEL
+            "model": settings.OPENAI_MODEL,
+            "retrieval_mode": mode,
+            **retrieval_stats,
+            **context_stats
         }
         
+        if (
+            cache_versions is not None
+            and chunks
+            and not answer.startswith((ANSWER_ERROR_PREFIX, DEGRADED_ANSWER_HEADER))
+        ):
+            answer_cache.store(
+                question_embedding,
+                request.course_id,
+                request.material_id,
+                request.top_k,
+                cache_versions,
+                response
+            )
+        
+        return {**response, "cached": False}
+        
     except Exception as e:
         logger.error(f"RAG query error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
 
+def format_sse(event: str, data: dict) -> str:
+    """Encode one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_query_events(request: QueryRequest, http_request: Request) -> AsyncIterator[str]:
+    """
+    SSE event stream for /query/stream
+    
+    Events:
+    - metadata: sources, chunks_used, model, cached (as soon as retrieval ends)
+    - token: {"content": "..."} answer deltas
+    - done: {"chunks_used": ..., "cached": ...}
+    - error: {"detail": "..."}
+    """
+    cache_versions = None
+    # The BM25 leg runs while the question is embedded
+    keyword_task = start_keyword_search(
+        request.question, request.course_id, request.material_id, request.top_k, request.fetch_k
+    )
+    question_embedding = await embed_question_within_deadline(request.question)
+    
+    if uses_answer_cache(request, question_embedding):
+        cached = answer_cache.lookup(
+            question_embedding,
+            request.course_id,
+            request.material_id,
+            request.top_k
+        )
+        if cached is not None:
+            response, similarity = cached
+            logger.info(f"Answer cache hit (similarity {similarity:.4f})")
+            if keyword_task is not None:
+                keyword_task.cancel()
+            yield format_sse("metadata", {
+                "sources": response["sources"],
+                "chunks_used": response["chunks_used"],
+                "model": response["model"],
+                "cached": True
+            })
+            yield format_sse("token", {"content": response["answer"]})
+            yield format_sse("done", {"chunks_used": response["chunks_used"], "cached": True})
+            return
+        cache_versions = answer_cache.current_versions(request.course_id, request.material_id)
+    
+    chunks, retrieval_stats = await retrieve_chunks(
+        request.question,
+        question_embedding,
+        course_id=request.course_id,
+        material_id=request.material_id,
+        top_k=request.top_k,
+        diversity=request.diversity,
+        fetch_k=request.fetch_k,
+        keyword_task=keyword_task
+    )
+    mode = retrieval_mode(question_embedding)
+    logger.info(f"Retrieved {len(chunks)} relevant chunks ({mode}, stream)")
+    
+    sources = extract_sources(chunks)
+    context_blocks, context_stats = build_context(chunks)
+    yield format_sse("metadata", {
+        "sources": sources,
+        "chunks_used": len(chunks),
+        "model": settings.OPENAI_MODEL,
+        "retrieval_mode": mode,
+        **retrieval_stats,
+        **context_stats,
+        "cached": False
+    })
+    
+    if not chunks:
+        yield format_sse("token", {"content": NO_RELEVANT_CHUNKS_ANSWER})
+        yield format_sse("done", {"chunks_used": 0, "cached": False})
+        return
+    
+    if llm_gateway.is_degraded(CHAT):
+        yield format_sse("token", {"content": build_degraded_answer(chunks)})
+        yield format_sse("done", {"chunks_used": len(chunks), "cached": False, "degraded": True})
+        return
+    
+    messages, prompt_sources = build_answer_messages(request.question, context_blocks)
+    answer_parts = []
+    completion_stream = None
+    try:
+        completion_stream = llm_gateway.stream_chat(
+            messages,
+            model=settings.OPENAI_MODEL,
+            temperature=ANSWER_TEMPERATURE,
+            max_tokens=ANSWER_MAX_TOKENS
+        )
+        async for delta in completion_stream:
+            if await http_request.is_disconnected():
+                logger.info("Client disconnected, cancelling completion stream")
+                return
+            answer_parts.append(delta)
+            yield format_sse("token", {"content": delta})
+        
+        footer = format_sources_footer(prompt_sources)
+        answer_parts.append(footer)
+        yield format_sse("token", {"content": footer})
+        yield format_sse("done", {"chunks_used": len(chunks), "cached": False})
+        
+        if cache_versions is not None:
+            answer_cache.store(
+                question_embedding,
+                request.course_id,
+                request.material_id,
+                request.top_k,
+                cache_versions,
+                {
+                    "answer": "".join(answer_parts),
+                    "sources": sources,
+                    "chunks_used": len(chunks),
+                    "model": settings.OPENAI_MODEL,
+                    "retrieval_mode": mode,
+                    **retrieval_stats,
+                    **context_stats
+                }
+            )
+    except CircuitOpenError:
+        # Half-open: another request holds the single probe (raised before any token)
+        yield format_sse("token", {"content": build_degraded_answer(chunks)})
+        yield format_sse("done", {"chunks_used": len(chunks), "cached": False, "degraded": True})
+    except Exception as e:
+        logger.error(f"Error streaming answer: {str(e)}")
+        yield format_sse("error", {"detail": f"{ANSWER_ERROR_PREFIX}: {str(e)}"})
+    finally:
+        # Closing the stream aborts the upstream HTTP request, so tokens
+        # nobody reads are not generated (also runs when the server
+        # cancels this generator on disconnect)
+        if completion_stream is not None:
+            await completion_stream.aclose()
+
+
+@router.post("/query/stream")
+async def query_materials_stream(request: QueryRequest, http_request: Request):
+    """
+    Streaming variant of /query (Server-Sent Events)
+    
+    Emits retrieval metadata as soon as the chunks are found, then the
+    answer tokens as OpenAI generates them.
+    """
+    logger.info(f"RAG stream query: '{request.question[:50]}...'")
+    return StreamingResponse(
+        stream_query_events(request, http_request),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Disable proxy buffering
+        }
+    )
+
+
 @router.get("/health", response_model=dict)
 async def health_check():
     """Check RAG system health"""
     try:
         supabase = get_supabase_client()
         
-        # Check if material_chunks table exists and has data
-        result = supabase.table("material_chunks").select("id, material_id, chunk_index, embedding").limit(5).execute()
+        # supabase-py is blocking: run the three queries in worker threads
+        result, materials, chunk_count_result = await asyncio.gather(
+            # Check if material_chunks table exists and has data
+            asyncio.to_thread(
+                supabase.table("material_chunks").select("id, material_id, chunk_index, embedding").limit(5).execute
+            ),
+            asyncio.to_thread(supabase.table("materials").select("id, processing_status, chunks_count").execute),
+            asyncio.to_thread(supabase.table("material_chunks").select("id", count="exact").execute)
+        )
         has_chunks = len(result.data) > 0 if result.data else False
         
         chunks_info = []
@@ -261,7 +716,6 @@ async def health_check():
                 })
         
         # Check materials count
-        materials = supabase.table("materials").select("id, processing_status, chunks_count").execute()
         total_materials = len(materials.data) if materials.data else 0
         
         processed_materials = sum(
@@ -270,19 +724,31 @@ async def health_check():
         )
         
         # Count total chunks
-        chunk_count_result = supabase.table("material_chunks").select("id", count="exact").execute()
         total_chunks = chunk_count_result.count if hasattr(chunk_count_result, 'count') else 0
         
         return {
             "status": "healthy",
             "vector_search": "enabled",
+            "vector_profile": settings.RAG_VECTOR_PROFILE,
             "has_chunks": has_chunks,
             "total_chunks": total_chunks,
             "total_materials": total_materials,
             "processed_materials": processed_materials,
             "sample_chunks": chunks_info,
             "openai_model": settings.OPENAI_MODEL,
-            "embedding_model": settings.OPENAI_EMBEDDING_MODEL
+            "embedding_model": settings.OPENAI_EMBEDDING_MODEL,
+            "embedding_cache": embedding_cache.stats() if embedding_cache else None,
+            "embedding_batching": embedding_dispatcher.stats() if embedding_dispatcher else None,
+            "ingestion_embedding": embedding_batcher.stats(),
+            "ocr": ocr_stats(),
+            "cpu_pool": cpu_pool_stats(),
+            "job_queue": job_queue.stats(),
+            "answer_cache": answer_cache.stats() if answer_cache else None,
+            "retriever": "local" if get_local_retriever() else "rpc",
+            "bm25_index": bm25_index.stats() if bm25_index else None,
+            "local_index": get_local_retriever().stats() if get_local_retriever() else None,
+            "near_duplicates": near_duplicate_index.stats() if near_duplicate_index else None,
+            "llm_gateway": llm_gateway.stats()
         }
         
     except Exception as e:
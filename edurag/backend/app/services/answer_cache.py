@@ -0,0 +1,217 @@
+"""
+Semantic Answer Cache Service
+Reuses RAG answers for near-duplicate questions within the same scope
+(course_id / material_id), invalidated through per-scope version counters
+kept in SQLite, so an invalidation by any process (web or ingestion
+worker) is seen by all of them
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+VersionToken = Tuple[int, ...]
+
+
+class AnswerCache:
+    """
+    Answer cache keyed by question embedding
+
+    Entries live in a scope (course_id, material_id, top_k). A lookup is a hit
+    when the cosine similarity between the new question and a cached one is
+    above the threshold. Every entry remembers the version counters it
+    depends on: its own course/material keys, or "global" when the question
+    was not scoped, plus "all". Invalidating a course/material bumps its keys
+    and "global", so answers of other courses stay cached; "all" is bumped
+    only when the course of the change is unknown.
+
+    Entries are per process; the counters are shared through the SQLite
+    file at `versions_path`, so a material ingested by a standalone worker
+    invalidates the answers cached by every web process.
+    """
+
+    def __init__(
+        self,
+        similarity_threshold: float = 0.95,
+        max_entries_per_scope: int = 500,
+        ttl_seconds: int = 24 * 3600,
+        versions_path: str = ":memory:"
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries_per_scope = max_entries_per_scope
+        self.ttl_seconds = ttl_seconds
+        self._db = sqlite3.connect(versions_path, timeout=10, check_same_thread=False)
+        self._db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS versions (key TEXT PRIMARY KEY, version INTEGER NOT NULL);
+            """
+        )
+        self._db.commit()
+        # scope -> OrderedDict[entry_id, (unit_vector, versions, created_at, response)]
+        self._scopes: Dict[Tuple, "OrderedDict[int, tuple]"] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stale": 0, "invalidations": 0}
+
+    @staticmethod
+    def _scope(course_id: Optional[str], material_id: Optional[str], top_k: int) -> Tuple:
+        return (course_id, material_id, top_k)
+
+    @staticmethod
+    def _version_keys(course_id: Optional[str], material_id: Optional[str]) -> List[str]:
+        """Counters an entry of this scope depends on"""
+        keys = ["all"]
+        if course_id:
+            keys.append(f"course:{course_id}")
+        if material_id:
+            keys.append(f"material:{material_id}")
+        if not course_id and not material_id:
+            keys.append("global")
+        return keys
+
+    @staticmethod
+    def _invalidation_keys(course_id: Optional[str], material_id: Optional[str]) -> List[str]:
+        """Counters bumped by a change to this course/material"""
+        if not course_id:
+            # Entries scoped to the material's course cannot be found
+            return ["all"]
+        keys = ["global", f"course:{course_id}"]
+        if material_id:
+            keys.append(f"material:{material_id}")
+        return keys
+
+    def _read_versions(self, keys: List[str]) -> VersionToken:
+        """Current counters of the keys (caller holds the lock)"""
+        placeholders = ",".join("?" * len(keys))
+        stored = dict(self._db.execute(
+            f"SELECT key, version FROM versions WHERE key IN ({placeholders})", keys
+        ).fetchall())
+        return tuple(stored.get(key, 0) for key in keys)
+
+    def current_versions(self, course_id: Optional[str], material_id: Optional[str]) -> VersionToken:
+        """
+        Snapshot the version counters of a scope
+
+        Take it before retrieval and pass it to `store`, so an invalidation
+        that happens while the answer is being generated is not lost.
+        """
+        with self._lock:
+            return self._read_versions(self._version_keys(course_id, material_id))
+
+    def invalidate(self, course_id: Optional[str] = None, material_id: Optional[str] = None) -> None:
+        """Invalidate every entry that may include the given course/material"""
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO versions (key, version) VALUES (?, 1) "
+                "ON CONFLICT(key) DO UPDATE SET version = version + 1",
+                [(key,) for key in self._invalidation_keys(course_id, material_id)]
+            )
+            self._db.commit()
+            self._counters["invalidations"] += 1
+        logger.info(f"Answer cache invalidated (course={course_id}, material={material_id})")
+
+    def lookup(
+        self,
+        question_embedding: List[float],
+        course_id: Optional[str],
+        material_id: Optional[str],
+        top_k: int
+    ) -> Optional[Tuple[Dict, float]]:
+        """Return (cached_response, similarity) or None"""
+        scope = self._scope(course_id, material_id, top_k)
+        now = time.time()
+        with self._lock:
+            entries = self._scopes.get(scope)
+            if not entries:
+                self._counters["misses"] += 1
+                return None
+
+            current = self._read_versions(self._version_keys(course_id, material_id))
+            stale = [
+                entry_id for entry_id, (_, versions, created_at, _) in entries.items()
+                if versions != current or now - created_at > self.ttl_seconds
+            ]
+            for entry_id in stale:
+                del entries[entry_id]
+            self._counters["stale"] += len(stale)
+            if not entries:
+                self._counters["misses"] += 1
+                return None
+
+            entry_ids = list(entries.keys())
+            matrix = np.stack([entries[entry_id][0] for entry_id in entry_ids])
+            query = np.asarray(question_embedding, dtype=np.float32)
+            query /= (np.linalg.norm(query) or 1.0)
+            similarities = matrix @ query
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+
+            if similarity < self.similarity_threshold:
+                self._counters["misses"] += 1
+                return None
+
+            entries.move_to_end(entry_ids[best])
+            self._counters["hits"] += 1
+            return entries[entry_ids[best]][3], similarity
+
+    def store(
+        self,
+        question_embedding: List[float],
+        course_id: Optional[str],
+        material_id: Optional[str],
+        top_k: int,
+        versions: VersionToken,
+        response: Dict
+    ) -> None:
+        """Cache a response computed under the given version snapshot"""
+        vector = np.asarray(question_embedding, dtype=np.float32)
+        vector /= (np.linalg.norm(vector) or 1.0)
+        scope = self._scope(course_id, material_id, top_k)
+        with self._lock:
+            entries = self._scopes.setdefault(scope, OrderedDict())
+            entries[self._next_id] = (vector, versions, time.time(), response)
+            self._next_id += 1
+            while len(entries) > self.max_entries_per_scope:
+                entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                **self._counters,
+                "entries": sum(len(entries) for entries in self._scopes.values()),
+                "scopes": len(self._scopes),
+                "similarity_threshold": self.similarity_threshold,
+                "hit_rate": round(self._counters["hits"] / lookups, 4) if lookups else 0.0
+            }
+
+
+# Shared cache instance (None when disabled)
+answer_cache: Optional[AnswerCache] = None
+if settings.ANSWER_CACHE_ENABLED:
+    try:
+        answer_cache = AnswerCache(
+            similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+            max_entries_per_scope=settings.ANSWER_CACHE_MAX_ENTRIES_PER_SCOPE,
+            ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+            versions_path=settings.ANSWER_CACHE_VERSIONS_PATH
+        )
+    except sqlite3.Error as e:
+        logger.warning(f"Answer cache disabled: {e}")
+
+
+def invalidate_answer_cache(course_id: Optional[str] = None, material_id: Optional[str] = None) -> None:
+    """Invalidate cached answers for a course/material (no-op when disabled; blocking, a SQLite write)"""
+    if answer_cache is not None:
+        answer_cache.invalidate(course_id, material_id)
@@ -0,0 +1,304 @@
+"""
+BM25 Index Service
+Persistent inverted index (SQLite) over material_chunks.chunk_text with
+Spanish stopwords and stemming, maintained at ingestion time
+"""
+
+import json
+import logging
+import math
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+
+try:
+    from nltk.stem.snowball import SpanishStemmer
+    _snowball = SpanishStemmer()
+except ImportError:
+    _snowball = None
+
+logger = logging.getLogger(__name__)
+
+# Common Spanish function words (accents already stripped)
+SPANISH_STOPWORDS = {
+    "a", "al", "algo", "algun", "alguna", "algunas", "alguno", "algunos", "ante", "antes",
+    "aqui", "asi", "aun", "cada", "como", "con", "contra", "cual", "cuales", "cuando",
+    "cuanto", "de", "del", "desde", "donde", "dos", "el", "ella", "ellas", "ello", "ellos",
+    "en", "entre", "era", "eran", "es", "esa", "esas", "ese", "eso", "esos", "esta",
+    "estaba", "estan", "estas", "este", "esto", "estos", "fue", "fueron", "ha", "han",
+    "hasta", "hay", "la", "las", "le", "les", "lo", "los", "mas", "me", "mi", "muy",
+    "nada", "ni", "no", "nos", "o", "otra", "otras", "otro", "otros", "para", "pero",
+    "poco", "por", "porque", "que", "quien", "se", "sea", "segun", "ser", "si", "sido",
+    "sin", "sobre", "son", "su", "sus", "tal", "tambien", "tan", "te", "tiene", "tienen",
+    "todo", "todos", "tu", "un", "una", "unas", "uno", "unos", "y", "ya", "yo",
+    # Question words that carry no topic
+    "cual", "cuales", "explica", "explicame", "define", "significa"
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _strip_accents(text: str) -> str:
+    decomposed = unicodedata.normalize("NFD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def _light_stem(word: str) -> str:
+    """Minimal Spanish stemmer (plural and gender endings) when nltk is absent"""
+    if len(word) <= 4:
+        return word
+    for suffix in ("mente", "ciones", "cion", "idades", "idad", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            word = word[:-len(suffix)]
+            break
+    if word[-1] in "aoe" and len(word) > 4:
+        word = word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, strip accents, drop stopwords and stem"""
+    tokens = _TOKEN_RE.findall(_strip_accents(text.lower()))
+    terms = []
+    for token in tokens:
+        if token in SPANISH_STOPWORDS or len(token) < 2:
+            continue
+        terms.append(_snowball.stem(token) if _snowball else _light_stem(token))
+    return terms
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a SQLite inverted index
+
+    postings(term, chunk_id, tf) is clustered by term, so a query reads only
+    the posting lists of its terms. Document frequencies, document lengths
+    and corpus totals are kept up to date on every add/remove.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS docs (
+                chunk_id TEXT PRIMARY KEY, material_id TEXT NOT NULL, course_id TEXT,
+                chunk_index INTEGER, chunk_text TEXT, metadata TEXT, length INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_docs_material ON docs(material_id);
+            CREATE INDEX IF NOT EXISTS idx_docs_course ON docs(course_id);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL, chunk_id TEXT NOT NULL, tf INTEGER NOT NULL,
+                PRIMARY KEY (term, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings(chunk_id);
+            CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS materials (material_id TEXT PRIMARY KEY, info TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS stats (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO stats VALUES ('doc_count', 0), ('total_length', 0);
+            """
+        )
+        self._db.commit()
+
+    def _stat(self, key: str) -> int:
+        return self._db.execute("SELECT value FROM stats WHERE key = ?", (key,)).fetchone()[0]
+
+    def add_material(self, material_id: str, material_info: Dict, chunks: List[Dict]) -> int:
+        """
+        Index the chunks of a material (replaces any previous version)
+
+        Args:
+            material_id: UUID of the material
+            material_info: course_id, material_title, author, course_code, course_name
+            chunks: Dicts with id, chunk_text, chunk_index, metadata
+        """
+        with self._lock:
+            self._remove_material(material_id)
+            return self._insert_chunks(material_id, material_info, chunks)
+
+    def append_chunks(self, material_id: str, material_info: Dict, chunks: List[Dict]) -> int:
+        """Index more chunks of a material whose processing is still running"""
+        with self._lock:
+            return self._insert_chunks(material_id, material_info, chunks)
+
+    def _insert_chunks(self, material_id: str, material_info: Dict, chunks: List[Dict]) -> int:
+        """Insert chunk rows and postings (caller holds the lock)"""
+        doc_rows = []
+        posting_rows = []
+        df_delta: Counter = Counter()
+        total_length = 0
+        for chunk in chunks:
+            terms = Counter(tokenize(chunk["chunk_text"]))
+            length = sum(terms.values())
+            total_length += length
+            doc_rows.append((
+                chunk["id"], material_id, material_info.get("course_id"), chunk["chunk_index"],
+                chunk["chunk_text"], json.dumps(chunk.get("metadata") or {}), length
+            ))
+            posting_rows.extend((term, chunk["id"], tf) for term, tf in terms.items())
+            df_delta.update(terms.keys())
+
+        self._db.executemany("INSERT INTO docs VALUES (?, ?, ?, ?, ?, ?, ?)", doc_rows)
+        self._db.executemany("INSERT INTO postings VALUES (?, ?, ?)", posting_rows)
+        self._db.executemany(
+            "INSERT INTO terms VALUES (?, ?) ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+            df_delta.items()
+        )
+        self._db.execute(
+            "INSERT OR REPLACE INTO materials VALUES (?, ?)", (material_id, json.dumps(material_info))
+        )
+        self._db.execute("UPDATE stats SET value = value + ? WHERE key = 'doc_count'", (len(doc_rows),))
+        self._db.execute("UPDATE stats SET value = value + ? WHERE key = 'total_length'", (total_length,))
+        self._db.commit()
+        return len(doc_rows)
+
+    def remove_material(self, material_id: str) -> int:
+        """Drop every chunk of a material from the index"""
+        with self._lock:
+            removed = self._remove_material(material_id)
+            self._db.commit()
+            return removed
+
+    def _remove_material(self, material_id: str) -> int:
+        docs = self._db.execute(
+            "SELECT chunk_id, length FROM docs WHERE material_id = ?", (material_id,)
+        ).fetchall()
+        if not docs:
+            self._db.execute("DELETE FROM materials WHERE material_id = ?", (material_id,))
+            return 0
+        chunk_ids = [(chunk_id,) for chunk_id, _ in docs]
+        df_delta: Counter = Counter()
+        for (chunk_id,) in chunk_ids:
+            for (term,) in self._db.execute("SELECT term FROM postings WHERE chunk_id = ?", (chunk_id,)):
+                df_delta[term] += 1
+        self._db.executemany("DELETE FROM postings WHERE chunk_id = ?", chunk_ids)
+        self._db.executemany("UPDATE terms SET df = df - ? WHERE term = ?", [(n, t) for t, n in df_delta.items()])
+        self._db.execute("DELETE FROM terms WHERE df <= 0")
+        self._db.execute("DELETE FROM docs WHERE material_id = ?", (material_id,))
+        self._db.execute("DELETE FROM materials WHERE material_id = ?", (material_id,))
+        self._db.execute("UPDATE stats SET value = value - ? WHERE key = 'doc_count'", (len(docs),))
+        self._db.execute(
+            "UPDATE stats SET value = value - ? WHERE key = 'total_length'", (sum(length for _, length in docs),)
+        )
+        return len(docs)
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 5,
+        course_id: Optional[str] = None,
+        material_id: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        BM25 top-k chunks, shaped like match_material_chunks rows
+        (plus `bm25_score`; `similarity` is None)
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            doc_count = self._stat("doc_count")
+            if doc_count == 0:
+                return []
+            avg_length = self._stat("total_length") / doc_count
+            scores: Dict[str, float] = {}
+            for term in terms:
+                row = self._db.execute("SELECT df FROM terms WHERE term = ?", (term,)).fetchone()
+                if row is None:
+                    continue
+                idf = math.log(1 + (doc_count - row[0] + 0.5) / (row[0] + 0.5))
+                postings = self._db.execute(
+                    """
+                    SELECT p.chunk_id, p.tf, d.length FROM postings p
+                    JOIN docs d ON d.chunk_id = p.chunk_id
+                    WHERE p.term = ?
+                      AND (? IS NULL OR d.course_id = ?)
+                      AND (? IS NULL OR d.material_id = ?)
+                    """,
+                    (term, course_id, course_id, material_id, material_id)
+                )
+                for chunk_id, tf, length in postings:
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+            results = []
+            material_info: Dict[str, Dict] = {}
+            for chunk_id, score in best:
+                doc_material_id, chunk_index, chunk_text, metadata = self._db.execute(
+                    "SELECT material_id, chunk_index, chunk_text, metadata FROM docs WHERE chunk_id = ?",
+                    (chunk_id,)
+                ).fetchone()
+                if doc_material_id not in material_info:
+                    info_row = self._db.execute(
+                        "SELECT info FROM materials WHERE material_id = ?", (doc_material_id,)
+                    ).fetchone()
+                    material_info[doc_material_id] = json.loads(info_row[0]) if info_row else {}
+                info = material_info[doc_material_id]
+                results.append({
+                    "id": chunk_id,
+                    "material_id": doc_material_id,
+                    "chunk_text": chunk_text,
+                    "chunk_index": chunk_index,
+                    "metadata": json.loads(metadata),
+                    "similarity": None,
+                    "bm25_score": round(score, 4),
+                    "course_id": info.get("course_id"),
+                    "material_title": info.get("material_title"),
+                    "author": info.get("author"),
+                    "course_code": info.get("course_code"),
+                    "course_name": info.get("course_name")
+                })
+            return results
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "documents": self._stat("doc_count"),
+                "terms": self._db.execute("SELECT COUNT(*) FROM terms").fetchone()[0],
+                "stemmer": "snowball" if _snowball else "light"
+            }
+
+
+# Shared index instance (None when hybrid search is disabled)
+bm25_index: Optional[BM25Index] = None
+if settings.RAG_HYBRID_SEARCH:
+    try:
+        bm25_index = BM25Index(settings.BM25_INDEX_PATH, k1=settings.BM25_K1, b=settings.BM25_B)
+    except sqlite3.Error as e:
+        logger.warning(f"BM25 index disabled: {e}")
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict]], k: int = 60, top_k: int = 5) -> List[Dict]:
+    """
+    Merge ranked chunk lists with RRF: score = sum(1 / (k + rank))
+
+    Chunks are matched by (material_id, chunk_index), falling back to id;
+    the first list a chunk appears in provides its fields, later lists fill
+    in missing scores (similarity, bm25_score).
+    """
+    fused: Dict[str, Dict] = {}
+    scores: Dict[str, float] = {}
+    for results in result_lists:
+        for rank, chunk in enumerate(results, 1):
+            if chunk.get("chunk_index") is not None:
+                key = f"{chunk.get('material_id')}:{chunk['chunk_index']}"
+            else:
+                key = str(chunk.get("id"))
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            if key not in fused:
+                fused[key] = dict(chunk)
+            else:
+                for field in ("similarity", "bm25_score"):
+                    if fused[key].get(field) is None and chunk.get(field) is not None:
+                        fused[key][field] = chunk[field]
+    ranked = sorted(fused, key=lambda key: scores[key], reverse=True)[:top_k]
+    return [{**fused[key], "rrf_score": round(scores[key], 6)} for key in ranked]
@@ -0,0 +1,114 @@
+"""
+Context Builder Service
+Turns retrieved chunks into prompt context under a token budget: merges
+adjacent chunks of the same material (dropping the chunking overlap) and
+fills the budget in relevance order
+"""
+
+from typing import Dict, List, Tuple
+
+from app.core.config import settings
+from app.services.pdf_processor import encoding
+
+# Shortest suffix/prefix match treated as chunking overlap (shorter matches
+# are likely coincidental, e.g. a shared trailing space)
+MIN_OVERLAP_CHARS = 20
+
+
+def _strip_overlap(previous: str, following: str, max_chars: int) -> str:
+    """Remove from `following` the prefix it shares with the end of `previous`"""
+    limit = min(len(previous), len(following), max_chars)
+    for length in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(following[:length]):
+            return following[length:]
+    return following
+
+
+def merge_adjacent_chunks(chunks: List[Dict]) -> List[Dict]:
+    """
+    Merge chunks with consecutive chunk_index from the same material
+
+    Input order is relevance order; each merged block keeps the best rank of
+    its members in `rank` and the fields (title, course, page...) of its
+    first chunk in document order.
+    """
+    # Chunking overlap is RAG_CHUNK_OVERLAP tokens (~4 chars each); allow slack
+    max_overlap_chars = settings.RAG_CHUNK_OVERLAP * 4 * 2
+
+    by_material: Dict[str, List[Tuple[int, Dict]]] = {}
+    for rank, chunk in enumerate(chunks):
+        by_material.setdefault(chunk.get("material_id"), []).append((rank, chunk))
+
+    blocks = []
+    for items in by_material.values():
+        items.sort(key=lambda item: (item[1].get("chunk_index") is None, item[1].get("chunk_index") or 0))
+        current = None
+        for rank, chunk in items:
+            index = chunk.get("chunk_index")
+            if (
+                current is not None
+                and index is not None
+                and current["chunk_indices"][-1] is not None
+                and index == current["chunk_indices"][-1] + 1
+            ):
+                addition = _strip_overlap(current["chunk_text"], chunk.get("chunk_text", ""), max_overlap_chars)
+                current["chunk_text"] += addition
+                current["chunk_indices"].append(index)
+                current["rank"] = min(current["rank"], rank)
+                continue
+            current = {
+                **chunk,
+                "chunk_text": chunk.get("chunk_text", ""),
+                "chunk_indices": [index],
+                "rank": rank
+            }
+            blocks.append(current)
+
+    blocks.sort(key=lambda block: block["rank"])
+    return blocks
+
+
+def build_context(chunks: List[Dict], token_budget: int = None) -> Tuple[List[Dict], Dict]:
+    """
+    Select context blocks for the prompt under a token budget
+
+    Args:
+        chunks: Retrieved chunks in relevance order
+        token_budget: Max tokens of chunk text (default RAG_CONTEXT_TOKEN_BUDGET)
+
+    Returns:
+        Tuple of (blocks, stats). Blocks have the chunk fields plus
+        `chunk_indices` and `token_count`; stats report tokens before/after
+        and tokens saved.
+    """
+    if token_budget is None:
+        token_budget = settings.RAG_CONTEXT_TOKEN_BUDGET
+
+    tokens_before = sum(len(encoding.encode(chunk.get("chunk_text", ""))) for chunk in chunks)
+
+    blocks = merge_adjacent_chunks(chunks)
+    selected = []
+    used = 0
+    for block in blocks:
+        tokens = encoding.encode(block["chunk_text"])
+        remaining = token_budget - used
+        if remaining <= 0:
+            break
+        if len(tokens) > remaining:
+            # Only truncate when a meaningful piece fits, otherwise try smaller blocks
+            if remaining < min(len(tokens), 50):
+                continue
+            tokens = tokens[:remaining]
+            block["chunk_text"] = encoding.decode(tokens)
+        block["token_count"] = len(tokens)
+        used += len(tokens)
+        selected.append(block)
+
+    stats = {
+        "context_tokens": used,
+        "context_tokens_before": tokens_before,
+        "context_tokens_saved": tokens_before - used,
+        "chunks_merged": len(chunks) - len(blocks),
+        "blocks_used": len(selected)
+    }
+    return selected, stats
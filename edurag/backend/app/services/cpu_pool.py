@@ -0,0 +1,88 @@
+"""
+CPU Pool Service
+Managed process pool for CPU-bound ingestion work (PDF text extraction,
+tokenization). pdfplumber is pure Python: run in a thread it still holds
+the GIL the query handlers need, so it runs in worker processes instead.
+Workers are spawned and warmed up (tiktoken cl100k_base, pdfplumber) when
+the application starts, not on the first upload.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def cpu_pool_size() -> int:
+    """Worker processes (CPU_POOL_WORKERS, default one core left for the web process)"""
+    return settings.CPU_POOL_WORKERS or max(1, (os.cpu_count() or 1) - 1)
+
+
+def _warm_up() -> None:
+    """Worker initializer: load the tokenizer and PDF parser once"""
+    from app.services import pdf_text
+    pdf_text.count_tokens("warm up")
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: workers do not inherit the web process's threads, sockets or pools
+        _pool = ProcessPoolExecutor(
+            max_workers=cpu_pool_size(),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_up
+        )
+    return _pool
+
+
+async def start_cpu_pool() -> None:
+    """Spawn and warm up every worker (no-op when CPU_POOL_ENABLED is off)"""
+    if not settings.CPU_POOL_ENABLED:
+        return
+    started = time.perf_counter()
+    pool = _get_pool()
+    # Concurrent tasks make the executor start all of its workers
+    futures = [pool.submit(_ping) for _ in range(cpu_pool_size())]
+    await asyncio.to_thread(wait, futures)
+    logger.info(f"CPU pool ready: {cpu_pool_size()} workers in {time.perf_counter() - started:.1f}s")
+
+
+def stop_cpu_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def run_in_cpu_pool(fn: Callable, *args) -> Any:
+    """
+    Run a picklable module-level function in the CPU pool
+
+    Falls back to a thread when CPU_POOL_ENABLED is off.
+    """
+    if not settings.CPU_POOL_ENABLED:
+        return await asyncio.to_thread(fn, *args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_pool(), fn, *args)
+
+
+def cpu_pool_stats() -> Dict:
+    return {
+        "enabled": settings.CPU_POOL_ENABLED,
+        "workers": cpu_pool_size(),
+        "started": _pool is not None
+    }
@@ -0,0 +1,274 @@
+"""
+Embedding Batcher Service
+Bulk embedding for ingestion: packs texts into API requests by token
+count, runs several requests concurrently, retries each failed request
+with backoff and checkpoints finished requests so that re-processing a
+material resumes instead of starting over
+"""
+
+import asyncio
+import logging
+import random
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.services.cpu_pool import run_in_cpu_pool
+
+logger = logging.getLogger(__name__)
+
+# OpenAI embeddings API limits
+MAX_BATCH_TEXTS = 2048  # Inputs per request
+MAX_INPUT_TOKENS = 8191  # Tokens per input
+
+EmbedFn = Callable[[List[str]], Awaitable[List[List[float]]]]
+# (texts, max_tokens) -> (token counts, truncated texts by index)
+TruncateFn = Callable[[List[str], int], Tuple[List[int], Dict[int, str]]]
+
+
+def pack_batches(
+    token_counts: Sequence[int],
+    max_tokens: int,
+    max_texts: int = MAX_BATCH_TEXTS
+) -> List[List[int]]:
+    """
+    Greedy in-order packing of texts into requests
+
+    Args:
+        token_counts: Tokens of each text
+        max_tokens: Max total tokens per request
+        max_texts: Max texts per request
+
+    Returns:
+        Lists of text indices, one per request
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for i, tokens in enumerate(token_counts):
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_texts):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+class EmbeddingCheckpoint:
+    """
+    Embeddings of finished requests, grouped by ingestion (material id)
+
+    Stored in SQLite as float32 blobs keyed by (checkpoint_id, cache key),
+    so vectors are only reused for identical text and model.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "checkpoint_id TEXT NOT NULL, key TEXT NOT NULL, embedding BLOB NOT NULL, "
+            "PRIMARY KEY (checkpoint_id, key))"
+        )
+        self._db.commit()
+
+    def get_many(self, checkpoint_id: str, keys: List[str]) -> Dict[str, List[float]]:
+        """Checkpointed vectors among `keys`"""
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                for key, blob in self._db.execute(
+                    f"SELECT key, embedding FROM checkpoints WHERE checkpoint_id = ? AND key IN ({placeholders})",
+                    (checkpoint_id, *part)
+                ):
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def put_many(self, checkpoint_id: str, items: Dict[str, List[float]]) -> None:
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO checkpoints (checkpoint_id, key, embedding) VALUES (?, ?, ?)",
+                [(checkpoint_id, key, array("f", vector).tobytes()) for key, vector in items.items()]
+            )
+            self._db.commit()
+
+    def clear(self, checkpoint_id: str) -> int:
+        """Drop a finished (or abandoned) ingestion's vectors"""
+        with self._lock:
+            deleted = self._db.execute(
+                "DELETE FROM checkpoints WHERE checkpoint_id = ?", (checkpoint_id,)
+            ).rowcount
+            self._db.commit()
+        return deleted
+
+
+class EmbeddingBatcher:
+    """
+    Token-packed, concurrent, retrying bulk embedder
+
+    Texts are packed into requests of at most `max_batch_tokens` tokens and
+    MAX_BATCH_TEXTS inputs (longer inputs are truncated to MAX_INPUT_TOKENS)
+    and at most `concurrency` requests run at once across all callers. A
+    failed request is retried on its own, up to `max_attempts` times with
+    full-jitter backoff, after the gateway's own retries gave up. With a
+    checkpoint and a checkpoint_id, finished requests are saved as they
+    complete and skipped on the next run.
+
+    Inputs are tokenized by `truncate_fn` in the CPU pool, so it must be a
+    picklable module-level function (pdf_text.truncate_tokens).
+    """
+
+    def __init__(
+        self,
+        embed_fn: EmbedFn,
+        truncate_fn: TruncateFn,
+        key_fn: Callable[[str], str],
+        max_batch_tokens: int = 250000,
+        concurrency: int = 4,
+        max_attempts: int = 4,
+        backoff_seconds: float = 2.0,
+        backoff_max_seconds: float = 60.0,
+        checkpoint: Optional[EmbeddingCheckpoint] = None
+    ):
+        self.embed_fn = embed_fn
+        self.truncate_fn = truncate_fn
+        self.key_fn = key_fn
+        self.max_batch_tokens = min(max_batch_tokens, MAX_BATCH_TEXTS * MAX_INPUT_TOKENS)
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.checkpoint = checkpoint
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._counters = {
+            "texts": 0,
+            "tokens": 0,
+            "requests": 0,
+            "retries": 0,
+            "failed_requests": 0,
+            "truncated_inputs": 0,
+            "checkpoint_hits": 0
+        }
+        self._embed_seconds = 0.0
+        self._in_flight = 0
+
+    async def _prepare(self, texts: List[str]) -> List[int]:
+        """Token count of each text, truncating (in place) oversized inputs"""
+        counts, truncated = await run_in_cpu_pool(self.truncate_fn, texts, MAX_INPUT_TOKENS)
+        for i, text in truncated.items():
+            texts[i] = text
+        self._counters["truncated_inputs"] += len(truncated)
+        return counts
+
+    async def _request(self, texts: List[str]) -> List[List[float]]:
+        """One packed request, retried with backoff"""
+        attempt = 1
+        while True:
+            try:
+                async with self._semaphore:
+                    self._in_flight += 1
+                    try:
+                        self._counters["requests"] += 1
+                        return await self.embed_fn(texts)
+                    finally:
+                        self._in_flight -= 1
+            except Exception as e:
+                if attempt >= self.max_attempts:
+                    self._counters["failed_requests"] += 1
+                    raise
+                delay = random.uniform(0, min(self.backoff_max_seconds, self.backoff_seconds * (2 ** attempt)))
+                logger.warning(
+                    f"Embedding request of {len(texts)} texts failed (attempt {attempt}/"
+                    f"{self.max_attempts}): {e}; retrying in {delay:.1f}s"
+                )
+                self._counters["retries"] += 1
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def embed(self, texts: List[str], checkpoint_id: Optional[str] = None) -> List[List[float]]:
+        """
+        Embed texts, in order
+
+        Args:
+            texts: Texts to embed
+            checkpoint_id: Resume/save finished requests under this id
+                (the material id); None disables checkpointing
+
+        Returns:
+            One vector per text
+        """
+        if not texts:
+            return []
+        started = time.perf_counter()
+        checkpoint = self.checkpoint if checkpoint_id else None
+        results: List[Optional[List[float]]] = [None] * len(texts)
+
+        keys: List[str] = []
+        todo = list(range(len(texts)))
+        if checkpoint is not None:
+            keys = [self.key_fn(text) for text in texts]
+            saved = await asyncio.to_thread(checkpoint.get_many, checkpoint_id, list(set(keys)))
+            todo = []
+            for i, key in enumerate(keys):
+                if key in saved:
+                    results[i] = saved[key]
+                else:
+                    todo.append(i)
+            self._counters["checkpoint_hits"] += len(texts) - len(todo)
+
+        pending = [texts[i] for i in todo]
+        counts = await self._prepare(pending)
+
+        async def run(batch: List[int]) -> None:
+            vectors = await self._request([pending[j] for j in batch])
+            for j, vector in zip(batch, vectors):
+                results[todo[j]] = vector
+            if checkpoint is not None:
+                await asyncio.to_thread(
+                    checkpoint.put_many,
+                    checkpoint_id,
+                    {keys[todo[j]]: vector for j, vector in zip(batch, vectors)}
+                )
+
+        tasks = [
+            asyncio.ensure_future(run(batch))
+            for batch in pack_batches(counts, self.max_batch_tokens)
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # One request failed for good: the others stop, but whatever
+            # already finished stays checkpointed for the next run
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        self._counters["texts"] += len(pending)
+        self._counters["tokens"] += sum(counts)
+        self._embed_seconds += time.perf_counter() - started
+        return results
+
+    def clear_checkpoint(self, checkpoint_id: str) -> int:
+        if self.checkpoint is None:
+            return 0
+        return self.checkpoint.clear(checkpoint_id)
+
+    def stats(self) -> Dict:
+        """Counters and throughput (embedded texts per second of embedding time)"""
+        return {
+            **self._counters,
+            "in_flight": self._in_flight,
+            "concurrency": self.concurrency,
+            "max_batch_tokens": self.max_batch_tokens,
+            "chunks_per_second": (
+                round(self._counters["texts"] / self._embed_seconds, 1) if self._embed_seconds else 0.0
+            )
+        }
@@ -0,0 +1,216 @@
+"""
+Embedding Cache Service
+Two-tier cache for OpenAI embeddings: in-process LRU with TTL, plus an
+optional SQLite tier that survives restarts
+"""
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Expired disk rows are swept at least this often
+DISK_PRUNE_INTERVAL_SECONDS = 3600
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize a question so trivial variations share a cache entry
+    (unicode form, surrounding/repeated whitespace and case)
+    """
+    text = unicodedata.normalize("NFC", text)
+    return " ".join(text.split()).casefold()
+
+
+class EmbeddingCache:
+    """
+    LRU + TTL embedding cache keyed by (model, text)
+
+    The memory tier holds the vectors as returned by the API. The disk tier
+    stores them as float32 blobs in SQLite; disk hits are promoted to memory.
+    Expired disk rows are swept periodically and the oldest rows are evicted
+    beyond disk_max_entries (0 = unbounded).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        ttl_seconds: int = 7 * 24 * 3600,
+        disk_path: Optional[str] = None,
+        disk_max_entries: int = 100000
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_max_entries = disk_max_entries
+        self._entries: "OrderedDict[str, Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk: Optional[sqlite3.Connection] = None
+        # Upper bound of the disk rows since the last prune (replaced keys count twice)
+        self._disk_rows = 0
+        self._pruned_at = 0.0
+        self._counters = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "disk_evictions": 0
+        }
+
+        if disk_path:
+            try:
+                self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+                self._disk.execute("PRAGMA journal_mode=WAL")
+                self._disk.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "key TEXT PRIMARY KEY, embedding BLOB NOT NULL, created_at REAL NOT NULL)"
+                )
+                self._disk.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_embeddings_created_at ON embeddings(created_at)"
+                )
+                self._disk.commit()
+                self._prune_disk(time.time())
+                logger.info(f"Embedding disk cache enabled: {disk_path}")
+            except sqlite3.Error as e:
+                logger.warning(f"Embedding disk cache disabled: {e}")
+                self._disk = None
+
+    @staticmethod
+    def make_key(text: str, model: str) -> str:
+        """Build the cache key for a text embedded with a given model"""
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{model}:{digest}"
+
+    def get(self, key: str) -> Optional[List[float]]:
+        """Return a cached embedding or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created_at, embedding = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return embedding
+                del self._entries[key]
+                self._counters["expirations"] += 1
+
+            if self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT embedding, created_at FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    blob, created_at = row
+                    if now - created_at <= self.ttl_seconds:
+                        embedding = array("f", blob).tolist()
+                        self._store_memory(key, created_at, embedding)
+                        self._counters["disk_hits"] += 1
+                        return embedding
+                    self._disk.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+                    self._disk.commit()
+                    self._counters["expirations"] += 1
+
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, key: str, embedding: List[float]) -> None:
+        """Store an embedding in both tiers"""
+        self.put_many({key: embedding})
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        """Store several embeddings (one disk transaction)"""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            for key, embedding in items.items():
+                self._store_memory(key, now, embedding)
+            if self._disk is not None:
+                try:
+                    self._disk.executemany(
+                        "INSERT OR REPLACE INTO embeddings (key, embedding, created_at) VALUES (?, ?, ?)",
+                        [(key, array("f", embedding).tobytes(), now) for key, embedding in items.items()]
+                    )
+                    self._disk.commit()
+                    self._disk_rows += len(items)
+                    over_cap = self.disk_max_entries and self._disk_rows > self.disk_max_entries
+                    if over_cap or now - self._pruned_at >= DISK_PRUNE_INTERVAL_SECONDS:
+                        self._prune_disk(now)
+                except sqlite3.Error as e:
+                    logger.warning(f"Embedding disk cache write failed: {e}")
+
+    def _prune_disk(self, now: float) -> None:
+        """
+        Drop expired disk rows, then the oldest ones above disk_max_entries
+        (down to 90% of it, so a full cache is not pruned on every write)
+        """
+        expired = self._disk.execute(
+            "DELETE FROM embeddings WHERE created_at < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        self._counters["expirations"] += expired
+        rows = self._disk.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if self.disk_max_entries and rows > self.disk_max_entries:
+            excess = rows - int(self.disk_max_entries * 0.9)
+            self._disk.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY created_at LIMIT ?)",
+                (excess,)
+            )
+            self._counters["disk_evictions"] += excess
+            rows -= excess
+        self._disk.commit()
+        self._disk_rows = rows
+        self._pruned_at = now
+
+    def _store_memory(self, key: str, created_at: float, embedding: List[float]) -> None:
+        self._entries[key] = (created_at, embedding)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def clear(self) -> None:
+        """Drop every entry from both tiers"""
+        with self._lock:
+            self._entries.clear()
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM embeddings")
+                self._disk.commit()
+                self._disk_rows = 0
+
+    def stats(self) -> Dict:
+        """Hit/miss/eviction counters and current size"""
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["disk_hits"] + self._counters["misses"]
+            hits = self._counters["hits"] + self._counters["disk_hits"]
+            return {
+                **self._counters,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "disk_enabled": self._disk is not None,
+                "disk_rows": self._disk_rows if self._disk is not None else 0,
+                "disk_max_entries": self.disk_max_entries,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0
+            }
+
+
+# Shared cache instance (None when disabled)
+embedding_cache: Optional[EmbeddingCache] = (
+    EmbeddingCache(
+        max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+        ttl_seconds=settings.EMBEDDING_CACHE_TTL_SECONDS,
+        disk_path=settings.EMBEDDING_CACHE_DISK_PATH or None,
+        disk_max_entries=settings.EMBEDDING_CACHE_DISK_MAX_ENTRIES
+    )
+    if settings.EMBEDDING_CACHE_ENABLED
+    else None
+)
@@ -0,0 +1,100 @@
+"""
+Embedding Dispatcher Service
+Coalesces concurrent single-text embedding requests (one per RAG query)
+into batched API calls and deduplicates identical in-flight texts
+"""
+
+import asyncio
+import logging
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+EmbedFn = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+
+class EmbeddingDispatcher:
+    """
+    Micro-batcher in front of a batch embedding function
+
+    The first request opens a window of `window_ms`; every text submitted
+    before it closes (or until `max_batch` texts are queued) is sent in one
+    API call, and each caller gets its own vector back. A text already
+    waiting for a batch is not queued twice.
+    """
+
+    def __init__(self, embed_fn: EmbedFn, window_ms: float = 8.0, max_batch: int = 64):
+        self.embed_fn = embed_fn
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._pending: List[str] = []
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._batch_sizes: Counter = Counter()
+        self._counters = {"requests": 0, "deduplicated": 0, "batches": 0, "failed_batches": 0}
+
+    async def embed(self, text: str) -> List[float]:
+        """Embed one text, sharing the API call with concurrent requests"""
+        loop = asyncio.get_running_loop()
+        self._counters["requests"] += 1
+
+        future = self._inflight.get(text)
+        if future is not None:
+            self._counters["deduplicated"] += 1
+        else:
+            future = loop.create_future()
+            self._inflight[text] = future
+            self._pending.append(text)
+            if len(self._pending) >= self.max_batch:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self._flush)
+
+        # Shield: a cancelled caller must not cancel the shared result
+        return await asyncio.shield(future)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        asyncio.ensure_future(self._run_batch(batch))
+
+    async def _run_batch(self, batch: List[str]) -> None:
+        self._counters["batches"] += 1
+        self._batch_sizes[len(batch)] += 1
+        try:
+            vectors = await self.embed_fn(batch)
+            if len(vectors) != len(batch):
+                # Texts without a vector would wait in _inflight forever
+                raise ValueError(f"Embedding batch of {len(batch)} texts returned {len(vectors)} vectors")
+            for text, vector in zip(batch, vectors):
+                future = self._inflight.pop(text)
+                if not future.done():
+                    future.set_result(vector)
+        except Exception as e:
+            self._counters["failed_batches"] += 1
+            for text in batch:
+                future = self._inflight.pop(text, None)
+                if future is not None and not future.done():
+                    future.set_exception(e)
+                    # Mark retrieved so an abandoned future does not warn
+                    future.exception()
+
+    def stats(self) -> Dict:
+        """Request/batch counters and achieved batch sizes"""
+        batches = self._counters["batches"]
+        texts = sum(size * count for size, count in self._batch_sizes.items())
+        return {
+            **self._counters,
+            "avg_batch_size": round(texts / batches, 2) if batches else 0.0,
+            "max_batch_size": max(self._batch_sizes) if self._batch_sizes else 0,
+            "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch
+        }
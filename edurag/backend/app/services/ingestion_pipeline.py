@@ -0,0 +1,317 @@
+"""
+Ingestion Pipeline Service
+Streaming PDF ingestion: page iterator -> incremental chunker -> batched
+embedder -> batched writer, connected by bounded queues so memory stays
+flat regardless of document size and chunks become searchable as soon as
+their batch is written. Pages without a usable text layer are OCR'd in
+the OCR process pool while the following pages keep being read.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.database import MaterialChunkLoader, fetch_material_info, insert_material_chunks
+from app.services.bm25_index import bm25_index
+from app.services.cpu_pool import cpu_pool_size, run_in_cpu_pool
+from app.services.near_duplicates import DedupeFn
+from app.services.ocr_service import OCR_AVAILABLE, OCR_METHOD, ocr_worker_count, submit_ocr_pages
+from app.services.pdf_processor import PAGE_MARKER, TokenChunker, build_chunk_records, generate_embeddings
+from app.services.pdf_text import extract_page_range, page_count, tokenize
+
+logger = logging.getLogger(__name__)
+
+
+# End-of-stream marker passed through the queues
+_DONE = object()
+
+WriteFn = Callable[[List[Dict], List[Optional[List[float]]]], Awaitable[int]]
+ProgressFn = Callable[[Dict], Awaitable[None]]
+
+
+async def iter_pdf_pages(file_path: str, ocr: Optional[bool] = None) -> AsyncIterator[Tuple[int, Dict]]:
+    """
+    Yield (total_pages, page) in page order
+
+    Text extraction and tokenization run in the CPU pool, in page ranges of
+    CPU_POOL_PAGES_PER_TASK (up to two ranges per worker ahead), so one
+    document uses several cores and the event loop only moves results.
+    Each page is classified on its own: pages with a text layer use it,
+    pages that are essentially a scanned image are sent to the OCR pool
+    while reading continues (up to two pages per OCR worker ahead), so OCR
+    cost is proportional to the pages that need it.
+
+    Args:
+        file_path: Path to PDF file
+        ocr: OCR pages without a text layer (default OCR_ENABLED, if the
+            OCR dependencies are installed)
+
+    Yields:
+        total_pages and a dict with page, text, ocr_used and tokens/offsets
+        (tokenize(PAGE_MARKER + text), None for empty pages)
+    """
+    use_ocr = (settings.OCR_ENABLED and OCR_AVAILABLE) if ocr is None else ocr
+    lookahead = 2 * ocr_worker_count() if use_ocr else 1
+    range_size = max(1, settings.CPU_POOL_PAGES_PER_TASK)
+    range_lookahead = 2 * cpu_pool_size()
+    total_pages = await run_in_cpu_pool(page_count, file_path)
+    next_page = 1
+    # Page ranges being extracted, in order
+    ranges: Deque[asyncio.Future] = deque()
+    # (page, pending OCR or None)
+    pending: Deque[Tuple[Dict, Optional[asyncio.Future]]] = deque()
+
+    def submit_ranges() -> None:
+        nonlocal next_page
+        while next_page <= total_pages and len(ranges) < range_lookahead:
+            last_page = min(next_page + range_size - 1, total_pages)
+            ranges.append(asyncio.ensure_future(
+                run_in_cpu_pool(extract_page_range, file_path, next_page, last_page, use_ocr, True)
+            ))
+            next_page = last_page + 1
+
+    def head_ready() -> bool:
+        ocr_task = pending[0][1]
+        return ocr_task is None or ocr_task.done()
+
+    async def pop_head() -> Dict:
+        page, ocr_task = pending.popleft()
+        page["ocr_used"] = False
+        if ocr_task is not None:
+            try:
+                [result] = await ocr_task
+                page["text"], page["ocr_used"] = result["text"], True
+            except Exception as e:
+                logger.warning(f"OCR of page {page['page']} failed, using its text layer: {e}")
+        if page["tokens"] is None and page["text"]:
+            # OCR'd pages (or their fallback) were not tokenized with the range
+            page["tokens"], page["offsets"] = await run_in_cpu_pool(
+                tokenize, PAGE_MARKER.format(page=page["page"]) + page["text"]
+            )
+        return page
+
+    try:
+        submit_ranges()
+        while ranges:
+            extracted = await ranges.popleft()
+            submit_ranges()
+            for page in extracted:
+                ocr_task = submit_ocr_pages(file_path, page["page"], page["page"]) if page["needs_ocr"] else None
+                pending.append((page, ocr_task))
+                while pending and (len(pending) >= lookahead or head_ready()):
+                    yield total_pages, await pop_head()
+        while pending:
+            yield total_pages, await pop_head()
+    finally:
+        for task in ranges:
+            task.cancel()
+        for _, ocr_task in pending:
+            if ocr_task is not None:
+                ocr_task.cancel()
+
+
+def default_writer(material_id: str, loader: Optional[MaterialChunkLoader] = None) -> WriteFn:
+    """
+    Writer that inserts a batch into material_chunks and the BM25 index
+
+    With a loader, batches are COPY'd into its transaction (visible at
+    commit) and the first batch replaces the material's previous BM25
+    postings; without one each batch is inserted on its own. Chunks linked
+    to a near-duplicate are not indexed in BM25 (their canonical row is).
+    """
+    material_info: Optional[Dict] = None
+
+    async def write(chunks: List[Dict], embeddings: List[Optional[List[float]]]) -> int:
+        nonlocal material_info
+        records = build_chunk_records(material_id, chunks, embeddings)
+        if loader is not None:
+            stored = await loader.copy(records)
+        else:
+            stored = await insert_material_chunks(records)
+        if bm25_index is not None:
+            first_batch = material_info is None
+            if first_batch:
+                material_info = await fetch_material_info(material_id) or {}
+            index = bm25_index.add_material if first_batch and loader is not None else bm25_index.append_chunks
+            canonical = [record for record in records if not record.get("canonical_chunk_id")]
+            await asyncio.to_thread(index, material_id, material_info, canonical)
+        return stored
+
+    return write
+
+
+async def _run_stages(*stages: Awaitable) -> None:
+    """Run pipeline stages concurrently; the first failure cancels the rest"""
+    tasks = [asyncio.ensure_future(stage) for stage in stages]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            if task.exception() is not None:
+                raise task.exception()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def run_ingestion_pipeline(
+    file_path: str,
+    material_id: str,
+    chunk_size: Optional[int] = None,
+    chunk_overlap: Optional[int] = None,
+    write_batch: Optional[WriteFn] = None,
+    on_batch_written: Optional[ProgressFn] = None,
+    on_progress: Optional[ProgressFn] = None,
+    batch_size: Optional[int] = None,
+    queue_size: Optional[int] = None,
+    embed_concurrency: Optional[int] = None,
+    dedupe: Optional[DedupeFn] = None
+) -> Dict:
+    """
+    Extract, chunk, embed and store a PDF as a stream of batches
+
+    Args:
+        file_path: Path to PDF file
+        material_id: UUID of the material
+        chunk_size: Chunk size in tokens (default RAG_CHUNK_SIZE)
+        chunk_overlap: Overlap between chunks in tokens (default RAG_CHUNK_OVERLAP)
+        write_batch: Stores (chunks, embeddings), returns rows written
+            (default: material_chunks + BM25 index)
+        on_batch_written: Called with the running stats after each batch
+        on_progress: Called with the running stats after every page read,
+            batch embedded and batch written
+        batch_size: Chunks per embedding request / insert (INGEST_BATCH_SIZE)
+        queue_size: Max items waiting between stages (INGEST_QUEUE_SIZE)
+        embed_concurrency: Batches embedded at once (INGEST_EMBED_CONCURRENCY);
+            they are still written in order
+        dedupe: Marks each batch before embedding (NearDuplicateIndex.deduplicator);
+            chunks given a canonical_chunk_id are stored without an embedding
+
+    Returns:
+        Stats: total_pages, total_chars, total_tokens, text_chars, chunks,
+        batches, first_chunk_seconds, elapsed_seconds, chunks_per_second,
+        pages_extracted, ocr_pages (page numbers OCR'd), chunks_created,
+        chunks_embedded, duplicate_chunks
+    """
+    chunk_size = chunk_size or settings.RAG_CHUNK_SIZE
+    chunk_overlap = chunk_overlap if chunk_overlap is not None else settings.RAG_CHUNK_OVERLAP
+    batch_size = batch_size or settings.INGEST_BATCH_SIZE
+    queue_size = queue_size or settings.INGEST_QUEUE_SIZE
+    embed_concurrency = embed_concurrency or settings.INGEST_EMBED_CONCURRENCY
+    write_batch = write_batch or default_writer(material_id)
+
+    started = time.perf_counter()
+    stats = {
+        "total_pages": 0,
+        "total_chars": 0,
+        "total_tokens": 0,
+        "text_chars": 0,
+        "chunks": 0,
+        "batches": 0,
+        "first_chunk_seconds": None,
+        "elapsed_seconds": None,
+        "chunks_per_second": None,
+        "pages_extracted": 0,
+        "ocr_pages": [],
+        "chunks_created": 0,
+        "chunks_embedded": 0,
+        "duplicate_chunks": 0
+    }
+    pages: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    batches: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    embedded: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    ocr_pages = set()
+
+    async def progress():
+        if on_progress is not None:
+            await on_progress(stats)
+
+    async def read_pages():
+        async for total_pages, page in iter_pdf_pages(file_path):
+            stats["total_pages"] = total_pages
+            stats["pages_extracted"] = page["page"]
+            if page["ocr_used"]:
+                stats["ocr_pages"].append(page["page"])
+                ocr_pages.add(page["page"])
+            await progress()
+            await pages.put(page)
+        await pages.put(_DONE)
+
+    def tag_ocr_chunks(chunks: List[Dict]) -> List[Dict]:
+        # Chunks starting on an OCR'd page say so (pages arrive in order)
+        for chunk in chunks:
+            if chunk["metadata"]["page"] in ocr_pages:
+                chunk["metadata"]["extraction_method"] = OCR_METHOD
+        return chunks
+
+    def chunk_page(chunker: TokenChunker, page: Dict) -> List[Dict]:
+        page_number, text = page["page"], page["text"]
+        tokenized = (page["tokens"], page["offsets"]) if page["tokens"] is not None else None
+        chunks = tag_ocr_chunks(chunker.add_page(page_number, text, tokenized))
+        if text:
+            stats["total_chars"] += len(PAGE_MARKER.format(page=page_number)) + len(text)
+            stats["total_tokens"] = chunker.total_tokens
+            stats["text_chars"] += len(text.strip())
+        stats["chunks_created"] = chunker.next_index
+        return chunks
+
+    async def chunk_pages():
+        chunker = TokenChunker(chunk_size, chunk_overlap, {"extraction_method": "pdfplumber"})
+        pending: List[Dict] = []
+        while (item := await pages.get()) is not _DONE:
+            pending.extend(await asyncio.to_thread(chunk_page, chunker, item))
+            while len(pending) >= batch_size:
+                await batches.put(pending[:batch_size])
+                pending = pending[batch_size:]
+        pending.extend(tag_ocr_chunks(await asyncio.to_thread(chunker.finish)))
+        stats["chunks_created"] = chunker.next_index
+        for i in range(0, len(pending), batch_size):
+            await batches.put(pending[i:i + batch_size])
+        await batches.put(_DONE)
+
+    async def embed_batch(batch: List[Dict]) -> Tuple[List[Dict], List[Optional[List[float]]]]:
+        if dedupe is not None:
+            await dedupe(batch)
+        texts = [chunk["chunk_text"] for chunk in batch if not chunk.get("canonical_chunk_id")]
+        vectors = iter(await generate_embeddings(texts, checkpoint_id=material_id) if texts else [])
+        embeddings = [None if chunk.get("canonical_chunk_id") else next(vectors) for chunk in batch]
+        stats["chunks_embedded"] += len(batch)
+        stats["duplicate_chunks"] += len(batch) - len(texts)
+        await progress()
+        return batch, embeddings
+
+    async def embed_batches():
+        # Up to embed_concurrency batches in flight, handed on in order
+        in_flight: Deque[asyncio.Future] = deque()
+        try:
+            while (batch := await batches.get()) is not _DONE:
+                in_flight.append(asyncio.ensure_future(embed_batch(batch)))
+                if len(in_flight) >= embed_concurrency:
+                    await embedded.put(await in_flight.popleft())
+            while in_flight:
+                await embedded.put(await in_flight.popleft())
+        finally:
+            for task in in_flight:
+                task.cancel()
+            await asyncio.gather(*in_flight, return_exceptions=True)
+        await embedded.put(_DONE)
+
+    async def write_batches():
+        while (item := await embedded.get()) is not _DONE:
+            stats["chunks"] += await write_batch(*item)
+            stats["batches"] += 1
+            if stats["first_chunk_seconds"] is None:
+                stats["first_chunk_seconds"] = round(time.perf_counter() - started, 3)
+            if on_batch_written is not None:
+                await on_batch_written(stats)
+            await progress()
+
+    await _run_stages(read_pages(), chunk_pages(), embed_batches(), write_batches())
+    elapsed = time.perf_counter() - started
+    stats["elapsed_seconds"] = round(elapsed, 3)
+    stats["chunks_per_second"] = round(stats["chunks"] / elapsed, 1) if elapsed else None
+    return stats
@@ -0,0 +1,314 @@
+"""
+Ingestion Worker Service
+Claims jobs from the durable job queue and runs them with bounded
+concurrency, keeping each job's lease alive while it runs. Runs as its own
+process (python -m app.worker) or embedded in the web process
+(JOB_WORKER_EMBEDDED).
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import tempfile
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.database import fetch_material, update_material
+from app.services.job_queue import DEAD, PROCESS_PDF, QUEUED, job_queue
+from app.services.pdf_processor import process_pdf_file
+from app.services.progress_store import progress_store
+from app.services.storage import download_pdf_from_storage, upload_pdf_file_to_storage
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Dict], Awaitable[None]]
+
+
+def spool_path(material_id: str) -> str:
+    """Where an upload waits for its job (survives restarts, unlike /tmp)"""
+    os.makedirs(settings.JOB_SPOOL_DIR, exist_ok=True)
+    return os.path.join(settings.JOB_SPOOL_DIR, f"{material_id}.pdf")
+
+
+def enqueue_pdf_processing(material_id: str, storage_path: str, file_path: Optional[str] = None) -> int:
+    """
+    Queue processing of a material's PDF
+
+    Args:
+        material_id: UUID of the material
+        storage_path: Path of the PDF in Supabase Storage. If the material
+            has no file_url yet, the job uploads the spooled copy there while
+            processing it; otherwise it is read from there when the spooled
+            copy is gone (e.g. requeue from another host)
+        file_path: Local copy of the PDF, if any
+
+    Returns:
+        Job id (an already queued/running job for the material is reused)
+    """
+    active = job_queue.find_active(PROCESS_PDF, "material_id", material_id)
+    if active is not None:
+        return active["id"]
+    if progress_store is not None:
+        progress_store.reset(material_id, "queued")
+    return job_queue.enqueue(PROCESS_PDF, {
+        "material_id": material_id,
+        "storage_path": storage_path,
+        "file_path": file_path
+    })
+
+
+async def cancel_pdf_processing(material_id: str) -> List[int]:
+    """
+    Cancel a material's queued or running processing job (material deleted)
+
+    A job run by the embedded worker stops right away, one run by another
+    process at its next heartbeat. Returns the cancelled job ids.
+    """
+    jobs = await asyncio.to_thread(job_queue.cancel_active, PROCESS_PDF, "material_id", material_id)
+    for job in jobs:
+        # Task cancellation must happen on the event loop, not in the thread
+        if _embedded_worker is not None:
+            _embedded_worker.cancel(job["id"])
+        await asyncio.to_thread(_remove_file, job["payload"].get("file_path"))
+    return [job["id"] for job in jobs]
+
+
+def _remove_file(path: Optional[str]) -> None:
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+async def _store_spooled_file(material_id: str, file_path: str, storage_path: str) -> None:
+    await upload_pdf_file_to_storage(file_path, storage_path)
+    await update_material(material_id, {"file_url": storage_path})
+    logger.info(f"PDF stored: {storage_path}")
+
+
+async def _process_pdf(material_id: str, file_path: Optional[str], storage_path: str) -> None:
+    downloaded = None
+    if not file_path:
+        content = await download_pdf_from_storage(storage_path)
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
+            temp_file.write(content)
+        downloaded = temp_file.name
+    try:
+        result = await process_pdf_file(downloaded or file_path, material_id)
+        logger.info(f"PDF processing completed: {result['chunks_created']} chunks created")
+    finally:
+        _remove_file(downloaded)
+
+
+async def process_pdf_job(payload: Dict) -> None:
+    """
+    Process a material's PDF from the spool, or downloaded from storage
+
+    A spooled upload not yet in storage is uploaded concurrently with the
+    extraction; a retry only redoes the part that has not finished.
+    """
+    material_id = payload["material_id"]
+    storage_path = payload["storage_path"]
+    file_path = payload.get("file_path")
+    if file_path and not os.path.exists(file_path):
+        file_path = None
+
+    material = await fetch_material(material_id, "processing_status, file_url")
+    if material is None:
+        logger.info(f"Material {material_id} no longer exists, skipping its job")
+        return
+
+    steps = []
+    if not material.get("file_url"):
+        if not file_path:
+            raise Exception("PDF is neither spooled on this host nor in storage")
+        steps.append(_store_spooled_file(material_id, file_path, storage_path))
+    if material.get("processing_status") != "completed":
+        steps.append(_process_pdf(material_id, file_path, storage_path))
+
+    results = await asyncio.gather(*steps, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+
+HANDLERS: Dict[str, Handler] = {
+    PROCESS_PDF: process_pdf_job
+}
+
+
+async def _job_finished(job: Dict, status: str) -> None:
+    """Side effects of a job reaching a new state"""
+    if job["kind"] != PROCESS_PDF:
+        return
+    payload = job["payload"]
+    if status == QUEUED:
+        # Waiting for a retry, not failed yet
+        await update_material(payload["material_id"], {"processing_status": "pending"})
+        if progress_store is not None:
+            await asyncio.to_thread(progress_store.reset, payload["material_id"], "queued")
+    elif status == DEAD and not await _stored_in_storage(payload["material_id"]):
+        # The spooled upload is the only copy: kept for `python -m app.worker requeue`
+        logger.warning(
+            f"Keeping spooled upload {payload.get('file_path')} of dead-lettered material "
+            f"{payload['material_id']}: it never reached storage"
+        )
+    else:
+        # Done, or dead-lettered with the PDF in storage: the spool is no longer needed
+        _remove_file(payload.get("file_path"))
+
+
+async def _stored_in_storage(material_id: str) -> bool:
+    """Whether the material's PDF is confirmed in storage (file_url set) or the material is gone"""
+    try:
+        material = await fetch_material(material_id, "file_url")
+    except Exception as e:
+        logger.error(f"Could not check storage of material {material_id}: {e}")
+        return False
+    return material is None or bool(material.get("file_url"))
+
+
+class IngestionWorker:
+    """Polls the job queue and runs up to `concurrency` jobs at once"""
+
+    def __init__(
+        self,
+        concurrency: int = 2,
+        lease_seconds: float = 300.0,
+        poll_interval: float = 2.0,
+        worker_id: Optional[str] = None
+    ):
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._stopping = asyncio.Event()
+        self._slots: Set[asyncio.Task] = set()
+        # job id -> (work task, released event) of the jobs running here
+        self._running: Dict[int, Tuple[asyncio.Task, asyncio.Event]] = {}
+
+    async def _keep_lease(self, job: Dict, task: asyncio.Task, released: asyncio.Event) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            alive = await asyncio.to_thread(job_queue.heartbeat, job["id"], self.worker_id, self.lease_seconds)
+            if not alive:
+                # Cancelled, or another worker may already have it: stop doing the work twice
+                logger.warning(f"Lost lease on job {job['id']}, cancelling it")
+                released.set()
+                task.cancel()
+                return
+
+    def cancel(self, job_id: int) -> bool:
+        """Stop a job running here that was cancelled in the queue"""
+        running = self._running.get(job_id)
+        if running is None:
+            return False
+        work, released = running
+        released.set()
+        work.cancel()
+        return True
+
+    async def _run_job(self, job: Dict) -> None:
+        handler = HANDLERS.get(job["kind"])
+        logger.info(f"Job {job['id']} ({job['kind']}) attempt {job['attempts']}/{job['max_attempts']}")
+        work = asyncio.ensure_future(handler(job["payload"]) if handler else self._unknown(job))
+        released = asyncio.Event()
+        self._running[job["id"]] = (work, released)
+        lease = asyncio.ensure_future(self._keep_lease(job, work, released))
+        try:
+            await work
+        except asyncio.CancelledError:
+            if not released.is_set():
+                raise
+            return  # the job was cancelled or belongs to another worker now
+        except Exception as e:
+            status = await asyncio.to_thread(job_queue.fail, job, self.worker_id, str(e))
+            if status is None:
+                logger.info(f"Job {job['id']} failed after it was cancelled: {e}")
+                return
+            if status == DEAD:
+                logger.error(f"Job {job['id']} dead-lettered after {job['attempts']} attempts: {e}")
+            else:
+                logger.warning(f"Job {job['id']} failed, will retry: {e}")
+            await _job_finished(job, status)
+            return
+        finally:
+            lease.cancel()
+            self._running.pop(job["id"], None)
+        if await asyncio.to_thread(job_queue.complete, job["id"], self.worker_id):
+            await _job_finished(job, "done")
+
+    @staticmethod
+    async def _unknown(job: Dict) -> None:
+        raise Exception(f"No handler for job kind {job['kind']!r}")
+
+    async def _slot(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                job = await asyncio.to_thread(job_queue.claim, self.worker_id, self.lease_seconds)
+            except Exception as e:
+                logger.error(f"Claiming a job failed: {e}")
+                job = None
+            for dead in await asyncio.to_thread(job_queue.take_expired):
+                logger.error(f"Job {dead['id']} dead-lettered: lease expired on attempt {dead['attempts']}")
+                try:
+                    await _job_finished(dead, DEAD)
+                except Exception as e:
+                    logger.error(f"Dead-lettering job {dead['id']} failed: {e}")
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job {job['id']} crashed the worker slot: {e}")
+
+    async def run(self) -> None:
+        """Run until stop(); jobs already started are finished first"""
+        logger.info(f"Ingestion worker {self.worker_id} started (concurrency={self.concurrency})")
+        self._slots = {asyncio.ensure_future(self._slot()) for _ in range(self.concurrency)}
+        try:
+            await asyncio.gather(*self._slots)
+        finally:
+            logger.info(f"Ingestion worker {self.worker_id} stopped")
+
+    def stop(self) -> None:
+        """Stop claiming jobs (running jobs finish; unfinished leases expire)"""
+        self._stopping.set()
+
+
+_embedded_worker: Optional[IngestionWorker] = None
+_embedded_task: Optional[asyncio.Task] = None
+
+
+def create_worker(concurrency: Optional[int] = None) -> IngestionWorker:
+    return IngestionWorker(
+        concurrency=concurrency or settings.JOB_WORKER_CONCURRENCY,
+        lease_seconds=settings.JOB_LEASE_SECONDS,
+        poll_interval=settings.JOB_POLL_INTERVAL_SECONDS
+    )
+
+
+async def start_embedded_worker() -> None:
+    """Run a worker inside the web process when JOB_WORKER_EMBEDDED is set"""
+    global _embedded_worker, _embedded_task
+    if not settings.JOB_WORKER_EMBEDDED:
+        return
+    _embedded_worker = create_worker()
+    _embedded_task = asyncio.create_task(_embedded_worker.run())
+
+
+async def stop_embedded_worker() -> None:
+    """Stop claiming jobs; a job still running is cancelled and its lease expires"""
+    global _embedded_worker, _embedded_task
+    if _embedded_task is None:
+        return
+    _embedded_worker.stop()
+    _embedded_task.cancel()
+    await asyncio.gather(_embedded_task, return_exceptions=True)
+    _embedded_worker = None
+    _embedded_task = None
@@ -0,0 +1,291 @@
+"""
+Job Queue Service
+Durable SQLite-backed job queue shared by the web process (enqueue) and
+ingestion workers (claim/complete). Claimed jobs hold a lease; a job whose
+lease expires (worker crashed or was redeployed) becomes visible again.
+Failed jobs are retried with backoff and dead-lettered after max_attempts.
+A cancelled job loses its lease, so the worker running it stops.
+"""
+
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+DEAD = "dead"
+CANCELLED = "cancelled"
+
+PROCESS_PDF = "process_pdf"
+
+
+class JobQueue:
+    """
+    Durable job queue with leases (visibility timeouts)
+
+    Every process opens the same SQLite file; claims run in an IMMEDIATE
+    transaction so two workers never get the same job. `attempts` counts
+    claims, so a job that keeps crashing its worker is dead-lettered too.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_attempts: int = 3,
+        backoff_seconds: float = 30.0,
+        backoff_max_seconds: float = 900.0
+    ):
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self._lock = threading.Lock()
+        # Jobs dead-lettered by claim() in this process, see take_expired()
+        self._expired: List[Dict] = []
+        # Autocommit mode: transactions are opened explicitly
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                available_at REAL NOT NULL,
+                lease_expires_at REAL,
+                worker_id TEXT,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, available_at);
+            """
+        )
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def enqueue(self, kind: str, payload: Dict, max_attempts: Optional[int] = None, delay: float = 0.0) -> int:
+        """Add a job, returns its id"""
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO jobs (kind, payload, status, max_attempts, available_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (kind, json.dumps(payload), QUEUED, max_attempts or self.max_attempts, now + delay, now, now)
+            )
+        return cursor.lastrowid
+
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[Dict]:
+        """
+        Lease the next available job: queued and due, or running with an
+        expired lease
+
+        A job whose lease expired on its last attempt (worker crashed,
+        killed or hung) never reached fail(); it is dead-lettered here
+        instead of being claimed again, and handed out by take_expired().
+
+        Returns:
+            The job (attempts already incremented), or None
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                expired = self._db.execute(
+                    "SELECT * FROM jobs WHERE status = ? AND lease_expires_at < ? AND attempts >= max_attempts",
+                    (RUNNING, now)
+                ).fetchall()
+                self._db.executemany(
+                    "UPDATE jobs SET status = ?, available_at = ?, lease_expires_at = NULL, last_error = ?, "
+                    "updated_at = ? WHERE id = ?",
+                    [
+                        (DEAD, now, f"Lease expired on attempt {row['attempts']} (worker crashed or timed out)",
+                         now, row["id"])
+                        for row in expired
+                    ]
+                )
+                row = self._db.execute(
+                    "SELECT id FROM jobs "
+                    "WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_expires_at < ?) "
+                    "ORDER BY available_at, id LIMIT 1",
+                    (QUEUED, now, RUNNING, now)
+                ).fetchone()
+                if row is None:
+                    self._db.execute("COMMIT")
+                    self._expired.extend(self._to_dict(dead) for dead in expired)
+                    return None
+                self._db.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_expires_at = ?, "
+                    "worker_id = ?, updated_at = ? WHERE id = ?",
+                    (RUNNING, now + lease_seconds, worker_id, now, row["id"])
+                )
+                job = self._db.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+                self._db.execute("COMMIT")
+                self._expired.extend(self._to_dict(dead) for dead in expired)
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return self._to_dict(job)
+
+    def take_expired(self) -> List[Dict]:
+        """Jobs dead-lettered by claim() since the last call (their side effects are still due)"""
+        with self._lock:
+            expired, self._expired = self._expired, []
+        return expired
+
+    def heartbeat(self, job_id: int, worker_id: str, lease_seconds: float) -> bool:
+        """Extend a lease; False if the job is no longer ours (lease was lost)"""
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET lease_expires_at = ?, updated_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = ?",
+                (now + lease_seconds, now, job_id, worker_id, RUNNING)
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: int, worker_id: str) -> bool:
+        """Mark a job done; False if it is no longer ours (cancelled or re-leased)"""
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = ?, lease_expires_at = NULL, last_error = NULL, updated_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = ?",
+                (DONE, now, job_id, worker_id, RUNNING)
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, job: Dict, worker_id: str, error: str) -> Optional[str]:
+        """
+        Record a failed attempt: retry after a full-jitter backoff, or
+        dead-letter once max_attempts is reached
+
+        Returns:
+            New status (QUEUED or DEAD), None if the job is no longer ours
+        """
+        now = time.time()
+        if job["attempts"] >= job["max_attempts"]:
+            status, available_at = DEAD, now
+        else:
+            delay = random.uniform(
+                self.backoff_seconds,
+                min(self.backoff_max_seconds, self.backoff_seconds * (2 ** job["attempts"]))
+            )
+            status, available_at = QUEUED, now + delay
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = ?, available_at = ?, lease_expires_at = NULL, "
+                "last_error = ?, updated_at = ? WHERE id = ? AND worker_id = ? AND status = ?",
+                (status, available_at, error[:2000], now, job["id"], worker_id, RUNNING)
+            )
+        return status if cursor.rowcount == 1 else None
+
+    def requeue(self, job_id: int) -> bool:
+        """Give a dead job a fresh set of attempts"""
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = ?, attempts = 0, available_at = ?, updated_at = ? "
+                "WHERE id = ? AND status = ?",
+                (QUEUED, now, now, job_id, DEAD)
+            )
+        return cursor.rowcount == 1
+
+    def find_active(self, kind: str, key: str, value: str) -> Optional[Dict]:
+        """A queued or running job whose payload[key] == value"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM jobs WHERE kind = ? AND status IN (?, ?) "
+                "AND json_extract(payload, '$.' || ?) = ? ORDER BY id LIMIT 1",
+                (kind, QUEUED, RUNNING, key, value)
+            ).fetchone()
+        return self._to_dict(row) if row else None
+
+    def cancel_active(self, kind: str, key: str, value: str) -> List[Dict]:
+        """
+        Cancel the queued or running jobs whose payload[key] == value
+
+        A running job's next heartbeat fails, which stops its worker.
+
+        Returns:
+            The cancelled jobs
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    "SELECT * FROM jobs WHERE kind = ? AND status IN (?, ?) "
+                    "AND json_extract(payload, '$.' || ?) = ?",
+                    (kind, QUEUED, RUNNING, key, value)
+                ).fetchall()
+                self._db.executemany(
+                    "UPDATE jobs SET status = ?, lease_expires_at = NULL, last_error = ?, updated_at = ? "
+                    "WHERE id = ?",
+                    [(CANCELLED, "cancelled", now, row["id"]) for row in rows]
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return [self._to_dict(row) for row in rows]
+
+    def list_jobs(self, status: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        with self._lock:
+            if status:
+                rows = self._db.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY id DESC LIMIT ?", (status, limit)
+                ).fetchall()
+            else:
+                rows = self._db.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def purge_done(self, older_than_seconds: float) -> int:
+        """Delete finished (done or cancelled) jobs older than the given age"""
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (DONE, CANCELLED, time.time() - older_than_seconds)
+            )
+        return cursor.rowcount
+
+    def stats(self) -> Dict:
+        """Job counts per status and age of the oldest due job"""
+        now = time.time()
+        with self._lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            oldest = self._db.execute(
+                "SELECT MIN(available_at) FROM jobs WHERE status = ? AND available_at <= ?",
+                (QUEUED, now)
+            ).fetchone()[0]
+        return {
+            **{status: counts.get(status, 0) for status in (QUEUED, RUNNING, DONE, DEAD, CANCELLED)},
+            "oldest_queued_seconds": round(now - oldest, 1) if oldest else 0.0
+        }
+
+
+def _create_job_queue() -> JobQueue:
+    return JobQueue(
+        settings.JOB_QUEUE_PATH,
+        max_attempts=settings.JOB_MAX_ATTEMPTS,
+        backoff_seconds=settings.JOB_BACKOFF_SECONDS
+    )
+
+
+job_queue = _create_job_queue()
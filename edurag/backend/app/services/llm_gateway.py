@@ -0,0 +1,533 @@
+"""
+LLM Gateway Service
+Single entry point for chat completions and embeddings. Every call goes
+through a per-operation concurrency cap, a deadline, retries with
+exponential backoff and jitter on 429/5xx/timeouts, optional hedged
+requests, and a circuit breaker whose open state puts RAG in degraded mode
+"""
+
+import asyncio
+import hashlib
+import logging
+import math
+import random
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from openai import APIConnectionError, APITimeoutError, AsyncOpenAI
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CHAT = "chat"
+EMBEDDINGS = "embeddings"
+
+
+class LLMGatewayError(Exception):
+    """An LLM call failed (after retries), timed out or was rejected"""
+
+
+class CircuitOpenError(LLMGatewayError):
+    """The circuit breaker of the operation is open"""
+
+
+# ============================================================================
+# PROVIDERS
+# ============================================================================
+
+class OpenAIProvider:
+    """OpenAI API (client retries disabled, the gateway owns the policy)"""
+
+    name = "openai"
+
+    def __init__(self, api_key: str):
+        self.client = AsyncOpenAI(api_key=api_key, max_retries=0)
+
+    async def chat(self, messages: List[Dict], model: str, **params) -> str:
+        response = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            **params
+        )
+        return response.choices[0].message.content
+
+    async def chat_stream(self, messages: List[Dict], model: str, **params) -> AsyncIterator[str]:
+        stream = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=True,
+            **params
+        )
+        try:
+            async for event in stream:
+                if event.choices and event.choices[0].delta.content:
+                    yield event.choices[0].delta.content
+        finally:
+            # Aborts the upstream HTTP request
+            await stream.close()
+
+    async def embed(self, texts: List[str], model: str) -> List[List[float]]:
+        response = await self.client.embeddings.create(model=model, input=texts)
+        return [item.embedding for item in response.data]
+
+
+class FakeProviderError(Exception):
+    """Simulated API error (status_code like an OpenAI APIStatusError)"""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"Simulated API error {status_code}")
+        self.status_code = status_code
+
+
+class FakeProvider:
+    """
+    Offline provider for development, load tests and benchmarks
+
+    Latency is uniform in [0.5, 1.5] x `latency`, and `slow_rate` of the
+    calls take `slow_factor` times longer (tail latency); `failure_rate` of
+    the calls raise a retryable 503. Embeddings are deterministic unit
+    vectors derived from the text, so caching and dedup behave as with the
+    real API.
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        failure_rate: float = 0.0,
+        slow_rate: float = 0.0,
+        slow_factor: float = 10.0,
+        dimensions: int = 1536,
+        seed: Optional[int] = None
+    ):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.slow_rate = slow_rate
+        self.slow_factor = slow_factor
+        self.dimensions = dimensions
+        self._random = random.Random(seed)
+
+    async def _simulate(self) -> None:
+        delay = self.latency * self._random.uniform(0.5, 1.5)
+        if self._random.random() < self.slow_rate:
+            delay *= self.slow_factor
+        await asyncio.sleep(delay)
+        if self._random.random() < self.failure_rate:
+            raise FakeProviderError(503)
+
+    def _answer(self, messages: List[Dict]) -> str:
+        question = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        context_chars = sum(len(m["content"]) for m in messages if m["role"] == "system")
+        return f"Respuesta simulada a: {question} ({context_chars} caracteres de contexto)"
+
+    async def chat(self, messages: List[Dict], model: str, **params) -> str:
+        await self._simulate()
+        return self._answer(messages)
+
+    async def chat_stream(self, messages: List[Dict], model: str, **params) -> AsyncIterator[str]:
+        await self._simulate()
+        for word in self._answer(messages).split(" "):
+            await asyncio.sleep(self.latency / 20)
+            yield word + " "
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+        rng = random.Random(seed)
+        vector = [rng.gauss(0.0, 1.0) for _ in range(self.dimensions)]
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    async def embed(self, texts: List[str], model: str) -> List[List[float]]:
+        await self._simulate()
+        return [self._vector(text) for text in texts]
+
+
+# ============================================================================
+# RESILIENCE
+# ============================================================================
+
+def is_retryable(error: BaseException) -> bool:
+    """Rate limits, server errors, timeouts and connection errors"""
+    if isinstance(error, (asyncio.TimeoutError, APITimeoutError, APIConnectionError)):
+        return True
+    status_code = getattr(error, "status_code", None)
+    return status_code is not None and (status_code == 429 or status_code >= 500)
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """Retry-After seconds sent with a 429/503, if any"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker
+
+    closed -> open after `failure_threshold` failed calls in a row; open ->
+    half_open after `reset_seconds`, letting a single probe through; the
+    probe's outcome closes or re-opens the circuit. A probe that never
+    reports back (cancelled caller) is replaced after `reset_seconds`.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_started_at: Optional[float] = None
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "open":
+            return False
+        now = time.monotonic()
+        if self.probe_started_at is None or now - self.probe_started_at >= self.reset_seconds:
+            self.probe_started_at = now
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.probe_started_at is not None or self.failures >= self.failure_threshold:
+            if self.state == "closed":
+                self.times_opened += 1
+            self.opened_at = time.monotonic()
+        self.probe_started_at = None
+
+
+class _Operation:
+    """Concurrency cap, time budget, breaker and counters of one operation"""
+
+    def __init__(self, concurrency: int, timeout: float, deadline: float, breaker: CircuitBreaker):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.deadline = deadline
+        self.breaker = breaker
+        self.in_flight = 0
+        self.counters = {
+            "calls": 0,
+            "failures": 0,
+            "retries": 0,
+            "timeouts": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "rejected": 0
+        }
+
+
+# ============================================================================
+# GATEWAY
+# ============================================================================
+
+class LLMGateway:
+    """
+    Resilient front for an LLM provider
+
+    Each attempt waits for a slot of the operation's semaphore and must
+    finish within `timeout`; retries stop when the next backoff would
+    exceed the call's `deadline`. With `hedge_after` > 0, a non-streaming
+    attempt still running after that many seconds gets a duplicate request
+    (if a slot is free) and the first success wins.
+    """
+
+    def __init__(
+        self,
+        provider,
+        chat_concurrency: int = 16,
+        embedding_concurrency: int = 8,
+        chat_timeout: float = 60.0,
+        embedding_timeout: float = 20.0,
+        chat_deadline: float = 120.0,
+        embedding_deadline: float = 45.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        hedge_after: float = 0.0,
+        breaker_failure_threshold: int = 5,
+        breaker_reset_seconds: float = 30.0
+    ):
+        self.provider = provider
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self._operations = {
+            CHAT: _Operation(
+                chat_concurrency, chat_timeout, chat_deadline,
+                CircuitBreaker(breaker_failure_threshold, breaker_reset_seconds)
+            ),
+            EMBEDDINGS: _Operation(
+                embedding_concurrency, embedding_timeout, embedding_deadline,
+                CircuitBreaker(breaker_failure_threshold, breaker_reset_seconds)
+            )
+        }
+
+    def is_degraded(self, operation: str) -> bool:
+        """True while the operation's circuit is open (calls fail fast)"""
+        return self._operations[operation].breaker.state == "open"
+
+    def _admit(self, op: _Operation, operation: str) -> None:
+        op.counters["calls"] += 1
+        if not op.breaker.allow():
+            op.counters["rejected"] += 1
+            raise CircuitOpenError(f"LLM {operation} circuit open, failing fast")
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        """Full-jitter exponential backoff, at least the server's Retry-After"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    async def _guarded(self, op: _Operation, call: Callable[[], Awaitable]):
+        async with op.semaphore:
+            op.in_flight += 1
+            try:
+                return await call()
+            finally:
+                op.in_flight -= 1
+
+    async def _attempt(self, op: _Operation, call: Callable[[], Awaitable], timeout: float):
+        """One attempt, hedged after `hedge_after` seconds when enabled"""
+        if not self.hedge_after or self.hedge_after >= timeout:
+            return await asyncio.wait_for(self._guarded(op, call), timeout=timeout)
+
+        started = time.monotonic()
+        primary = asyncio.ensure_future(self._guarded(op, call))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+            if not done and not op.semaphore.locked():
+                op.counters["hedges"] += 1
+                tasks.add(asyncio.ensure_future(self._guarded(op, call)))
+            error = None
+            while tasks:
+                remaining = timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                done, tasks = await asyncio.wait(
+                    tasks, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            op.counters["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in (primary, *tasks):
+                if not task.done():
+                    task.cancel()
+
+    async def _call(self, operation: str, call: Callable[[], Awaitable], deadline: Optional[float] = None):
+        op = self._operations[operation]
+        self._admit(op, operation)
+        deadline_at = time.monotonic() + (deadline or op.deadline)
+
+        attempt = 0
+        while True:
+            remaining = deadline_at - time.monotonic()
+            try:
+                result = await self._attempt(op, call, min(op.timeout, remaining))
+                op.breaker.record_success()
+                return result
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    op.counters["timeouts"] += 1
+                retryable = is_retryable(e)
+                if retryable and attempt < self.max_retries:
+                    delay = self._backoff(attempt, e)
+                    if time.monotonic() + delay < deadline_at:
+                        op.counters["retries"] += 1
+                        attempt += 1
+                        logger.warning(f"LLM {operation} attempt {attempt} failed ({e!r}), retrying in {delay:.2f}s")
+                        await asyncio.sleep(delay)
+                        continue
+                op.counters["failures"] += 1
+                if retryable:
+                    op.breaker.record_failure()
+                else:
+                    # Client errors (4xx) say nothing about provider health
+                    op.breaker.record_success()
+                raise LLMGatewayError(f"LLM {operation} failed: {e!r}") from e
+
+    async def chat(
+        self,
+        messages: List[Dict],
+        model: Optional[str] = None,
+        deadline: Optional[float] = None,
+        **params
+    ) -> str:
+        """
+        Chat completion text
+
+        Args:
+            messages: Chat messages
+            model: Model name (default OPENAI_MODEL)
+            deadline: Total seconds across retries (default per operation)
+            **params: temperature, max_tokens, top_p...
+
+        Returns:
+            Completion text
+        """
+        model = model or settings.OPENAI_MODEL
+        return await self._call(
+            CHAT,
+            lambda: self.provider.chat(messages, model, **params),
+            deadline
+        )
+
+    async def embed(
+        self,
+        texts: List[str],
+        model: Optional[str] = None,
+        deadline: Optional[float] = None
+    ) -> List[List[float]]:
+        """Embed a batch of texts (model default OPENAI_EMBEDDING_MODEL)"""
+        model = model or settings.OPENAI_EMBEDDING_MODEL
+        return await self._call(
+            EMBEDDINGS,
+            lambda: self.provider.embed(texts, model),
+            deadline
+        )
+
+    async def stream_chat(
+        self,
+        messages: List[Dict],
+        model: Optional[str] = None,
+        **params
+    ) -> AsyncIterator[str]:
+        """
+        Stream completion deltas
+
+        Retries apply only until the first token arrives; after that a
+        stalled stream (no delta within the chat timeout) is an error. The
+        concurrency slot is held until the stream is consumed or closed.
+        """
+        op = self._operations[CHAT]
+        self._admit(op, CHAT)
+        model = model or settings.OPENAI_MODEL
+        deadline_at = time.monotonic() + op.deadline
+
+        async with op.semaphore:
+            op.in_flight += 1
+            try:
+                attempt = 0
+                while True:
+                    stream = self.provider.chat_stream(messages, model, **params)
+                    remaining = deadline_at - time.monotonic()
+                    try:
+                        first = await asyncio.wait_for(stream.__anext__(), timeout=min(op.timeout, remaining))
+                        break
+                    except StopAsyncIteration:
+                        op.breaker.record_success()
+                        return
+                    except Exception as e:
+                        await stream.aclose()
+                        if isinstance(e, asyncio.TimeoutError):
+                            op.counters["timeouts"] += 1
+                        retryable = is_retryable(e)
+                        if retryable and attempt < self.max_retries:
+                            delay = self._backoff(attempt, e)
+                            if time.monotonic() + delay < deadline_at:
+                                op.counters["retries"] += 1
+                                attempt += 1
+                                logger.warning(f"LLM chat stream attempt {attempt} failed ({e!r}), retrying in {delay:.2f}s")
+                                await asyncio.sleep(delay)
+                                continue
+                        op.counters["failures"] += 1
+                        if retryable:
+                            op.breaker.record_failure()
+                        raise LLMGatewayError(f"LLM chat stream failed: {e!r}") from e
+
+                op.breaker.record_success()
+                try:
+                    yield first
+                    while True:
+                        try:
+                            delta = await asyncio.wait_for(stream.__anext__(), timeout=op.timeout)
+                        except StopAsyncIteration:
+                            return
+                        except asyncio.TimeoutError as e:
+                            op.counters["timeouts"] += 1
+                            op.counters["failures"] += 1
+                            raise LLMGatewayError("LLM chat stream stalled") from e
+                        yield delta
+                finally:
+                    await stream.aclose()
+            finally:
+                op.in_flight -= 1
+
+    def stats(self) -> Dict:
+        """Counters, in-flight calls and breaker state per operation"""
+        return {
+            "provider": self.provider.name,
+            "hedge_after": self.hedge_after,
+            **{
+                name: {
+                    **op.counters,
+                    "in_flight": op.in_flight,
+                    "concurrency": op.concurrency,
+                    "breaker": op.breaker.state,
+                    "breaker_opened": op.breaker.times_opened
+                }
+                for name, op in self._operations.items()
+            }
+        }
+
+
+def create_provider():
+    """Provider selected by LLM_PROVIDER ("openai" or "fake")"""
+    if settings.LLM_PROVIDER == "fake":
+        logger.warning("LLM_PROVIDER=fake: answers and embeddings are simulated")
+        return FakeProvider(
+            latency=settings.LLM_FAKE_LATENCY_SECONDS,
+            failure_rate=settings.LLM_FAKE_FAILURE_RATE
+        )
+    return OpenAIProvider(settings.OPENAI_API_KEY)
+
+
+# Shared gateway used by every OpenAI call site
+llm_gateway = LLMGateway(
+    create_provider(),
+    chat_concurrency=settings.LLM_CHAT_CONCURRENCY,
+    embedding_concurrency=settings.LLM_EMBEDDING_CONCURRENCY,
+    chat_timeout=settings.LLM_CHAT_TIMEOUT_SECONDS,
+    embedding_timeout=settings.LLM_EMBEDDING_TIMEOUT_SECONDS,
+    chat_deadline=settings.LLM_CHAT_DEADLINE_SECONDS,
+    embedding_deadline=settings.LLM_EMBEDDING_DEADLINE_SECONDS,
+    max_retries=settings.LLM_MAX_RETRIES,
+    backoff_base=settings.LLM_BACKOFF_BASE_SECONDS,
+    backoff_max=settings.LLM_BACKOFF_MAX_SECONDS,
+    hedge_after=settings.LLM_HEDGE_AFTER_SECONDS,
+    breaker_failure_threshold=settings.LLM_BREAKER_FAILURE_THRESHOLD,
+    breaker_reset_seconds=settings.LLM_BREAKER_RESET_SECONDS
+)
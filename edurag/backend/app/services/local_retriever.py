@@ -0,0 +1,629 @@
+"""
+Local Retriever Service
+In-process vector search over material_chunks: an mmap-backed float16/float32
+matrix with an IVF (inverted file) index, kept in sync with Postgres
+incrementally. Selected with RAG_RETRIEVER=local.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.database import get_db_pool
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIM = 1536
+SCORE_BLOCK_ROWS = 16384  # Rows converted to float32 per matmul block
+
+
+class VectorIndex:
+    """
+    Cosine-similarity index over unit-normalized vectors
+
+    Rows are appended to a growable .npy memmap and deleted with tombstones.
+    Every row carries a group code (the material) so filtered searches can
+    score only the rows of the allowed groups, exactly. Unfiltered searches
+    use IVF (k-means coarse quantizer, `nprobe` lists scanned) or brute force.
+    """
+
+    def __init__(
+        self,
+        dim: int = EMBEDDING_DIM,
+        path: Optional[str] = None,
+        dtype: str = "float16",
+        index_type: str = "ivf",
+        nlist: int = 0,
+        nprobe: int = 16
+    ):
+        self.dim = dim
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.count = 0
+        # Storage is allocated lazily on the first add (or reopened by load)
+        self._vectors = np.zeros((0, dim), dtype=self.dtype)
+        self._alive = np.zeros(0, dtype=bool)
+        self._groups = np.zeros(0, dtype=np.int32)
+        self._assign = np.full(0, -1, dtype=np.int32)
+        self._group_rows: Dict[int, List[int]] = {}
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[List[int]] = []
+        self._trained_at_count = 0
+
+    # -- storage --------------------------------------------------------------
+
+    def _allocate(self, capacity: int) -> np.ndarray:
+        if not self.path:
+            return np.zeros((capacity, self.dim), dtype=self.dtype)
+        tmp_path = f"{self.path}.tmp"
+        matrix = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=self.dtype, shape=(capacity, self.dim)
+        )
+        return matrix
+
+    def _grow(self, needed: int) -> None:
+        capacity = len(self._alive)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 1024)
+        vectors = self._allocate(new_capacity)
+        vectors[:self.count] = self._vectors[:self.count]
+        if self.path:
+            vectors.flush()
+            del self._vectors
+            os.replace(f"{self.path}.tmp", self.path)
+            vectors = np.load(self.path, mmap_mode="r+")
+        self._vectors = vectors
+        for name, fill in (("_alive", False), ("_groups", 0), ("_assign", -1)):
+            old = getattr(self, name)
+            new = np.full(new_capacity, fill, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def save(self, state_path: str) -> None:
+        """Persist row state next to the memmap (vectors are already on disk)"""
+        if isinstance(self._vectors, np.memmap):
+            self._vectors.flush()
+        np.savez(
+            state_path,
+            count=self.count,
+            alive=self._alive[:self.count],
+            groups=self._groups[:self.count],
+            assign=self._assign[:self.count],
+            centroids=self._centroids if self._centroids is not None else np.zeros((0, self.dim), np.float32),
+            trained_at_count=self._trained_at_count
+        )
+
+    def load(self, state_path: str) -> bool:
+        """Reopen a persisted index, returns False if nothing usable is on disk"""
+        if not self.path or not os.path.exists(self.path) or not os.path.exists(state_path):
+            return False
+        vectors = np.load(self.path, mmap_mode="r+")
+        if vectors.dtype != self.dtype or vectors.shape[1] != self.dim:
+            return False
+        state = np.load(state_path)
+        count = int(state["count"])
+        capacity = vectors.shape[0]
+        self._vectors = vectors
+        self.count = count
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._alive[:count] = state["alive"]
+        self._groups = np.zeros(capacity, dtype=np.int32)
+        self._groups[:count] = state["groups"]
+        self._assign = np.full(capacity, -1, dtype=np.int32)
+        self._assign[:count] = state["assign"]
+        self._trained_at_count = int(state["trained_at_count"])
+        centroids = state["centroids"]
+        self._centroids = centroids if len(centroids) else None
+        self._group_rows = {}
+        for row in np.flatnonzero(self._alive[:count]):
+            self._group_rows.setdefault(int(self._groups[row]), []).append(int(row))
+        self._rebuild_lists()
+        return True
+
+    # -- mutation -------------------------------------------------------------
+
+    @property
+    def live_count(self) -> int:
+        return sum(len(rows) for rows in self._group_rows.values())
+
+    @property
+    def dead_ratio(self) -> float:
+        return 1 - self.live_count / self.count if self.count else 0.0
+
+    @property
+    def needs_training(self) -> bool:
+        """The IVF quantizer is due for (re)training: live rows doubled since the last one"""
+        return self.index_type == "ivf" and self.live_count >= 2 * max(self._trained_at_count, 512)
+
+    def add(self, vectors: np.ndarray, group: int, auto_train: bool = True) -> List[int]:
+        """
+        Append unit-normalized vectors for one group, returns their rows
+
+        With auto_train the IVF quantizer is retrained when needs_training;
+        callers that serve searches concurrently train outside their lock
+        instead (fit + install).
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        start = self.count
+        end = start + len(vectors)
+        self._grow(end)
+        self._vectors[start:end] = vectors.astype(self.dtype)
+        self._alive[start:end] = True
+        self._groups[start:end] = group
+        self.count = end
+        rows = list(range(start, end))
+        self._group_rows.setdefault(group, []).extend(rows)
+
+        if self._centroids is not None:
+            assign = np.argmax(vectors @ self._centroids.T, axis=1)
+            self._assign[start:end] = assign
+            for row, list_id in zip(rows, assign):
+                self._lists[int(list_id)].append(row)
+        if auto_train and self.needs_training:
+            self.train()
+        return rows
+
+    def remove_group(self, group: int) -> int:
+        """Tombstone every row of a group, returns rows removed"""
+        rows = self._group_rows.pop(group, [])
+        if rows:
+            self._alive[rows] = False
+        return len(rows)
+
+    def train(self, iterations: int = 10, sample_size: int = 20000, seed: int = 0) -> None:
+        """(Re)train the IVF coarse quantizer with spherical k-means"""
+        fitted = self.fit(iterations, sample_size, seed)
+        if fitted is not None:
+            self.install(fitted)
+
+    def fit(self, iterations: int = 10, sample_size: int = 20000, seed: int = 0) -> Optional[Tuple]:
+        """
+        Train the IVF quantizer without changing the index
+
+        Only reads the vectors, so searches can run meanwhile; the result is
+        applied with install() (no rows may be added in between).
+        Returns None when there are too few live rows to train.
+        """
+        live = np.flatnonzero(self._alive[:self.count])
+        if len(live) < 64:
+            return None
+        nlist = self.nlist or int(np.sqrt(len(live)))
+        nlist = max(1, min(nlist, len(live) // 8))
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(live, size=min(sample_size, len(live)), replace=False)
+        data = self._vectors[np.sort(sample)].astype(np.float32)
+        centroids = data[rng.choice(len(data), size=nlist, replace=False)]
+        for _ in range(iterations):
+            assign = np.argmax(data @ centroids.T, axis=1)
+            for list_id in range(nlist):
+                members = data[assign == list_id]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[list_id] = centroid / (np.linalg.norm(centroid) or 1.0)
+
+        assign = np.full(len(self._assign), -1, dtype=np.int32)
+        for start in range(0, self.count, SCORE_BLOCK_ROWS):
+            block = self._vectors[start:min(start + SCORE_BLOCK_ROWS, self.count)].astype(np.float32)
+            assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        lists = [[] for _ in range(nlist)]
+        for row in live:
+            lists[int(assign[row])].append(int(row))
+        return centroids, assign, lists, len(live)
+
+    def install(self, fitted: Tuple) -> None:
+        """Apply the result of fit()"""
+        self._centroids, self._assign, self._lists, self._trained_at_count = fitted
+        logger.info(f"IVF index trained: {len(self._lists)} lists over {self._trained_at_count} vectors")
+
+    def _rebuild_lists(self) -> None:
+        if self._centroids is None:
+            self._lists = []
+            return
+        self._lists = [[] for _ in range(len(self._centroids))]
+        for row in np.flatnonzero(self._alive[:self.count]):
+            self._lists[int(self._assign[row])].append(int(row))
+
+    # -- search ---------------------------------------------------------------
+
+    def _score_rows(self, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), SCORE_BLOCK_ROWS):
+            block_rows = rows[start:start + SCORE_BLOCK_ROWS]
+            scores[start:start + len(block_rows)] = self._vectors[block_rows].astype(np.float32) @ query
+        return scores
+
+    def _score_all(self, query: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        scores = np.empty(self.count, dtype=np.float32)
+        for start in range(0, self.count, SCORE_BLOCK_ROWS):
+            block = self._vectors[start:min(start + SCORE_BLOCK_ROWS, self.count)]
+            scores[start:start + len(block)] = block.astype(np.float32) @ query
+        rows = np.flatnonzero(self._alive[:self.count])
+        return rows, scores[rows]
+
+    def search(
+        self,
+        query: List[float],
+        k: int,
+        threshold: float = -1.0,
+        groups: Optional[List[int]] = None,
+        exact: bool = False
+    ) -> List[Tuple[int, float]]:
+        """
+        Top-k rows by cosine similarity, similarity >= threshold
+
+        Args:
+            query: Query embedding
+            k: Number of results
+            threshold: Minimum cosine similarity
+            groups: Only score rows of these groups (exact search)
+            exact: Force brute force even if IVF is trained
+        """
+        query = np.asarray(query, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        if groups is not None:
+            rows = np.array(
+                [row for group in groups for row in self._group_rows.get(group, [])],
+                dtype=np.int64
+            )
+            scores = self._score_rows(rows, query)
+        elif exact or self.index_type != "ivf" or self._centroids is None:
+            rows, scores = self._score_all(query)
+        else:
+            nprobe = min(self.nprobe, len(self._centroids))
+            probe = np.argpartition(-(self._centroids @ query), nprobe - 1)[:nprobe]
+            rows = np.array([row for list_id in probe for row in self._lists[list_id]], dtype=np.int64)
+            if len(rows):
+                rows = rows[self._alive[rows]]
+            scores = self._score_rows(rows, query)
+
+        keep = scores >= threshold
+        rows, scores = rows[keep], scores[keep]
+        if len(rows) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores)
+        return [(int(rows[i]), float(scores[i])) for i in order]
+
+
+class LocalRetriever:
+    """
+    VectorIndex + SQLite sidecar (chunk text/metadata) synced from Postgres
+
+    Sync is material-granular: a material whose `processed_at` changed is
+    reloaded, a material that is no longer `completed` (deleted, reset or
+    reprocessing) is dropped. When more than 30% of the rows are tombstones
+    the live rows are compacted into a new matrix.
+
+    Searches hold the lock only while they read; IVF training and compaction
+    run outside it and swap their result in.
+    """
+
+    def __init__(self, index_dir: str):
+        os.makedirs(index_dir, exist_ok=True)
+        self.index_dir = index_dir
+        self.index = self._new_index(os.path.join(index_dir, "vectors.npy"))
+        self._state_path = os.path.join(index_dir, "state.npz")
+        self._db = sqlite3.connect(os.path.join(index_dir, "chunks.sqlite"), check_same_thread=False)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                row INTEGER PRIMARY KEY, id TEXT, material_id TEXT,
+                chunk_text TEXT, chunk_index INTEGER, metadata TEXT
+            );
+            CREATE TABLE IF NOT EXISTS materials (
+                material_id TEXT PRIMARY KEY, group_code INTEGER, processed_at TEXT,
+                info TEXT
+            );
+            """
+        )
+        self._lock = threading.RLock()
+        self._materials: Dict[str, Dict] = {}  # material_id -> {group, processed_at, info}
+        self._course_groups: Dict[str, List[int]] = {}
+        self._next_group = 0
+        self._state_loaded = False
+        self.ready = False
+        self.last_sync: Optional[float] = None
+
+    @staticmethod
+    def _new_index(path: str) -> VectorIndex:
+        return VectorIndex(
+            path=path,
+            dtype=settings.LOCAL_INDEX_DTYPE,
+            index_type=settings.LOCAL_INDEX_TYPE,
+            nlist=settings.LOCAL_INDEX_NLIST,
+            nprobe=settings.LOCAL_INDEX_NPROBE
+        )
+
+    def _load_state(self) -> None:
+        if not self.index.load(self._state_path):
+            self._db.executescript("DELETE FROM chunks; DELETE FROM materials;")
+            return
+        for material_id, group, processed_at, info in self._db.execute(
+            "SELECT material_id, group_code, processed_at, info FROM materials"
+        ):
+            self._register_material(material_id, group, processed_at, json.loads(info))
+        logger.info(f"Local index loaded from disk: {self.index.live_count} chunks")
+
+    def _register_material(self, material_id: str, group: int, processed_at: str, info: Dict) -> None:
+        self._materials[material_id] = {"group": group, "processed_at": processed_at, "info": info}
+        self._course_groups.setdefault(info.get("course_id"), []).append(group)
+        self._next_group = max(self._next_group, group + 1)
+
+    def _drop_material(self, material_id: str) -> None:
+        entry = self._materials.pop(material_id)
+        self.index.remove_group(entry["group"])
+        course_groups = self._course_groups.get(entry["info"].get("course_id"), [])
+        if entry["group"] in course_groups:
+            course_groups.remove(entry["group"])
+        self._db.execute("DELETE FROM chunks WHERE material_id = ?", (material_id,))
+        self._db.execute("DELETE FROM materials WHERE material_id = ?", (material_id,))
+
+    async def sync(self) -> Dict:
+        """Bring the index up to date with completed materials in Postgres"""
+        pool = get_db_pool()
+        if pool is None:
+            raise RuntimeError("Local retriever requires DATABASE_URL (asyncpg pool)")
+
+        async with pool.acquire(timeout=settings.DB_POOL_ACQUIRE_TIMEOUT) as conn:
+            rows = await conn.fetch(
+                """
+                SELECT m.id::text AS material_id, m.processed_at::text AS processed_at,
+                       m.course_id::text AS course_id, m.title AS material_title,
+                       m.author, c.code AS course_code, c.name AS course_name
+                FROM materials m
+                LEFT JOIN courses c ON c.id = m.course_id
+                WHERE m.processing_status = 'completed'
+                """
+            )
+        remote = {row["material_id"]: dict(row) for row in rows}
+
+        with self._lock:
+            if not self._state_loaded:
+                # Only the first sync reopens the persisted index
+                self._load_state()
+                self._state_loaded = True
+            removed = [
+                material_id for material_id, entry in self._materials.items()
+                if material_id not in remote or remote[material_id]["processed_at"] != entry["processed_at"]
+            ]
+            for material_id in removed:
+                self._drop_material(material_id)
+            changed = [material_id for material_id in remote if material_id not in self._materials]
+
+        added_chunks = 0
+        for material_id in changed:
+            async with pool.acquire(timeout=settings.DB_POOL_ACQUIRE_TIMEOUT) as conn:
+                chunk_rows = await conn.fetch(
+                    """
+                    SELECT id::text AS id, chunk_index, chunk_text, metadata, embedding
+                    FROM material_chunks
+                    WHERE material_id = $1::uuid AND embedding IS NOT NULL
+                    ORDER BY chunk_index
+                    """,
+                    material_id
+                )
+            # Index mutation (and occasional IVF retraining) is CPU-bound
+            added_chunks += await asyncio.to_thread(
+                self._apply_material, material_id, remote[material_id], chunk_rows
+            )
+
+        with self._lock:
+            compact = self.index.dead_ratio > 0.3
+        if compact:
+            logger.info("Local index has too many tombstones, compacting")
+            await asyncio.to_thread(self._compact)
+
+        with self._lock:
+            self._db.commit()
+            self.index.save(self._state_path)
+            self.ready = True
+            self.last_sync = time.time()
+
+        if removed or changed:
+            logger.info(
+                f"Local index synced: -{len(removed)} / +{len(changed)} materials, "
+                f"+{added_chunks} chunks, {self.index.live_count} live"
+            )
+        return {"materials_removed": len(removed), "materials_added": len(changed), "chunks_added": added_chunks}
+
+    def _apply_material(self, material_id: str, info: Dict, chunk_rows: list) -> int:
+        with self._lock:
+            group = self._next_group
+            if chunk_rows:
+                vectors = np.stack([np.asarray(row["embedding"], dtype=np.float32) for row in chunk_rows])
+                index_rows = self.index.add(vectors, group)
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO chunks (row, id, material_id, chunk_text, chunk_index, metadata) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (index_row, row["id"], material_id, row["chunk_text"], row["chunk_index"],
+                         json.dumps(row["metadata"] or {}))
+                        for index_row, row in zip(index_rows, chunk_rows)
+                    ]
+                )
+            self._db.execute(
+                "INSERT OR REPLACE INTO materials (material_id, group_code, processed_at, info) VALUES (?, ?, ?, ?)",
+                (material_id, group, info["processed_at"], json.dumps(info))
+            )
+            self._register_material(material_id, group, info["processed_at"], info)
+        if self.index.needs_training:
+            self._train(self.index)
+        return len(chunk_rows)
+
+    def _train(self, index: VectorIndex) -> None:
+        """Retrain IVF without blocking searches (only sync adds rows, so none arrive meanwhile)"""
+        fitted = index.fit()
+        if fitted is not None:
+            with self._lock:
+                index.install(fitted)
+
+    def _compact(self) -> None:
+        """
+        Copy the live rows into a new matrix, then swap it in
+
+        Group codes are kept, so materials and courses are unchanged; only
+        row numbers move, and the chunks sidecar is renumbered in the same
+        locked step. The old index keeps serving searches until the swap.
+        """
+        old = self.index
+        with self._lock:
+            groups = {group: list(rows) for group, rows in old._group_rows.items()}
+        path = old.path
+        compacted = self._new_index(f"{path}.compact")
+        moved = []
+        for group, rows in groups.items():
+            new_rows = compacted.add(old._vectors[rows].astype(np.float32), group, auto_train=False)
+            moved.extend(zip(rows, new_rows))
+        if compacted.index_type == "ivf":
+            compacted.train()
+
+        with self._lock:
+            # Two steps so a new row number never collides with an old one
+            self._db.execute("UPDATE chunks SET row = -1 - row")
+            self._db.executemany(
+                "UPDATE chunks SET row = ? WHERE row = ?",
+                [(new_row, -1 - old_row) for old_row, new_row in moved]
+            )
+            self._db.execute("DELETE FROM chunks WHERE row < 0")
+            if isinstance(compacted._vectors, np.memmap):
+                compacted._vectors.flush()
+                # The open memmaps stay valid across the rename
+                os.replace(compacted.path, path)
+            compacted.path = path
+            self.index = compacted
+        logger.info(f"Local index compacted: {old.count} -> {compacted.count} rows")
+
+    def _search_sync(
+        self,
+        query_embedding: List[float],
+        match_threshold: float,
+        match_count: int,
+        course_id: Optional[str],
+        material_id: Optional[str]
+    ) -> List[Dict]:
+        with self._lock:
+            groups = None
+            if material_id:
+                entry = self._materials.get(material_id)
+                if entry is None or (course_id and entry["info"].get("course_id") != course_id):
+                    return []
+                groups = [entry["group"]]
+            elif course_id:
+                groups = list(self._course_groups.get(course_id, []))
+
+            hits = self.index.search(query_embedding, match_count, match_threshold, groups)
+            if not hits:
+                return []
+            placeholders = ",".join("?" * len(hits))
+            stored = {
+                row[0]: row for row in self._db.execute(
+                    f"SELECT row, id, material_id, chunk_text, chunk_index, metadata FROM chunks WHERE row IN ({placeholders})",
+                    [row for row, _ in hits]
+                )
+            }
+            results = []
+            for row, similarity in hits:
+                _, chunk_id, chunk_material_id, text, chunk_index, metadata = stored[row]
+                info = self._materials[chunk_material_id]["info"]
+                results.append({
+                    "id": chunk_id,
+                    "material_id": chunk_material_id,
+                    "chunk_text": text,
+                    "chunk_index": chunk_index,
+                    "metadata": json.loads(metadata),
+                    "similarity": similarity,
+                    "course_id": info.get("course_id"),
+                    "material_title": info.get("material_title"),
+                    "author": info.get("author"),
+                    "course_code": info.get("course_code"),
+                    "course_name": info.get("course_name")
+                })
+            return results
+
+    async def search(
+        self,
+        query_embedding: List[float],
+        match_threshold: float,
+        match_count: int,
+        course_id: Optional[str] = None,
+        material_id: Optional[str] = None
+    ) -> List[Dict]:
+        """Same contract as database.match_material_chunks"""
+        return await asyncio.to_thread(
+            self._search_sync, query_embedding, match_threshold, match_count, course_id, material_id
+        )
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "materials": len(self._materials),
+                "live_chunks": self.index.live_count,
+                "dead_ratio": round(self.index.dead_ratio, 4),
+                "index_type": self.index.index_type,
+                "ivf_lists": len(self.index._lists),
+                "dtype": str(self.index.dtype),
+                "last_sync": self.last_sync
+            }
+
+
+# Shared retriever (only when RAG_RETRIEVER=local)
+_local_retriever: Optional[LocalRetriever] = None
+_sync_task: Optional[asyncio.Task] = None
+
+
+def get_local_retriever() -> Optional[LocalRetriever]:
+    """The local retriever if enabled and loaded, else None (use the RPC)"""
+    if _local_retriever is not None and _local_retriever.ready:
+        return _local_retriever
+    return None
+
+
+async def _sync_loop(retriever: LocalRetriever) -> None:
+    while True:
+        await asyncio.sleep(settings.LOCAL_INDEX_SYNC_INTERVAL_SECONDS)
+        try:
+            await retriever.sync()
+        except Exception as e:
+            logger.error(f"Local index sync failed: {e}")
+
+
+async def start_local_retriever() -> None:
+    """Load the local index at startup and schedule periodic syncs"""
+    global _local_retriever, _sync_task
+    if settings.RAG_RETRIEVER != "local":
+        return
+    if get_db_pool() is None:
+        logger.warning("RAG_RETRIEVER=local needs DATABASE_URL, falling back to RPC retrieval")
+        return
+    retriever = LocalRetriever(settings.LOCAL_INDEX_DIR)
+    try:
+        await retriever.sync()
+    except Exception as e:
+        logger.error(f"Local index initial sync failed, falling back to RPC retrieval: {e}")
+    _local_retriever = retriever
+    _sync_task = asyncio.create_task(_sync_loop(retriever))
+
+
+async def stop_local_retriever() -> None:
+    """Cancel the sync loop"""
+    global _sync_task
+    if _sync_task is not None:
+        _sync_task.cancel()
+        _sync_task = None
@@ -0,0 +1,267 @@
+"""
+Near-Duplicate Chunk Service
+MinHash signatures of shingled chunk_text with LSH banding (SQLite), used
+at ingestion time to link a chunk that repeats a chunk of another material
+of the same course (the same chapter in several course packs) to that
+canonical row instead of embedding and indexing it again
+"""
+
+import asyncio
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.embedding_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+SHINGLE_WORDS = 5
+# Shorter chunks (headings, page stubs) are never linked
+MIN_WORDS = 20
+# pgvector storage of one 1536-dim embedding (float32 + header)
+EMBEDDING_BYTES = 4 * 1536 + 8
+
+_WORD_RE = re.compile(r"\w+")
+
+DedupeFn = Callable[[List[Dict]], Awaitable[None]]
+
+
+def shingles(text: str, size: int = SHINGLE_WORDS) -> List[str]:
+    """Overlapping word n-grams of the normalized text"""
+    words = _WORD_RE.findall(normalize_text(text))
+    if len(words) <= size:
+        return [" ".join(words)] if words else []
+    return [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+
+class MinHasher:
+    """
+    MinHash signatures: num_perm multiply-shift hashes
+    ((a * x + b) mod 2^64) >> 32 of the 32-bit shingle hashes (pairwise
+    independent), minimum per hash. The fraction of equal positions in two
+    signatures estimates the Jaccard similarity of their shingle sets.
+    """
+
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        # uint64 arithmetic wraps, which is the mod 2^64
+        self._a = rng.integers(0, 1 << 64, num_perm, dtype=np.uint64, endpoint=False)
+        self._b = rng.integers(0, 1 << 64, num_perm, dtype=np.uint64, endpoint=False)
+        self.num_perm = num_perm
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """uint32 signature of the text, None if it has fewer than MIN_WORDS words"""
+        grams = set(shingles(text))
+        if not grams or len(grams) + SHINGLE_WORDS - 1 < MIN_WORDS:
+            return None
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=4).digest(), "little") for gram in grams),
+            dtype=np.uint64,
+            count=len(grams)
+        )
+        values = (np.outer(self._a, hashes) + self._b[:, None]) >> np.uint64(32)
+        return values.min(axis=1).astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """
+    LSH index of canonical chunk signatures
+
+    Signatures are split into `bands` bands; chunks sharing any band
+    bucket (within the same scope, the course) are candidates, verified
+    by their estimated Jaccard similarity. A lookup reads only its own
+    buckets, so its cost does not grow with the corpus. Rows staged
+    while a material is ingested are pending until commit_material, so
+    chunks are only linked to rows that are committed in material_chunks.
+    """
+
+    def __init__(self, path: str, num_perm: int = 128, bands: int = 16, threshold: float = 0.8):
+        if num_perm % bands:
+            raise ValueError("NEAR_DUP_NUM_PERM must be a multiple of NEAR_DUP_BANDS")
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS signatures (
+                chunk_id TEXT PRIMARY KEY, material_id TEXT NOT NULL,
+                signature BLOB NOT NULL, committed INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_signatures_material ON signatures(material_id);
+            CREATE TABLE IF NOT EXISTS buckets (
+                key INTEGER NOT NULL, chunk_id TEXT NOT NULL, PRIMARY KEY (key, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_buckets_chunk ON buckets(chunk_id);
+            CREATE TABLE IF NOT EXISTS duplicates (
+                chunk_id TEXT PRIMARY KEY, material_id TEXT NOT NULL, canonical_chunk_id TEXT NOT NULL,
+                similarity REAL NOT NULL, token_count INTEGER, committed INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_duplicates_material ON duplicates(material_id);
+            CREATE INDEX IF NOT EXISTS idx_duplicates_canonical ON duplicates(canonical_chunk_id);
+            """
+        )
+        self._db.commit()
+
+    def _band_keys(self, signature: np.ndarray, scope: str) -> List[int]:
+        keys = []
+        for band in range(self.bands):
+            digest = hashlib.blake2b(digest_size=8)
+            digest.update(f"{scope}|{band}|".encode("utf-8"))
+            digest.update(signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            keys.append(int.from_bytes(digest.digest(), "little", signed=True))
+        return keys
+
+    def _best_match(self, signature: np.ndarray, keys: List[int], material_id: str) -> Optional[Tuple[str, float]]:
+        """Most similar committed chunk of another material above the threshold (caller holds the lock)"""
+        placeholders = ",".join("?" * len(keys))
+        candidates = self._db.execute(
+            f"""
+            SELECT s.chunk_id, s.signature FROM signatures s
+            WHERE s.chunk_id IN (SELECT DISTINCT chunk_id FROM buckets WHERE key IN ({placeholders}))
+              AND s.committed = 1 AND s.material_id != ?
+            """,
+            [*keys, material_id]
+        ).fetchall()
+        best = None
+        for chunk_id, stored in candidates:
+            similarity = float(np.mean(np.frombuffer(stored, dtype=np.uint32) == signature))
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (chunk_id, similarity)
+        return best
+
+    def mark_chunks(self, material_id: str, scope: Optional[str], chunks: List[Dict]) -> int:
+        """
+        Link the chunks that repeat a chunk of another material
+
+        Every chunk gets its row id ("id"); duplicates also get
+        "canonical_chunk_id", the others are staged (pending) as canonical
+        candidates for later materials. Returns the number of duplicates.
+        """
+        scope = scope or ""
+        signatures = [self.hasher.signature(chunk["chunk_text"]) for chunk in chunks]
+        duplicates = 0
+        with self._lock:
+            for chunk, signature in zip(chunks, signatures):
+                chunk.setdefault("id", str(uuid4()))
+                if signature is None:
+                    continue
+                keys = self._band_keys(signature, scope)
+                match = self._best_match(signature, keys, material_id)
+                if match is not None:
+                    chunk["canonical_chunk_id"] = match[0]
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO duplicates VALUES (?, ?, ?, ?, ?, 0)",
+                        (chunk["id"], material_id, match[0], match[1], chunk.get("token_count"))
+                    )
+                    duplicates += 1
+                    continue
+                self._db.execute(
+                    "INSERT OR REPLACE INTO signatures VALUES (?, ?, ?, 0)",
+                    (chunk["id"], material_id, signature.tobytes())
+                )
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO buckets VALUES (?, ?)", [(key, chunk["id"]) for key in keys]
+                )
+            self._db.commit()
+        return duplicates
+
+    def deduplicator(self, material_id: str, scope: Optional[str]) -> DedupeFn:
+        """Async hook for run_ingestion_pipeline (dedupe=...)"""
+        async def dedupe(chunks: List[Dict]) -> None:
+            await asyncio.to_thread(self.mark_chunks, material_id, scope, chunks)
+        return dedupe
+
+    def commit_material(self, material_id: str) -> None:
+        """
+        The material's rows are committed: its chunks become canonical candidates
+
+        Rows of a previous run, replaced by these ones, are dropped.
+        """
+        with self._lock:
+            self._delete(material_id, committed=1)
+            self._db.execute("UPDATE signatures SET committed = 1 WHERE material_id = ?", (material_id,))
+            self._db.execute("UPDATE duplicates SET committed = 1 WHERE material_id = ?", (material_id,))
+            self._db.commit()
+
+    def discard_pending(self, material_id: str) -> int:
+        """Drop the rows staged by a run that failed, keeping the committed ones"""
+        with self._lock:
+            removed = self._delete(material_id, committed=0)
+            self._db.commit()
+            return removed
+
+    def remove_material(self, material_id: str) -> int:
+        """
+        Forget a material's signatures and links (deleted, failed or re-processed)
+
+        Links of other materials to its chunks are dropped too: the database
+        trigger promotes those rows to canonical when the chunks are deleted.
+        """
+        with self._lock:
+            removed = self._delete(material_id)
+            self._db.commit()
+            return removed
+
+    def _delete(self, material_id: str, committed: Optional[int] = None) -> int:
+        """Delete the material's rows, only those with this committed flag if given (caller holds the lock)"""
+        condition = "material_id = ?" if committed is None else "material_id = ? AND committed = ?"
+        params = (material_id,) if committed is None else (material_id, committed)
+        chunk_ids = [row[0] for row in self._db.execute(
+            f"SELECT chunk_id FROM signatures WHERE {condition}", params
+        )]
+        self._db.executemany("DELETE FROM buckets WHERE chunk_id = ?", [(chunk_id,) for chunk_id in chunk_ids])
+        self._db.executemany(
+            "DELETE FROM duplicates WHERE canonical_chunk_id = ?", [(chunk_id,) for chunk_id in chunk_ids]
+        )
+        self._db.execute(f"DELETE FROM signatures WHERE {condition}", params)
+        self._db.execute(f"DELETE FROM duplicates WHERE {condition}", params)
+        return len(chunk_ids)
+
+    def material_duplicates(self, material_id: str) -> int:
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM duplicates WHERE material_id = ?", (material_id,)
+            ).fetchone()[0]
+
+    def stats(self) -> Dict:
+        """Canonical and duplicate chunks, and the embedding storage avoided"""
+        with self._lock:
+            canonical = self._db.execute("SELECT COUNT(*) FROM signatures WHERE committed = 1").fetchone()[0]
+            duplicates, tokens = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(token_count), 0) FROM duplicates WHERE committed = 1"
+            ).fetchone()
+        return {
+            "canonical_chunks": canonical,
+            "duplicate_chunks": duplicates,
+            "tokens_not_embedded": tokens,
+            # Each avoided vector would also have been copied into the HNSW index
+            "embedding_bytes_avoided": duplicates * EMBEDDING_BYTES,
+            "threshold": self.threshold,
+            "bands": self.bands,
+            "rows_per_band": self.rows
+        }
+
+
+# Shared index instance (None when near-duplicate detection is disabled)
+near_duplicate_index: Optional[NearDuplicateIndex] = None
+if settings.NEAR_DUP_ENABLED:
+    try:
+        near_duplicate_index = NearDuplicateIndex(
+            settings.NEAR_DUP_INDEX_PATH,
+            num_perm=settings.NEAR_DUP_NUM_PERM,
+            bands=settings.NEAR_DUP_BANDS,
+            threshold=settings.NEAR_DUP_THRESHOLD
+        )
+    except (sqlite3.Error, ValueError) as e:
+        logger.warning(f"Near-duplicate detection disabled: {e}")
@@ -0,0 +1,73 @@
+"""
+OCR Cache Service
+Persistent SQLite cache of Tesseract results keyed by the rasterized page
+image and the OCR configuration, shared by every OCR pool process, so
+re-processing a scanned material does not run Tesseract again
+"""
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class OCRCache:
+    """
+    Page OCR results by image hash
+
+    Each OCR worker process opens its own connection; WAL mode and the busy
+    timeout let them write to the same file. Entries also keep the
+    Tesseract time they cost, which is the time a hit saves.
+    """
+
+    def __init__(self, path: str, ttl_seconds: int = 90 * 24 * 3600):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS ocr_pages (
+                key TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                confidence REAL,
+                ocr_seconds REAL NOT NULL,
+                created_at REAL NOT NULL
+            );
+            """
+        )
+        self._db.commit()
+
+    @staticmethod
+    def make_key(image, dpi: int, config: str) -> str:
+        """Key of a PIL page image OCR'd at `dpi` with a Tesseract config"""
+        digest = hashlib.sha256()
+        digest.update(f"{config}|{dpi}|{image.mode}|{image.size[0]}x{image.size[1]}|".encode("utf-8"))
+        digest.update(image.tobytes())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Cached {text, confidence, ocr_seconds} or None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT text, confidence, ocr_seconds, created_at FROM ocr_pages WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or time.time() - row[3] > self.ttl_seconds:
+            return None
+        return {"text": row[0], "confidence": row[1], "ocr_seconds": row[2]}
+
+    def put(self, key: str, text: str, confidence: Optional[float], ocr_seconds: float) -> None:
+        with self._lock:
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO ocr_pages (key, text, confidence, ocr_seconds, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, text, confidence, ocr_seconds, time.time())
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"OCR cache write failed: {e}")
@@ -4,14 +4,19 @@ Handles text extraction from image-based PDFs using Tesseract OCR
 """
 
 import os
+import asyncio
 import logging
-from typing import Tuple, Dict, Optional
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Callable, List, Tuple, Dict, Optional
 from pathlib import Path
 import tempfile
 
 try:
     import pytesseract
-    from pdf2image import convert_from_path
+    from pdf2image import convert_from_path, pdfinfo_from_path
     from PIL import Image
     OCR_AVAILABLE = True
 except ImportError:
@@ -20,6 +25,10 @@ except ImportError:
 
 import pdfplumber
 
+from app.core.config import settings
+from app.services.cpu_pool import run_in_cpu_pool
+from app.services.ocr_cache import OCRCache
+
 logger = logging.getLogger(__name__)
 
 
@@ -53,12 +62,340 @@ def is_scanned_pdf(file_path: str, sample_pages: int = 3) -> bool:
         return False
 
 
-async def extract_text_with_ocr(file_path: str) -> Tuple[str, Dict]:
+# Configuración para español e inglés
+OCR_CONFIG = r'--oem 3 --psm 6 -l spa+eng'
+
+OCR_METHOD = "pytesseract_ocr"
+
+# Puntos PDF por pulgada
+POINTS_PER_INCH = 72
+
+_ocr_pool: Optional[ProcessPoolExecutor] = None
+
+# Caché de OCR de este proceso (se abre en cada worker del pool)
+_ocr_cache: Optional[OCRCache] = None
+_ocr_cache_opened = False
+
+# Contadores de OCR del proceso principal (ver ocr_stats)
+_stats_lock = threading.Lock()
+_stats = {
+    "pages": 0,
+    "cache_hits": 0,
+    "escalated_pages": 0,
+    "ocr_seconds": 0.0,
+    "cache_saved_seconds": 0.0,
+    "adaptive_saved_seconds": 0.0
+}
+
+
+def image_coverage(page) -> float:
+    """Fracción del área de una página de pdfplumber cubierta por imágenes"""
+    page_area = float(page.width * page.height)
+    if page_area <= 0:
+        return 0.0
+    x0, top, x1, bottom = page.bbox
+    covered = 0.0
+    for image in page.images:
+        width = min(float(image["x1"]), x1) - max(float(image["x0"]), x0)
+        height = min(float(image["bottom"]), bottom) - max(float(image["top"]), top)
+        if width > 0 and height > 0:
+            covered += width * height
+    return min(covered / page_area, 1.0)
+
+
+def page_needs_ocr(page, text: Optional[str] = None) -> bool:
+    """
+    Decide si una página necesita OCR
+    
+    Una página necesita OCR cuando su capa de texto es casi vacía (menos de
+    OCR_MIN_TEXT_DENSITY caracteres por pulgada cuadrada) y las imágenes
+    cubren al menos OCR_MIN_IMAGE_COVERAGE de su área. Una página en blanco
+    sin imágenes no se procesa.
+    
+    Args:
+        page: Página de pdfplumber (antes de page.close())
+        text: Texto ya extraído de la página, si se tiene
+        
+    Returns:
+        True si la página debe pasar por OCR
+    """
+    if text is None:
+        text = page.extract_text() or ""
+    square_inches = float(page.width * page.height) / POINTS_PER_INCH ** 2
+    if square_inches <= 0:
+        return False
+    if len(text.strip()) / square_inches >= settings.OCR_MIN_TEXT_DENSITY:
+        return False
+    return image_coverage(page) >= settings.OCR_MIN_IMAGE_COVERAGE
+
+
+def ocr_worker_count() -> int:
+    """Procesos del pool de OCR"""
+    return settings.OCR_WORKERS or os.cpu_count() or 1
+
+
+def _get_ocr_pool() -> ProcessPoolExecutor:
+    """Pool de procesos para OCR (uno por núcleo salvo OCR_WORKERS)"""
+    global _ocr_pool
+    if _ocr_pool is None:
+        # spawn: los workers no heredan hilos ni conexiones del proceso web
+        _ocr_pool = ProcessPoolExecutor(
+            max_workers=ocr_worker_count(),
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _ocr_pool
+
+
+def shutdown_ocr_pool() -> None:
+    """Detiene el pool de procesos de OCR (al cerrar la aplicación)"""
+    global _ocr_pool
+    if _ocr_pool is not None:
+        _ocr_pool.shutdown(wait=False, cancel_futures=True)
+        _ocr_pool = None
+
+
+def _text_from_ocr_data(data: Dict) -> Tuple[str, Optional[float]]:
+    """
+    Reconstruye el texto y la confianza media de una salida de image_to_data
+    
+    Las palabras se unen por línea y las líneas por bloque/párrafo, como en
+    image_to_string, así basta una sola pasada de Tesseract por página.
+    
+    Returns:
+        Tuple de (texto, confianza media o None si no hay palabras)
+    """
+    lines: List[List[str]] = []
+    paragraph_ends = set()
+    current_line = current_paragraph = None
+    confidences = []
+    
+    for i, word in enumerate(data["text"]):
+        confidence = float(data["conf"][i])
+        if confidence < 0 or not word.strip():
+            continue
+        confidences.append(confidence)
+        paragraph = (data["block_num"][i], data["par_num"][i])
+        line = paragraph + (data["line_num"][i],)
+        if line != current_line:
+            if current_paragraph is not None and paragraph != current_paragraph:
+                paragraph_ends.add(len(lines) - 1)
+            lines.append([])
+            current_line, current_paragraph = line, paragraph
+        lines[-1].append(word)
+    
+    text = ""
+    for index, words in enumerate(lines):
+        text += " ".join(words) + ("\n\n" if index in paragraph_ends else "\n")
+    confidence = round(sum(confidences) / len(confidences), 2) if confidences else None
+    return text.strip(), confidence
+
+
+def _get_ocr_cache() -> Optional[OCRCache]:
+    global _ocr_cache, _ocr_cache_opened
+    if not _ocr_cache_opened:
+        _ocr_cache_opened = True
+        if settings.OCR_CACHE_PATH:
+            try:
+                _ocr_cache = OCRCache(settings.OCR_CACHE_PATH)
+            except Exception as e:
+                logger.warning(f"OCR cache disabled: {e}")
+    return _ocr_cache
+
+
+def _recognize(image, dpi: int) -> Dict:
+    """
+    Una pasada de Tesseract sobre una imagen, o su resultado en caché
+    
+    Returns:
+        Dict con text, confidence, dpi, cache_hit y cost_seconds (tiempo de
+        Tesseract que costó o costaría esta pasada)
+    """
+    cache = _get_ocr_cache()
+    key = OCRCache.make_key(image, dpi, OCR_CONFIG) if cache is not None else None
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return {"text": cached["text"], "confidence": cached["confidence"], "dpi": dpi,
+                    "cache_hit": True, "cost_seconds": cached["ocr_seconds"]}
+    
+    started = time.perf_counter()
+    data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT, config=OCR_CONFIG)
+    text, confidence = _text_from_ocr_data(data)
+    cost = time.perf_counter() - started
+    if cache is not None:
+        cache.put(key, text, confidence, cost)
+    return {"text": text, "confidence": confidence, "dpi": dpi, "cache_hit": False, "cost_seconds": cost}
+
+
+def _page_result(page_num: int, passes: List[Dict], dpi: int, adaptive: bool) -> Dict:
+    """
+    Resultado de una página a partir de sus pasadas (baja resolución y,
+    si se escaló, resolución completa)
+    
+    El ahorro se mide frente a una pasada sin caché a `dpi`. Si la página no
+    se escaló, ese coste se estima escalando el de la pasada a baja
+    resolución por el número de píxeles, (dpi / dpi_bajo)².
+    """
+    final = passes[-1]
+    cost_without_cache = sum((p["cost_seconds"] for p in passes), 0.0)
+    spent = sum((p["cost_seconds"] for p in passes if not p["cache_hit"]), 0.0)
+    if final["dpi"] == dpi:
+        baseline = final["cost_seconds"]
+    else:
+        baseline = final["cost_seconds"] * (dpi / final["dpi"]) ** 2
+    return {
+        "page": page_num,
+        "text": final["text"],
+        "confidence": final["confidence"],
+        "dpi": final["dpi"],
+        "cache_hit": all(p["cache_hit"] for p in passes),
+        "escalated": len(passes) > 1,
+        "ocr_seconds": round(spent, 3),
+        "cache_saved_seconds": round(cost_without_cache - spent, 3),
+        "adaptive_saved_seconds": (round(baseline - cost_without_cache, 3) or 0.0) if adaptive else 0.0
+    }
+
+
+def ocr_page_range(
+    file_path: str,
+    first_page: int,
+    last_page: int,
+    dpi: int,
+    low_dpi: Optional[int] = None,
+    min_confidence: float = 0.0
+) -> List[Dict]:
+    """
+    Rasteriza y reconoce un rango de páginas (se ejecuta en el pool de procesos)
+    
+    Solo el rango pedido se convierte a imagen, y cada imagen se libera tras
+    su pasada de Tesseract. Con `low_dpi` (modo adaptativo) el rango se
+    rasteriza a esa resolución y solo las páginas con confianza media menor
+    que `min_confidence` (o sin palabras) se vuelven a rasterizar a `dpi`.
+    Cada pasada se busca antes en la caché de OCR.
+    
+    Returns:
+        Lista de resultados por página (ver _page_result)
+    """
+    adaptive = bool(low_dpi) and low_dpi < dpi
+    render_dpi = low_dpi if adaptive else dpi
+    images = convert_from_path(file_path, dpi=render_dpi, first_page=first_page, last_page=last_page)
+    results = []
+    for page_num in range(first_page, first_page + len(images)):
+        image = images.pop(0)
+        passes = [_recognize(image, render_dpi)]
+        image.close()
+        confidence = passes[0]["confidence"]
+        if adaptive and (confidence is None or confidence < min_confidence):
+            [image] = convert_from_path(file_path, dpi=dpi, first_page=page_num, last_page=page_num)
+            passes.append(_recognize(image, dpi))
+            image.close()
+        results.append(_page_result(page_num, passes, dpi, adaptive))
+    return results
+
+
+def _record_results(future: "asyncio.Future[List[Dict]]") -> None:
+    if future.cancelled() or future.exception() is not None:
+        return
+    with _stats_lock:
+        for result in future.result():
+            _stats["pages"] += 1
+            _stats["cache_hits"] += int(result["cache_hit"])
+            _stats["escalated_pages"] += int(result["escalated"])
+            _stats["ocr_seconds"] += result["ocr_seconds"]
+            _stats["cache_saved_seconds"] += result["cache_saved_seconds"]
+            _stats["adaptive_saved_seconds"] += result["adaptive_saved_seconds"]
+
+
+def ocr_stats() -> Dict:
+    """Páginas procesadas, aciertos de caché, páginas escaladas y tiempo de Tesseract ahorrado"""
+    with _stats_lock:
+        stats = dict(_stats)
+    for key in ("ocr_seconds", "cache_saved_seconds", "adaptive_saved_seconds"):
+        stats[key] = round(stats[key], 1)
+    stats["cache_enabled"] = bool(settings.OCR_CACHE_PATH)
+    stats["adaptive_dpi"] = settings.OCR_ADAPTIVE_DPI
+    return stats
+
+
+def submit_ocr_pages(
+    file_path: str,
+    first_page: int,
+    last_page: int,
+    dpi: Optional[int] = None,
+    adaptive: Optional[bool] = None
+) -> "asyncio.Future[List[Dict]]":
+    """
+    Envía un rango de páginas al pool de OCR (ver ocr_page_range)
+    
+    Args:
+        adaptive: Empezar a OCR_LOW_DPI y escalar a `dpi` las páginas con
+            confianza menor que OCR_MIN_CONFIDENCE (por defecto OCR_ADAPTIVE_DPI)
+    """
+    adaptive = settings.OCR_ADAPTIVE_DPI if adaptive is None else adaptive
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(
+        _get_ocr_pool(), ocr_page_range, file_path, first_page, last_page, dpi or settings.OCR_DPI,
+        settings.OCR_LOW_DPI if adaptive else None, settings.OCR_MIN_CONFIDENCE
+    )
+    future.add_done_callback(_record_results)
+    return future
+
+
+async def iter_ocr_pages(
+    file_path: str,
+    first_page: int = 1,
+    last_page: Optional[int] = None,
+    dpi: Optional[int] = None,
+    adaptive: Optional[bool] = None
+) -> AsyncIterator[Tuple[int, Dict]]:
+    """
+    OCR de un PDF repartido por rangos de páginas en el pool de procesos
+    
+    Args:
+        file_path: Ruta al archivo PDF
+        first_page: Primera página (desde 1)
+        last_page: Última página (por defecto la última del PDF)
+        dpi: Resolución de rasterizado (OCR_DPI)
+        adaptive: Resolución adaptativa (ver submit_ocr_pages)
+        
+    Yields:
+        (total_páginas, resultado_de_página) en orden de página
+    """
+    total_pages = (await asyncio.to_thread(pdfinfo_from_path, file_path))["Pages"]
+    last_page = min(last_page or total_pages, total_pages)
+    step = max(1, settings.OCR_PAGES_PER_TASK)
+    
+    tasks = [
+        submit_ocr_pages(file_path, start, min(start + step - 1, last_page), dpi, adaptive)
+        for start in range(first_page, last_page + 1, step)
+    ]
+    try:
+        # Se esperan en orden de envío: el orden de las páginas se mantiene
+        for task in tasks:
+            for result in await task:
+                yield total_pages, result
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def extract_text_with_ocr(
+    file_path: str,
+    on_page: Optional[Callable[[int, int], None]] = None
+) -> Tuple[str, Dict]:
     """
     Extrae texto de PDF escaneado usando OCR
     
+    Las páginas se rasterizan por rangos y se reconocen en paralelo en un
+    pool de procesos, con una sola pasada de Tesseract por página para el
+    texto y la confianza. Las pasadas ya hechas salen de la caché de OCR y,
+    con OCR_ADAPTIVE_DPI, solo las páginas de baja confianza se reconocen a
+    resolución completa; metadata["ocr_stats"] resume el tiempo ahorrado.
+    
     Args:
         file_path: Ruta al archivo PDF
+        on_page: Llamada con (páginas_procesadas, total_páginas) tras cada
+            página, para publicar el progreso
         
     Returns:
         Tuple de (texto_extraído, metadata)
@@ -72,60 +409,71 @@ async def extract_text_with_ocr(file_path: str) -> Tuple[str, Dict]:
     try:
         logger.info(f"Starting OCR extraction for: {file_path}")
         
-        # Convertir PDF a imágenes
-        images = convert_from_path(file_path, dpi=300)
-        
         text_content = []
+        current_length = 0
         metadata = {
-            "total_pages": len(images),
-            "extraction_method": "pytesseract_ocr",
+            "total_pages": 0,
+            "extraction_method": OCR_METHOD,
             "ocr_language": "spa+eng",  # Español + Inglés
             "page_breaks": [],
             "ocr_confidence": []
         }
+        ocr_stats = {
+            "cache_hits": 0,
+            "escalated_pages": 0,
+            "ocr_seconds": 0.0,
+            "cache_saved_seconds": 0.0,
+            "adaptive_saved_seconds": 0.0
+        }
         
-        for page_num, image in enumerate(images, 1):
-            logger.info(f"Processing page {page_num}/{len(images)} with OCR")
+        async for total_pages, result in iter_ocr_pages(file_path):
+            page_num, page_text, confidence = result["page"], result["text"], result["confidence"]
+            metadata["total_pages"] = total_pages
+            logger.debug(f"OCR page {page_num}/{total_pages} done")
             
-            # Extraer texto con OCR
-            # Configuración para español e inglés
-            custom_config = r'--oem 3 --psm 6 -l spa+eng'
-            page_text = pytesseract.image_to_string(image, config=custom_config)
+            ocr_stats["cache_hits"] += int(result["cache_hit"])
+            ocr_stats["escalated_pages"] += int(result["escalated"])
+            for key in ("ocr_seconds", "cache_saved_seconds", "adaptive_saved_seconds"):
+                ocr_stats[key] += result[key]
             
-            # Obtener confianza del OCR (opcional)
-            try:
-                ocr_data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT, config=custom_config)
-                confidences = [int(conf) for conf in ocr_data['conf'] if conf != '-1']
-                avg_confidence = sum(confidences) / len(confidences) if confidences else 0
+            if confidence is not None:
                 metadata["ocr_confidence"].append({
                     "page": page_num,
-                    "confidence": round(avg_confidence, 2)
+                    "confidence": confidence,
+                    "dpi": result["dpi"]
                 })
-            except Exception as e:
-                logger.warning(f"Could not get OCR confidence for page {page_num}: {str(e)}")
             
             # Agregar texto de la página
             if page_text and page_text.strip():
-                current_length = sum(len(t) for t in text_content)
                 metadata["page_breaks"].append({
                     "page": page_num,
                     "char_position": current_length
                 })
                 
-                text_content.append(f"\n\n--- Página {page_num} ---\n\n")
+                marker = f"\n\n--- Página {page_num} ---\n\n"
+                text_content.append(marker)
                 text_content.append(page_text)
+                current_length += len(marker) + len(page_text)
             else:
                 logger.warning(f"No text extracted from page {page_num}")
+            
+            if on_page is not None:
+                on_page(page_num, total_pages)
         
         full_text = "".join(text_content)
         metadata["total_chars"] = len(full_text)
+        metadata["ocr_stats"] = {key: round(value, 2) for key, value in ocr_stats.items()}
         metadata["avg_confidence"] = round(
             sum(p["confidence"] for p in metadata["ocr_confidence"]) / len(metadata["ocr_confidence"])
             if metadata["ocr_confidence"] else 0,
             2
         )
         
-        logger.info(f"OCR extraction completed: {len(full_text)} chars, avg confidence: {metadata['avg_confidence']}%")
+        logger.info(
+            f"OCR extraction completed: {len(full_text)} chars, avg confidence: {metadata['avg_confidence']}%, "
+            f"saved {metadata['ocr_stats']['cache_saved_seconds']}s (cache) + "
+            f"{metadata['ocr_stats']['adaptive_saved_seconds']}s (adaptive DPI)"
+        )
         
         return full_text, metadata
         
@@ -134,19 +482,23 @@ async def extract_text_with_ocr(file_path: str) -> Tuple[str, Dict]:
         raise RuntimeError(f"Failed to extract text with OCR: {str(e)}")
 
 
-async def extract_text_smart(file_path: str) -> Tuple[str, Dict]:
+async def extract_text_smart(
+    file_path: str,
+    on_page: Optional[Callable[[int, int], None]] = None
+) -> Tuple[str, Dict]:
     """
     Extrae texto de PDF automáticamente detectando si es escaneado o digital
     
     Args:
         file_path: Ruta al archivo PDF
+        on_page: Progreso por página del OCR (ver extract_text_with_ocr)
         
     Returns:
         Tuple de (texto_extraído, metadata)
     """
     try:
         # Detectar tipo de PDF
-        is_scanned = is_scanned_pdf(file_path)
+        is_scanned = await run_in_cpu_pool(is_scanned_pdf, file_path)
         
         if is_scanned:
             logger.info(f"Detected scanned PDF: {file_path}")
@@ -155,7 +507,7 @@ async def extract_text_smart(file_path: str) -> Tuple[str, Dict]:
                     "PDF appears to be scanned but OCR is not available. "
                     "Install: pip install pytesseract pdf2image Pillow"
                 )
-            return await extract_text_with_ocr(file_path)
+            return await extract_text_with_ocr(file_path, on_page=on_page)
         else:
             logger.info(f"Detected digital PDF: {file_path}")
             # Usar método existente de pdfplumber
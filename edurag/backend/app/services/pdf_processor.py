@@ -3,33 +3,49 @@ PDF Processing Service
 Handles PDF text extraction, chunking, and embedding generation
 """
 
+import asyncio
+import bisect
+import logging
 import os
 import uuid
+from contextlib import nullcontext
 from typing import List, Dict, Optional, Tuple
-import pdfplumber
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from openai import AsyncOpenAI
-import tiktoken
 
 from app.core.config import settings
-from app.core.database import get_supabase_client
-
-# Initialize OpenAI client
-openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-
-# Initialize tokenizer
-encoding = tiktoken.get_encoding("cl100k_base")
-
-
-def count_tokens(text: str) -> int:
-    """Count tokens in text using tiktoken"""
-    return len(encoding.encode(text))
+from app.services.cpu_pool import run_in_cpu_pool
+from app.services.pdf_text import (
+    PAGE_MARKER, count_tokens, extract_page_range, page_count, tokenize, truncate_tokens
+)
+from app.services.embedding_cache import EmbeddingCache, embedding_cache, normalize_text
+from app.services.embedding_batcher import EmbeddingBatcher, EmbeddingCheckpoint
+from app.services.embedding_dispatcher import EmbeddingDispatcher
+from app.services.llm_gateway import llm_gateway
+from app.core.database import (
+    MaterialChunkLoader,
+    get_db_pool,
+    insert_material_chunks,
+    delete_material_chunk_rows,
+    copy_material_chunks,
+    fetch_material,
+    fetch_material_chunk_rows,
+    fetch_material_info,
+    update_material
+)
+from app.services.answer_cache import invalidate_answer_cache
+from app.services.bm25_index import bm25_index
+from app.services.near_duplicates import near_duplicate_index
+from app.services.ocr_service import OCR_METHOD
+from app.services.progress_store import progress_store
 
+logger = logging.getLogger(__name__)
 
 async def extract_text_from_pdf(file_path: str) -> Tuple[str, Dict]:
     """
     Extract text from PDF file
     
+    Page ranges (CPU_POOL_PAGES_PER_TASK) are extracted in parallel in the
+    CPU pool and joined in page order.
+    
     Args:
         file_path: Path to PDF file
         
@@ -38,32 +54,37 @@ async def extract_text_from_pdf(file_path: str) -> Tuple[str, Dict]:
     """
     try:
         text_content = []
+        current_length = 0
         metadata = {
             "total_pages": 0,
             "extraction_method": "pdfplumber",
             "page_breaks": []
         }
         
-        with pdfplumber.open(file_path) as pdf:
-            metadata["total_pages"] = len(pdf.pages)
-            
-            for page_num, page in enumerate(pdf.pages, 1):
-                page_text = page.extract_text()
+        total_pages = await run_in_cpu_pool(page_count, file_path)
+        metadata["total_pages"] = total_pages
+        step = max(1, settings.CPU_POOL_PAGES_PER_TASK)
+        ranges = await asyncio.gather(*(
+            run_in_cpu_pool(extract_page_range, file_path, start, min(start + step - 1, total_pages), False, False)
+            for start in range(1, total_pages + 1, step)
+        ))
+        
+        for page in (page for pages in ranges for page in pages):
+            if page["text"]:
+                # Track where page breaks occur in the text
+                metadata["page_breaks"].append({
+                    "page": page["page"],
+                    "char_position": current_length
+                })
                 
-                if page_text:
-                    # Track where page breaks occur in the text
-                    current_length = sum(len(t) for t in text_content)
-                    metadata["page_breaks"].append({
-                        "page": page_num,
-                        "char_position": current_length
-                    })
-                    
-                    text_content.append(f"\n\n--- Page {page_num} ---\n\n")
-                    text_content.append(page_text)
+                marker = PAGE_MARKER.format(page=page["page"])
+                text_content.append(marker)
+                text_content.append(page["text"])
+                current_length += len(marker) + len(page["text"])
         
         full_text = "".join(text_content)
         metadata["total_chars"] = len(full_text)
-        metadata["total_tokens"] = count_tokens(full_text)
+        metadata["total_tokens"] = await run_in_cpu_pool(count_tokens, full_text)
         
         return full_text, metadata
         
@@ -71,104 +92,346 @@ async def extract_text_from_pdf(file_path: str) -> Tuple[str, Dict]:
         raise Exception(f"Error extracting text from PDF: {str(e)}")
 
 
+# Per-chunk metadata; everything else describes the document and is stored
+# once in materials.document_metadata. char_length only exists on rows
+# chunked before char spans were recorded.
+CHUNK_POSITION_KEYS = ("page", "char_start", "char_end", "char_length")
+CHUNK_METADATA_KEYS = CHUNK_POSITION_KEYS + ("extraction_method",)
+
+# Lists with one entry per page: useless once every chunk carries its page
+PER_PAGE_METADATA_KEYS = ("page_breaks",)
+
+
+def compact_chunk_metadata(metadata: Dict, keys: Tuple[str, ...] = CHUNK_METADATA_KEYS) -> Dict:
+    """Keep only the per-chunk fields of a metadata dict"""
+    return {key: metadata[key] for key in keys if metadata.get(key) is not None}
+
+
+def document_metadata(metadata: Dict) -> Dict:
+    """Document-level fields of an extraction (or legacy chunk) metadata dict"""
+    return {
+        key: value for key, value in metadata.items()
+        if key not in CHUNK_POSITION_KEYS and key not in PER_PAGE_METADATA_KEYS
+    }
+
+
+class TokenChunker:
+    """
+    Token-window chunker with character offsets
+    
+    Text is encoded once with tiktoken; chunks are windows of exactly
+    `chunk_size` tokens (the last one may be shorter) and consecutive
+    windows share exactly `chunk_overlap` tokens. A window may end up to
+    SNAP_FRACTION earlier so it stops after a line or sentence instead of
+    mid-sentence. Pages are resolved by bisecting the page start offsets.
+    
+    Text can be fed incrementally (add_page), complete windows are emitted
+    as soon as enough tokens are buffered, and only the unfinished tail is
+    kept, so memory does not grow with the document.
+    
+    Chunk metadata is compact: page, char_start/char_end (offsets in the
+    whole document) plus `metadata`, which should only hold per-chunk
+    fields such as extraction_method. Document-level metadata belongs on
+    the materials row, not on every chunk.
+    """
+    
+    # Share of the window (at its end) searched for a line/sentence break
+    SNAP_FRACTION = 0.2
+    
+    def __init__(self, chunk_size: int = 500, chunk_overlap: int = 50, metadata: Optional[Dict] = None):
+        if chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.metadata = metadata or {}
+        self.total_tokens = 0
+        self.next_index = 0
+        self._base = 0  # document offset of _text[0]
+        self._text = ""
+        self._tokens: List[int] = []
+        self._offsets: List[int] = []  # char offset in _text of each token
+        self._page_positions: List[int] = []
+        self._page_numbers: List[int] = []
+    
+    def add_page(
+        self,
+        page_number: int,
+        text: str,
+        tokenized: Optional[Tuple[List[int], List[int]]] = None
+    ) -> List[Dict]:
+        """
+        Append a page (with its page marker), returns the completed chunks
+        
+        `tokenized` is tokenize(PAGE_MARKER + text) when already computed
+        (e.g. in the CPU pool).
+        """
+        if not text:
+            return []
+        return self.add_text(PAGE_MARKER.format(page=page_number) + text, [(0, page_number)], tokenized)
+    
+    def add_text(
+        self,
+        text: str,
+        page_starts: Optional[List[Tuple[int, int]]] = None,
+        tokenized: Optional[Tuple[List[int], List[int]]] = None
+    ) -> List[Dict]:
+        """
+        Append text, returns the completed chunks
+        
+        Args:
+            text: Text to append
+            page_starts: (char position in `text`, page number) pairs
+            tokenized: tokenize(text), if already computed
+        """
+        tokens, offsets = tokenized or tokenize(text)
+        base = len(self._text)
+        self._text += text
+        self._tokens.extend(tokens)
+        self._offsets.extend(base + offset for offset in offsets)
+        for position, page in page_starts or []:
+            self._page_positions.append(base + position)
+            self._page_numbers.append(page)
+        self.total_tokens += len(tokens)
+        return self._emit(final=False)
+    
+    def finish(self) -> List[Dict]:
+        """Emit the remaining tokens"""
+        return self._emit(final=True)
+    
+    def _char_offset(self, token_index: int) -> int:
+        return self._offsets[token_index] if token_index < len(self._offsets) else len(self._text)
+    
+    def _page_at(self, char_offset: int) -> int:
+        i = bisect.bisect_right(self._page_positions, char_offset) - 1
+        return self._page_numbers[i] if i >= 0 else 1
+    
+    def _window_end(self, start: int) -> int:
+        """End of the window starting at `start`, snapped to a break if possible"""
+        end = start + self.chunk_size
+        if end >= len(self._tokens):
+            return len(self._tokens)
+        floor = max(end - int(self.chunk_size * self.SNAP_FRACTION), start + self.chunk_overlap + 1)
+        for candidate in range(end, floor - 1, -1):
+            offset = self._offsets[candidate]
+            if offset > 0 and self._text[offset - 1] in "\n.!?":
+                return candidate
+        return end
+    
+    def _emit(self, final: bool) -> List[Dict]:
+        chunks = []
+        start = 0
+        while start < len(self._tokens):
+            if not final and len(self._tokens) - start < self.chunk_size + 1:
+                break
+            end = self._window_end(start)
+            char_start = self._char_offset(start)
+            char_end = self._char_offset(end)
+            text = self._text[char_start:char_end]
+            if text.strip():
+                chunks.append({
+                    "chunk_text": text,
+                    "chunk_index": self.next_index,
+                    "token_count": end - start,
+                    "metadata": {
+                        "page": self._page_at(char_start),
+                        "char_start": self._base + char_start,
+                        "char_end": self._base + char_end,
+                        **self.metadata
+                    }
+                })
+                self.next_index += 1
+            if end >= len(self._tokens):
+                start = end
+                break
+            start = end - self.chunk_overlap
+        self._drop(start)
+        return chunks
+    
+    def _drop(self, token_index: int) -> None:
+        """Forget everything before a token (already emitted)"""
+        if token_index == 0:
+            return
+        cut = self._char_offset(token_index)
+        page = self._page_at(cut)
+        keep = bisect.bisect_right(self._page_positions, cut)
+        self._page_positions = [0] + [position - cut for position in self._page_positions[keep:]]
+        self._page_numbers = [page] + self._page_numbers[keep:]
+        self._base += cut
+        self._text = self._text[cut:]
+        self._tokens = self._tokens[token_index:]
+        self._offsets = [offset - cut for offset in self._offsets[token_index:]]
+
+
 def chunk_text(
     text: str,
-    chunk_size: int = 500,
-    chunk_overlap: int = 50,
+    chunk_size: Optional[int] = None,
+    chunk_overlap: Optional[int] = None,
     metadata: Optional[Dict] = None
 ) -> List[Dict]:
     """
-    Split text into chunks using LangChain's RecursiveCharacterTextSplitter
+    Split text into token windows (see TokenChunker)
     
     Args:
         text: Text to chunk
-        chunk_size: Target chunk size in tokens
-        chunk_overlap: Overlap between chunks in tokens
-        metadata: Optional metadata to include with each chunk
+        chunk_size: Chunk size in tokens (default RAG_CHUNK_SIZE)
+        chunk_overlap: Overlap between chunks in tokens (default RAG_CHUNK_OVERLAP)
+        metadata: Optional document metadata; its page_breaks give the
+            page of each chunk and only extraction_method is copied into
+            the chunks (see compact_chunk_metadata)
         
     Returns:
         List of chunk dictionaries with text, index, and metadata
     """
     try:
-        # Convert token-based sizes to approximate character sizes
-        # Average: 1 token ≈ 4 characters for English text
-        char_chunk_size = chunk_size * 4
-        char_overlap = chunk_overlap * 4
-        
-        # Initialize text splitter
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=char_chunk_size,
-            chunk_overlap=char_overlap,
-            length_function=len,
-            separators=["\n\n", "\n", ". ", " ", ""]
+        metadata = metadata or {}
+        chunker = TokenChunker(
+            chunk_size or settings.RAG_CHUNK_SIZE,
+            chunk_overlap if chunk_overlap is not None else settings.RAG_CHUNK_OVERLAP,
+            compact_chunk_metadata(metadata, keys=("extraction_method",))
         )
-        
-        # Split text into chunks
-        text_chunks = text_splitter.split_text(text)
-        
-        # Create chunk objects with metadata
-        chunks = []
-        page_breaks = metadata.get("page_breaks", []) if metadata else []
-        
-        for idx, chunk_text in enumerate(text_chunks):
-            # Calculate which page this chunk starts on
-            chunk_start_pos = text.find(chunk_text)
-            chunk_page = 1
-            
-            for page_break in page_breaks:
-                if chunk_start_pos >= page_break["char_position"]:
-                    chunk_page = page_break["page"]
-            
-            chunk_obj = {
-                "chunk_text": chunk_text,
-                "chunk_index": idx,
-                "token_count": count_tokens(chunk_text),
-                "metadata": {
-                    "page": chunk_page,
-                    "char_length": len(chunk_text),
-                    **(metadata or {})
-                }
-            }
-            chunks.append(chunk_obj)
-        
-        return chunks
+        page_breaks = metadata.get("page_breaks", [])
+        chunks = chunker.add_text(
+            text,
+            [(page_break["char_position"], page_break["page"]) for page_break in page_breaks]
+        )
+        return chunks + chunker.finish()
         
     except Exception as e:
         raise Exception(f"Error chunking text: {str(e)}")
 
 
-async def generate_embeddings(texts: List[str]) -> List[List[float]]:
+async def _embed_request(texts: List[str]) -> List[List[float]]:
+    """One OpenAI embeddings request (via the LLM gateway), no cache"""
+    return await llm_gateway.embed(texts, model=settings.OPENAI_EMBEDDING_MODEL)
+
+
+def _checkpoint_key(text: str) -> str:
+    return EmbeddingCache.make_key(text, settings.OPENAI_EMBEDDING_MODEL)
+
+
+def _create_checkpoint() -> Optional[EmbeddingCheckpoint]:
+    if not settings.INGEST_CHECKPOINT_PATH:
+        return None
+    try:
+        return EmbeddingCheckpoint(settings.INGEST_CHECKPOINT_PATH)
+    except Exception as e:
+        logger.error(f"Failed to open ingestion checkpoints, resuming disabled: {e}")
+        return None
+
+
+# Bulk embedder for documents: token-packed, concurrent, retrying requests
+embedding_batcher = EmbeddingBatcher(
+    _embed_request,
+    truncate_tokens,
+    key_fn=_checkpoint_key,
+    max_batch_tokens=settings.INGEST_EMBED_MAX_BATCH_TOKENS,
+    concurrency=settings.INGEST_EMBED_CONCURRENCY,
+    max_attempts=settings.INGEST_EMBED_MAX_ATTEMPTS,
+    backoff_seconds=settings.INGEST_EMBED_BACKOFF_SECONDS,
+    checkpoint=_create_checkpoint()
+)
+
+# Micro-batcher for single-text requests (one per RAG query)
+embedding_dispatcher: Optional[EmbeddingDispatcher] = (
+    EmbeddingDispatcher(
+        _embed_request,
+        window_ms=settings.EMBEDDING_BATCH_WINDOW_MS,
+        max_batch=settings.EMBEDDING_BATCH_MAX_TEXTS
+    )
+    if settings.EMBEDDING_BATCHING_ENABLED
+    else None
+)
+
+
+async def _embed_texts(texts: List[str], checkpoint_id: Optional[str] = None) -> List[List[float]]:
+    """Single texts go through the dispatcher, bulk calls through the batcher"""
+    if embedding_dispatcher is not None and len(texts) == 1 and checkpoint_id is None:
+        return [await embedding_dispatcher.embed(texts[0])]
+    return await embedding_batcher.embed(texts, checkpoint_id)
+
+
+async def generate_embeddings(
+    texts: List[str],
+    normalize_keys: bool = False,
+    checkpoint_id: Optional[str] = None
+) -> List[List[float]]:
     """
     Generate embeddings for a list of texts using OpenAI
     
+    Cached embeddings are reused and identical texts in the same call are
+    embedded only once.
+    
     Args:
         texts: List of text strings to embed
+        normalize_keys: Key the cache on normalized text (case/whitespace
+            insensitive); meant for user questions, not document chunks
+        checkpoint_id: Checkpoint finished requests under this id (the
+            material id) so a failed ingestion resumes on the next run
         
     Returns:
         List of embedding vectors
     """
     try:
-        # OpenAI API allows batch embedding (max 2048 texts per request)
-        batch_size = 2048
-        all_embeddings = []
-        
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
-            
-            response = await openai_client.embeddings.create(
-                model=settings.OPENAI_EMBEDDING_MODEL,
-                input=batch
-            )
-            
-            batch_embeddings = [item.embedding for item in response.data]
-            all_embeddings.extend(batch_embeddings)
-        
-        return all_embeddings
+        if embedding_cache is None:
+            return await _embed_texts(texts, checkpoint_id)
+        
+        model = settings.OPENAI_EMBEDDING_MODEL
+        keys = [
+            EmbeddingCache.make_key(normalize_text(text) if normalize_keys else text, model)
+            for text in texts
+        ]
+        
+        results: Dict[str, List[float]] = {}
+        missing: Dict[str, str] = {}  # key -> text to embed
+        for key, text in zip(keys, texts):
+            if key in results or key in missing:
+                continue
+            cached = embedding_cache.get(key)
+            if cached is not None:
+                results[key] = cached
+            else:
+                missing[key] = text
+        
+        if missing:
+            fresh = await _embed_texts(list(missing.values()), checkpoint_id)
+            new_entries = dict(zip(missing.keys(), fresh))
+            embedding_cache.put_many(new_entries)
+            results.update(new_entries)
+        
+        return [results[key] for key in keys]
         
     except Exception as e:
         raise Exception(f"Error generating embeddings: {str(e)}")
 
 
+def build_chunk_records(
+    material_id: str,
+    chunks: List[Dict],
+    embeddings: List[Optional[List[float]]]
+) -> List[Dict]:
+    """
+    material_chunks rows for chunks and their embeddings
+    
+    With NEAR_DUP_ENABLED every row carries canonical_chunk_id (None unless
+    the chunk was linked to a near-duplicate, whose embedding is None).
+    """
+    records = []
+    for chunk, embedding in zip(chunks, embeddings):
+        record = {
+            "id": chunk.get("id") or str(uuid.uuid4()),
+            "material_id": material_id,
+            "chunk_text": chunk["chunk_text"],
+            "chunk_index": chunk["chunk_index"],
+            "token_count": chunk["token_count"],
+            "embedding": embedding,
+            "metadata": chunk["metadata"]
+        }
+        if settings.NEAR_DUP_ENABLED:
+            record["canonical_chunk_id"] = chunk.get("canonical_chunk_id")
+        records.append(record)
+    return records
+
+
 async def store_chunks_in_database(
     chunks: List[Dict],
     embeddings: List[List[float]],
@@ -190,108 +453,307 @@ async def store_chunks_in_database(
             raise ValueError("Number of chunks and embeddings must match")
         
         # Prepare chunk records for insertion
-        chunk_records = []
-        for chunk, embedding in zip(chunks, embeddings):
-            chunk_records.append({
-                "id": str(uuid.uuid4()),
-                "material_id": material_id,
-                "chunk_text": chunk["chunk_text"],
-                "chunk_index": chunk["chunk_index"],
-                "token_count": chunk["token_count"],
-                "embedding": embedding,
-                "metadata": chunk["metadata"]
-            })
-        
-        # Insert chunks in batches (Supabase has a limit)
-        batch_size = 100
-        supabase = get_supabase_client()
-        
-        for i in range(0, len(chunk_records), batch_size):
-            batch = chunk_records[i:i + batch_size]
-            supabase.table("material_chunks").insert(batch).execute()
-        
-        return len(chunk_records)
+        chunk_records = build_chunk_records(material_id, chunks, embeddings)
+        
+        # Replace the material's chunks in one binary COPY transaction on the
+        # pool path; 100-row batches on the Supabase fallback
+        pool = get_db_pool()
+        if pool is not None and settings.INGEST_BULK_COPY:
+            async with MaterialChunkLoader(pool, material_id) as loader:
+                stored = await loader.copy(chunk_records)
+        else:
+            stored = await insert_material_chunks(chunk_records)
+        
+        # Keep the BM25 index in step with the table
+        if bm25_index is not None:
+            material_info = await fetch_material_info(material_id) or {}
+            await asyncio.to_thread(bm25_index.add_material, material_id, material_info, chunk_records)
+        
+        return stored
         
     except Exception as e:
         raise Exception(f"Error storing chunks in database: {str(e)}")
 
 
+async def invalidate_material_answers(material_id: str) -> None:
+    """Invalidate cached RAG answers whose scope includes this material"""
+    try:
+        material = await fetch_material(material_id, "course_id")
+        course_id = material.get("course_id") if material else None
+    except Exception:
+        course_id = None
+    await asyncio.to_thread(invalidate_answer_cache, course_id, material_id)
+
+
+async def restore_bm25_postings(material_id: str) -> int:
+    """Re-index a material's committed chunk rows in BM25 (none: its postings are dropped)"""
+    rows = await fetch_material_chunk_rows(material_id)
+    material_info = await fetch_material_info(material_id) or {}
+    canonical = [row for row in rows if not row.get("canonical_chunk_id")]
+    return await asyncio.to_thread(bm25_index.add_material, material_id, material_info, canonical)
+
+
+async def store_document_metadata(material_id: str, metadata: Dict) -> None:
+    """
+    Store document-level metadata once on the material
+    
+    Not fatal: before migrate_chunk_metadata.py has added the
+    materials.document_metadata column this only logs a warning.
+    """
+    try:
+        await update_material(material_id, {"document_metadata": document_metadata(metadata)})
+    except Exception as e:
+        logger.warning(f"Could not store document metadata for {material_id}: {e}")
+
+
+def extraction_method(ocr_pages: List[int], total_pages: int) -> str:
+    """Document-level extraction method: pdfplumber, OCR or hybrid (some pages OCR'd)"""
+    if not ocr_pages:
+        return "pdfplumber"
+    if len(ocr_pages) == total_pages:
+        return OCR_METHOD
+    return "hybrid"
+
+
 async def process_pdf_file(
     file_path: str,
     material_id: str,
-    chunk_size: int = 500,
-    chunk_overlap: int = 50
+    chunk_size: Optional[int] = None,
+    chunk_overlap: Optional[int] = None
 ) -> Dict:
     """
-    Complete PDF processing pipeline:
-    1. Extract text from PDF
-    2. Chunk the text
-    3. Generate embeddings
-    4. Store in database
+    Complete PDF processing pipeline, streamed page by page:
+    1. Extract text from each page
+    2. Chunk the text incrementally
+    3. Generate embeddings per batch of chunks
+    4. Store each batch in database: COPY'd into one transaction per
+       material with the asyncpg pool and INGEST_BULK_COPY (searchable at
+       commit, replacing any previous chunks atomically), otherwise
+       inserted per batch (searchable right away)
+    
+    With NEAR_DUP_ENABLED, chunks that repeat a chunk of another material
+    of the course are linked to it (canonical_chunk_id) instead of being
+    embedded and indexed again.
     
     Args:
         file_path: Path to PDF file
         material_id: UUID of the material
-        chunk_size: Target chunk size in tokens
-        chunk_overlap: Overlap between chunks in tokens
+        chunk_size: Chunk size in tokens (default RAG_CHUNK_SIZE)
+        chunk_overlap: Overlap between chunks in tokens (default RAG_CHUNK_OVERLAP)
         
     Returns:
         Processing summary with statistics
     """
+    from app.services.ingestion_pipeline import default_writer, run_ingestion_pipeline
+    
+    if progress_store is not None:
+        await asyncio.to_thread(progress_store.start, material_id, "extracting")
+    
+    loader = None
+    direct_writes = False
     try:
         # Update status to processing
-        supabase = get_supabase_client()
-        supabase.table("materials").update({
+        await update_material(material_id, {
             "processing_status": "processing"
-        }).eq("id", material_id).execute()
-        
-        # Step 1: Extract text
-        text, pdf_metadata = await extract_text_from_pdf(file_path)
-        
-        if not text or len(text.strip()) < 100:
-            raise Exception("PDF appears to be empty or contains too little text")
-        
-        # Step 2: Chunk text
-        chunks = chunk_text(text, chunk_size, chunk_overlap, pdf_metadata)
-        
-        if not chunks:
-            raise Exception("No chunks created from PDF")
+        })
+        material = await fetch_material(material_id, "course_id")
+        course_id = material.get("course_id") if material else None
+        
+        async def on_batch_written(progress: Dict) -> None:
+            # Expose progress; cached answers are invalidated once, when the
+            # material is complete
+            await update_material(material_id, {"chunks_count": progress["chunks"]})
+        
+        async def on_progress(progress: Dict) -> None:
+            if progress_store is None:
+                return
+            reading = progress["pages_extracted"] < progress["total_pages"]
+            # Throttled, but a due write commits to SQLite: keep it off the loop
+            await asyncio.to_thread(
+                progress_store.update,
+                material_id,
+                stage="extracting" if reading else "embedding",
+                pages_total=progress["total_pages"],
+                pages_extracted=progress["pages_extracted"],
+                pages_ocr=len(progress["ocr_pages"]),
+                chunks_created=progress["chunks_created"],
+                chunks_embedded=progress["chunks_embedded"],
+                chunks_stored=progress["chunks"]
+            )
         
-        # Step 3: Generate embeddings
-        chunk_texts = [chunk["chunk_text"] for chunk in chunks]
-        embeddings = await generate_embeddings(chunk_texts)
+        pool = get_db_pool()
+        loader = (
+            MaterialChunkLoader(pool, material_id)
+            if pool is not None and settings.INGEST_BULK_COPY else None
+        )
+        if loader is None:
+            direct_writes = True
+            # Batches of an attempt that died without cleaning up (worker
+            # killed, lease expired) would otherwise be stored twice
+            await delete_material_chunk_rows(material_id)
+            if bm25_index is not None:
+                await asyncio.to_thread(bm25_index.remove_material, material_id)
+        
+        deduplicator = None
+        if near_duplicate_index is not None:
+            if direct_writes:
+                # The previous run's rows are gone, and so are its signatures
+                await asyncio.to_thread(near_duplicate_index.remove_material, material_id)
+            else:
+                # Its rows stay until the loader commits (commit_material then
+                # replaces their signatures); drop what a crashed run staged
+                await asyncio.to_thread(near_duplicate_index.discard_pending, material_id)
+            deduplicator = near_duplicate_index.deduplicator(material_id, course_id)
+        
+        # Checks fail inside the loader's transaction, so nothing is committed
+        async with loader or nullcontext():
+            stats = await run_ingestion_pipeline(
+                file_path,
+                material_id,
+                chunk_size,
+                chunk_overlap,
+                write_batch=default_writer(material_id, loader),
+                # Batches in the loader's transaction are not visible yet
+                on_batch_written=on_batch_written if loader is None else None,
+                on_progress=on_progress,
+                dedupe=deduplicator
+            )
+            
+            if stats["text_chars"] < 100:
+                raise Exception("PDF appears to be empty or contains too little text")
+            
+            if not stats["chunks"]:
+                raise Exception("No chunks created from PDF")
         
-        # Step 4: Store in database
-        chunks_stored = await store_chunks_in_database(chunks, embeddings, material_id)
+        if near_duplicate_index is not None:
+            # Rows are committed: later materials may link to them
+            await asyncio.to_thread(near_duplicate_index.commit_material, material_id)
         
         # Update material status
-        supabase.table("materials").update({
+        await update_material(material_id, {
             "processing_status": "completed",
-            "chunks_count": chunks_stored,
+            "chunks_count": stats["chunks"],
             "processed_at": "now()"
-        }).eq("id", material_id).execute()
+        })
+        await store_document_metadata(material_id, {
+            "extraction_method": extraction_method(stats["ocr_pages"], stats["total_pages"]),
+            "ocr_pages": stats["ocr_pages"],
+            "total_pages": stats["total_pages"],
+            "total_chars": stats["total_chars"],
+            "total_tokens": stats["total_tokens"],
+            "duplicate_chunks": stats["duplicate_chunks"],
+            "chunk_size": chunk_size or settings.RAG_CHUNK_SIZE,
+            "chunk_overlap": chunk_overlap if chunk_overlap is not None else settings.RAG_CHUNK_OVERLAP
+        })
+        
+        # New chunks are searchable: drop cached answers for this scope
+        await asyncio.to_thread(invalidate_answer_cache, course_id, material_id)
+        
+        # Everything is stored; a failed run keeps its checkpoint to resume
+        await asyncio.to_thread(embedding_batcher.clear_checkpoint, material_id)
+        if progress_store is not None:
+            await asyncio.to_thread(progress_store.finish, material_id, "completed")
         
         # Return summary
         return {
             "success": True,
             "material_id": material_id,
-            "total_pages": pdf_metadata["total_pages"],
-            "total_chars": pdf_metadata["total_chars"],
-            "total_tokens": pdf_metadata["total_tokens"],
-            "chunks_created": chunks_stored,
-            "chunk_size": chunk_size,
-            "chunk_overlap": chunk_overlap
+            "total_pages": stats["total_pages"],
+            "ocr_pages": len(stats["ocr_pages"]),
+            "total_chars": stats["total_chars"],
+            "total_tokens": stats["total_tokens"],
+            "chunks_created": stats["chunks"],
+            "duplicate_chunks": stats["duplicate_chunks"],
+            "chunk_size": chunk_size or settings.RAG_CHUNK_SIZE,
+            "chunk_overlap": chunk_overlap if chunk_overlap is not None else settings.RAG_CHUNK_OVERLAP,
+            "first_chunk_seconds": stats["first_chunk_seconds"],
+            "elapsed_seconds": stats["elapsed_seconds"],
+            "chunks_per_second": stats["chunks_per_second"]
         }
         
     except Exception as e:
-        # Update status to failed
-        supabase.table("materials").update({
-            "processing_status": "failed"
-        }).eq("id", material_id).execute()
+        try:
+            if direct_writes:
+                # Batches written before the failure must not stay searchable
+                await delete_material_chunk_rows(material_id)
+                if bm25_index is not None:
+                    await asyncio.to_thread(bm25_index.remove_material, material_id)
+                if near_duplicate_index is not None:
+                    await asyncio.to_thread(near_duplicate_index.remove_material, material_id)
+            elif loader is not None:
+                # The loader's transaction rolled back and the rows of the
+                # last successful run are still there, with their committed
+                # signatures; only the BM25 index (replaced at the first
+                # batch) must be put back to match them
+                if near_duplicate_index is not None:
+                    await asyncio.to_thread(near_duplicate_index.discard_pending, material_id)
+                if bm25_index is not None:
+                    await restore_bm25_postings(material_id)
+            await invalidate_material_answers(material_id)
+        except Exception as cleanup_error:
+            logger.error(f"Cleanup after failed processing of {material_id} failed: {cleanup_error}")
+        
+        if progress_store is not None:
+            await asyncio.to_thread(progress_store.finish, material_id, "failed", str(e))
+        
+        # Update status to failed (rows left untouched keep their chunks_count)
+        failed = {"processing_status": "failed"}
+        if direct_writes:
+            failed["chunks_count"] = 0
+        await update_material(material_id, failed)
         
         raise Exception(f"PDF processing failed: {str(e)}")
 
 
+async def link_duplicate_material(material_id: str, source: Dict) -> Dict:
+    """
+    Give a material the chunks of an already processed copy of its PDF
+
+    Rows are copied inside the database (text, embeddings and metadata
+    as-is), so nothing is extracted, chunked or embedded again.
+
+    Args:
+        material_id: UUID of the new material
+        source: Processed material with the same content_hash (id and
+            document_metadata are used)
+
+    Returns:
+        Processing summary, like process_pdf_file
+    """
+    try:
+        rows = await copy_material_chunks(source["id"], material_id)
+        if not rows:
+            raise Exception(f"Source material {source['id']} has no chunks")
+
+        if bm25_index is not None:
+            material_info = await fetch_material_info(material_id) or {}
+            canonical = [row for row in rows if not row.get("canonical_chunk_id")]
+            await asyncio.to_thread(bm25_index.add_material, material_id, material_info, canonical)
+
+        await update_material(material_id, {
+            "processing_status": "completed",
+            "chunks_count": len(rows),
+            "processed_at": "now()"
+        })
+        if source.get("document_metadata"):
+            await store_document_metadata(material_id, source["document_metadata"])
+        await invalidate_material_answers(material_id)
+
+        return {
+            "success": True,
+            "material_id": material_id,
+            "deduplicated_from": source["id"],
+            "chunks_created": len(rows)
+        }
+
+    except Exception as e:
+        try:
+            await delete_material_chunk_rows(material_id)
+        except Exception as cleanup_error:
+            logger.error(f"Cleanup after failed link of {material_id} failed: {cleanup_error}")
+        raise Exception(f"Linking duplicate material failed: {str(e)}")
+
+
 async def delete_material_chunks(material_id: str) -> int:
     """
     Delete all chunks for a material (cleanup)
@@ -303,19 +765,22 @@ async def delete_material_chunks(material_id: str) -> int:
         Number of chunks deleted
     """
     try:
-        supabase = get_supabase_client()
-        result = supabase.table("material_chunks").delete().eq(
-            "material_id", material_id
-        ).execute()
+        deleted = await delete_material_chunk_rows(material_id)
+        if bm25_index is not None:
+            await asyncio.to_thread(bm25_index.remove_material, material_id)
+        if near_duplicate_index is not None:
+            await asyncio.to_thread(near_duplicate_index.remove_material, material_id)
+        await invalidate_material_answers(material_id)
+        await asyncio.to_thread(embedding_batcher.clear_checkpoint, material_id)
         
         # Reset material processing status
-        supabase.table("materials").update({
+        await update_material(material_id, {
             "processing_status": "pending",
             "chunks_count": 0,
             "processed_at": None
-        }).eq("id", material_id).execute()
+        })
         
-        return len(result.data) if result.data else 0
+        return deleted
         
     except Exception as e:
         raise Exception(f"Error deleting chunks: {str(e)}")
@@ -0,0 +1,98 @@
+"""
+PDF Text Service
+CPU-bound PDF text extraction and tokenization. Kept free of database and
+API clients so these functions can run in the CPU pool's worker processes
+(see cpu_pool) instead of the process serving queries.
+"""
+
+from typing import Dict, List, Tuple
+
+import pdfplumber
+import tiktoken
+
+from app.services.ocr_service import page_needs_ocr
+
+# Initialize tokenizer
+encoding = tiktoken.get_encoding("cl100k_base")
+
+# Separator written before the text of each page
+PAGE_MARKER = "\n\n--- Page {page} ---\n\n"
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens in text using tiktoken"""
+    return len(encoding.encode(text))
+
+
+def tokenize(text: str) -> Tuple[List[int], List[int]]:
+    """Token ids of `text` and the char offset where each token starts"""
+    tokens = encoding.encode(text, disallowed_special=())
+    _, offsets = encoding.decode_with_offsets(tokens)
+    return tokens, offsets
+
+
+def truncate_tokens(texts: List[str], max_tokens: int) -> Tuple[List[int], Dict[int, str]]:
+    """
+    Token count of each text, capped at `max_tokens`
+
+    Returns:
+        The counts and, by index, the truncated text of each longer input
+    """
+    counts = []
+    truncated = {}
+    for i, text in enumerate(texts):
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) > max_tokens:
+            tokens = tokens[:max_tokens]
+            truncated[i] = encoding.decode(tokens)
+        counts.append(len(tokens))
+    return counts, truncated
+
+
+def page_count(file_path: str) -> int:
+    with pdfplumber.open(file_path) as pdf:
+        return len(pdf.pages)
+
+
+def extract_page_range(
+    file_path: str,
+    first_page: int,
+    last_page: int,
+    classify: bool = False,
+    with_tokens: bool = True
+) -> List[Dict]:
+    """
+    Extract the text layer of pages first_page..last_page (1-based)
+
+    Args:
+        file_path: Path to PDF file
+        first_page: First page of the range
+        last_page: Last page of the range (inclusive)
+        classify: Also decide whether each page needs OCR (page_needs_ocr)
+        with_tokens: Tokenize each page with its page marker, ready for
+            TokenChunker.add_page (skipped for pages that need OCR)
+
+    Returns:
+        One dict per page: page, text, needs_ocr, tokens, offsets
+    """
+    pages = []
+    with pdfplumber.open(file_path) as pdf:
+        for page_number in range(first_page, last_page + 1):
+            page = pdf.pages[page_number - 1]
+            try:
+                text = page.extract_text() or ""
+                needs_ocr = classify and page_needs_ocr(page, text)
+            finally:
+                # Drop the parsed layout objects pdfplumber caches per page
+                page.close()
+            tokens = offsets = None
+            if with_tokens and text and not needs_ocr:
+                tokens, offsets = tokenize(PAGE_MARKER.format(page=page_number) + text)
+            pages.append({
+                "page": page_number,
+                "text": text,
+                "needs_ocr": needs_ocr,
+                "tokens": tokens,
+                "offsets": offsets
+            })
+    return pages
@@ -0,0 +1,164 @@
+"""
+Progress Store Service
+Structured ingestion progress per material (stage, pages extracted/OCR'd,
+chunks created/embedded/stored, ETA) kept in memory by the process doing
+the work and persisted to SQLite, so web processes can stream it to
+clients without querying the database
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Stages after which nothing else is published
+FINAL_STAGES = ("completed", "failed")
+
+COUNTERS = ("pages_total", "pages_extracted", "pages_ocr", "chunks_created", "chunks_embedded", "chunks_stored")
+
+
+def estimate(progress: Dict, now: float) -> Dict:
+    """
+    Completion fraction and ETA
+
+    Half of the work is reading pages, half is storing chunks; the final
+    chunk count is extrapolated from the chunks created per page so far.
+    """
+    pages_total = progress.get("pages_total") or 0
+    pages_done = max(progress.get("pages_extracted", 0), progress.get("pages_ocr", 0))
+    if progress.get("stage") == "completed":
+        fraction = 1.0
+    elif not pages_total or not pages_done:
+        fraction = 0.0
+    else:
+        pages_fraction = min(pages_done / pages_total, 1.0)
+        expected_chunks = progress.get("chunks_created", 0) / pages_fraction
+        stored_fraction = min(progress.get("chunks_stored", 0) / expected_chunks, 1.0) if expected_chunks else 0.0
+        fraction = (pages_fraction + stored_fraction) / 2
+
+    elapsed = now - progress["started_at"]
+    eta = None
+    if 0 < fraction < 1:
+        eta = round(elapsed * (1 - fraction) / fraction, 1)
+    elif fraction >= 1:
+        eta = 0.0
+    return {"percent": round(fraction * 100, 1), "elapsed_seconds": round(elapsed, 1), "eta_seconds": eta}
+
+
+class ProgressStore:
+    """
+    Latest progress record per material
+
+    Writers merge counters into an in-memory record and persist it at most
+    every `min_interval` seconds (stage changes are written immediately);
+    readers in any process read the SQLite row.
+    """
+
+    def __init__(self, path: str, min_interval: float = 0.5, ttl_seconds: int = 24 * 3600):
+        self.min_interval = min_interval
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._records: Dict[str, Dict] = {}
+        self._written_at: Dict[str, float] = {}
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS progress (
+                material_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL
+            );
+            """
+        )
+        self._db.commit()
+
+    def _write(self, material_id: str, record: Dict) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO progress (material_id, data, updated_at) VALUES (?, ?, ?)",
+            (material_id, json.dumps(record), record["updated_at"])
+        )
+        self._db.commit()
+        self._written_at[material_id] = record["updated_at"]
+
+    @staticmethod
+    def _new_record(material_id: str, stage: str) -> Dict:
+        now = time.time()
+        record = {"material_id": material_id, "stage": stage, "started_at": now, "updated_at": now, "error": None}
+        record.update({counter: 0 for counter in COUNTERS})
+        return record
+
+    def reset(self, material_id: str, stage: str = "queued") -> None:
+        """Publish a fresh record without tracking it (e.g. job queued or retried)"""
+        record = self._new_record(material_id, stage)
+        with self._lock:
+            self._records.pop(material_id, None)
+            self._write(material_id, record)
+
+    def start(self, material_id: str, stage: str = "extracting") -> None:
+        """Reset the record of a material at the start of a run"""
+        record = self._new_record(material_id, stage)
+        now = record["started_at"]
+        with self._lock:
+            self._records[material_id] = record
+            self._write(material_id, record)
+            # Opportunistic cleanup of old runs
+            self._db.execute("DELETE FROM progress WHERE updated_at < ?", (now - self.ttl_seconds,))
+            self._db.commit()
+
+    def update(self, material_id: str, stage: Optional[str] = None, **counters) -> None:
+        """Merge counters (and optionally a new stage) into a material's record"""
+        now = time.time()
+        with self._lock:
+            record = self._records.get(material_id)
+            if record is None:
+                return
+            stage_changed = stage is not None and stage != record["stage"]
+            if stage is not None:
+                record["stage"] = stage
+            record.update(counters)
+            record["updated_at"] = now
+            if stage_changed or now - self._written_at.get(material_id, 0) >= self.min_interval:
+                try:
+                    self._write(material_id, record)
+                except sqlite3.Error as e:
+                    logger.warning(f"Could not persist progress of {material_id}: {e}")
+
+    def finish(self, material_id: str, stage: str, error: Optional[str] = None) -> None:
+        """Publish the final stage (completed/failed) and forget the in-memory record"""
+        with self._lock:
+            record = self._records.pop(material_id, None)
+            if record is None:
+                return
+            record["stage"] = stage
+            record["error"] = error
+            record["updated_at"] = time.time()
+            self._write(material_id, record)
+            self._written_at.pop(material_id, None)
+
+    def get(self, material_id: str) -> Optional[Dict]:
+        """Latest published progress with percent/elapsed/ETA, or None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data FROM progress WHERE material_id = ?", (material_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        progress = json.loads(row[0])
+        end = progress["updated_at"] if progress["stage"] in FINAL_STAGES else time.time()
+        return {**progress, **estimate(progress, end)}
+
+
+def _create_progress_store() -> Optional[ProgressStore]:
+    try:
+        return ProgressStore(settings.PROGRESS_STORE_PATH, min_interval=settings.PROGRESS_MIN_INTERVAL_SECONDS)
+    except Exception as e:
+        logger.error(f"Failed to open progress store, progress streaming disabled: {e}")
+        return None
+
+
+progress_store = _create_progress_store()
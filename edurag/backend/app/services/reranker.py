@@ -0,0 +1,134 @@
+"""
+Re-ranking Service
+Post-retrieval stage: Maximal Marginal Relevance over the candidate
+embeddings (so the prompt does not get five near-identical chunks from the
+same page) blended with a cheap lexical score against the question
+"""
+
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.core.database import fetch_chunk_embeddings
+from app.services.bm25_index import tokenize
+
+
+def lexical_scores(question: str, chunks: List[Dict]) -> np.ndarray:
+    """Fraction of the question's terms (stemmed, no stopwords) present in each chunk"""
+    terms = set(tokenize(question))
+    if not terms:
+        return np.zeros(len(chunks), dtype=np.float32)
+    return np.array(
+        [len(terms & set(tokenize(chunk.get("chunk_text", "")))) / len(terms) for chunk in chunks],
+        dtype=np.float32
+    )
+
+
+def mmr_select(
+    candidates: np.ndarray,
+    relevance: np.ndarray,
+    k: int,
+    diversity: float
+) -> List[int]:
+    """
+    Greedy Maximal Marginal Relevance
+
+    Args:
+        candidates: Unit-norm candidate vectors (n, dim); zero rows are
+            treated as unknown (no redundancy with anything)
+        relevance: Relevance of each candidate to the query (n,)
+        k: Number of candidates to select
+        diversity: 0 = pure relevance order, 1 = pure novelty
+
+    Returns:
+        Indices of the selected candidates, in selection order
+    """
+    n = len(candidates)
+    k = min(k, n)
+    if k <= 0:
+        return []
+
+    weight = 1.0 - diversity
+    # Highest similarity of each candidate to anything already selected
+    max_redundancy = np.full(n, -np.inf, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    selected = []
+    for step in range(k):
+        if step == 0:
+            scores = relevance.copy()
+        else:
+            scores = weight * relevance - diversity * max_redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_redundancy, candidates @ candidates[best], out=max_redundancy)
+    return selected
+
+
+async def rerank_chunks(
+    question: str,
+    question_embedding: List[float],
+    chunks: List[Dict],
+    top_k: int,
+    diversity: float,
+    lexical_weight: float = 0.0
+) -> Tuple[List[Dict], Dict]:
+    """
+    Select top_k of the over-fetched candidates with MMR
+
+    Relevance is the cosine similarity to the question blended with the
+    lexical score (`lexical_weight`). Candidate vectors are read from
+    material_chunks; a candidate whose vector is missing keeps only its
+    lexical relevance and never counts as redundant.
+
+    Args:
+        question: User's question
+        question_embedding: Question vector
+        chunks: Candidates in retrieval order
+        top_k: Number of chunks to keep
+        diversity: MMR trade-off (0 = relevance only)
+        lexical_weight: Weight of the lexical score in the relevance
+
+    Returns:
+        Tuple of (chunks, stats) with `rerank_ms` and `rerank_candidates`
+    """
+    start = time.perf_counter()
+    stats = {"rerank_candidates": len(chunks), "rerank_missing_vectors": 0}
+
+    if len(chunks) <= 1:
+        stats["rerank_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        return chunks[:top_k], stats
+
+    keys = [
+        (chunk.get("material_id"), chunk.get("chunk_index"))
+        for chunk in chunks
+    ]
+    vectors = await fetch_chunk_embeddings(
+        [key for key in keys if key[0] is not None and key[1] is not None]
+    )
+
+    query = np.asarray(question_embedding, dtype=np.float32)
+    query /= np.linalg.norm(query) or 1.0
+    matrix = np.zeros((len(chunks), len(query)), dtype=np.float32)
+    for row, key in enumerate(keys):
+        vector = vectors.get(key)
+        if vector is not None:
+            matrix[row] = vector
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.where(norms == 0, 1.0, norms)
+
+    relevance = matrix @ query
+    if lexical_weight:
+        relevance = (1.0 - lexical_weight) * relevance + lexical_weight * lexical_scores(question, chunks)
+
+    order = mmr_select(matrix, relevance, top_k, diversity)
+    reranked = [
+        {**chunks[i], "rerank_score": round(float(relevance[i]), 4)}
+        for i in order
+    ]
+
+    stats["rerank_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    stats["rerank_missing_vectors"] = len(chunks) - sum(1 for key in keys if key in vectors)
+    return reranked, stats
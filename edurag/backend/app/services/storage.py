@@ -3,6 +3,7 @@ Supabase Storage Service
 Handles file upload/download from Supabase Storage
 """
 
+import asyncio
 import os
 from typing import Optional
 from app.core.database import get_supabase_client
@@ -39,6 +40,12 @@ def ensure_bucket_exists() -> bool:
         return False
 
 
+def material_storage_path(file_name: str, material_id: str) -> str:
+    """Unique storage path of a material's file: materials/{material_id}{ext}"""
+    file_extension = os.path.splitext(file_name)[1]
+    return f"materials/{material_id}{file_extension}"
+
+
 async def upload_pdf_to_storage(
     file_content: bytes,
     file_name: str,
@@ -61,9 +68,7 @@ async def upload_pdf_to_storage(
         
         supabase = get_supabase_client()
         
-        # Create unique file path: materials/{material_id}/{filename}
-        file_extension = os.path.splitext(file_name)[1]
-        storage_path = f"materials/{material_id}{file_extension}"
+        storage_path = material_storage_path(file_name, material_id)
         
         # Upload file
         supabase.storage.from_(STORAGE_BUCKET).upload(
@@ -78,6 +83,39 @@ async def upload_pdf_to_storage(
         raise Exception(f"Error uploading file to storage: {str(e)}")
 
 
+def _upload_file(file_path: str, storage_path: str) -> None:
+    ensure_bucket_exists()
+    supabase = get_supabase_client()
+    # A file object is sent as a streamed multipart body, not read into memory
+    with open(file_path, "rb") as file:
+        supabase.storage.from_(STORAGE_BUCKET).upload(
+            path=storage_path,
+            file=file,
+            file_options={"content-type": "application/pdf", "upsert": "true"}
+        )
+
+
+async def upload_pdf_file_to_storage(file_path: str, storage_path: str) -> str:
+    """
+    Upload a PDF from disk to Supabase Storage without loading it in memory
+    
+    Overwrites an existing object, so a retried upload is harmless.
+    
+    Args:
+        file_path: Local path of the PDF
+        storage_path: Destination path (see material_storage_path)
+        
+    Returns:
+        Storage path of the uploaded file
+    """
+    try:
+        await asyncio.to_thread(_upload_file, file_path, storage_path)
+        return storage_path
+        
+    except Exception as e:
+        raise Exception(f"Error uploading file to storage: {str(e)}")
+
+
 async def download_pdf_from_storage(storage_path: str) -> bytes:
     """
     Download PDF file from Supabase Storage
@@ -0,0 +1,118 @@
+"""
+Standalone ingestion worker
+
+    python -m app.worker [--concurrency N]       run queued jobs until SIGTERM
+    python -m app.worker requeue [--material-id ID]
+                                                 queue failed materials again (and
+                                                 ones stuck in processing with no job)
+    python -m app.worker status                  job counts and dead-lettered jobs
+
+Set JOB_WORKER_EMBEDDED=false on the web service so ingestion only runs here.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import signal
+from typing import Optional
+
+from app.core.config import settings
+from app.core.database import init_db, close_db, fetch_materials_by_status, update_material
+from app.services.cpu_pool import start_cpu_pool, stop_cpu_pool
+from app.services.ingestion_worker import create_worker, enqueue_pdf_processing, spool_path
+from app.services.job_queue import DEAD, PROCESS_PDF, job_queue
+from app.services.ocr_service import shutdown_ocr_pool
+from app.services.storage import material_storage_path
+
+logging.basicConfig(
+    level=getattr(logging, settings.LOG_LEVEL),
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("app.worker")
+
+
+async def run_worker(concurrency: Optional[int]) -> None:
+    await init_db()
+    worker = create_worker(concurrency)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stop)
+    try:
+        await start_cpu_pool()
+        await worker.run()
+    finally:
+        shutdown_ocr_pool()
+        stop_cpu_pool()
+        await close_db()
+
+
+async def requeue(material_id: Optional[str]) -> None:
+    """
+    Queue failed materials, and materials left in processing by a lost job
+
+    A material whose PDF is neither in storage (file_url) nor spooled on
+    this host cannot be processed again and is reported instead.
+    """
+    await init_db()
+    materials = await fetch_materials_by_status(["failed", "processing"], "id, processing_status, file_url")
+    if material_id:
+        materials = [material for material in materials if material["id"] == material_id]
+
+    queued = 0
+    missing = []
+    for material in materials:
+        if material["processing_status"] == "processing" and job_queue.find_active(
+            PROCESS_PDF, "material_id", material["id"]
+        ):
+            continue  # still being worked on
+        spooled = spool_path(material["id"])
+        file_path = spooled if os.path.exists(spooled) else None
+        if not file_path and not material.get("file_url"):
+            missing.append(material)
+            continue
+        # A spooled upload not in storage yet is uploaded by the job
+        storage_path = material.get("file_url") or material_storage_path(spooled, material["id"])
+        job_id = enqueue_pdf_processing(material["id"], storage_path, file_path)
+        await update_material(material["id"], {"processing_status": "pending"})
+        print(f"   {material['id']} ({material['processing_status']}) -> job {job_id}")
+        queued += 1
+
+    await close_db()
+    print(f"✅ {queued} materials queued")
+    if missing:
+        print(f"⚠️  {len(missing)} materials skipped, PDF neither in storage nor spooled on this host "
+              f"(upload them again):")
+        for material in missing:
+            print(f"   {material['id']} ({material['processing_status']})")
+
+
+def status() -> None:
+    print(job_queue.stats())
+    dead = job_queue.list_jobs(DEAD)
+    if dead:
+        print("\nDead-lettered jobs:")
+    for job in dead:
+        print(f"   #{job['id']} {job['kind']} {job['payload'].get('material_id')} "
+              f"after {job['attempts']} attempts: {job['last_error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EduRAG ingestion worker")
+    parser.add_argument("--concurrency", type=int, help="Jobs at once (default JOB_WORKER_CONCURRENCY)")
+    commands = parser.add_subparsers(dest="command")
+    requeue_parser = commands.add_parser("requeue", help="Queue failed/stuck materials again")
+    requeue_parser.add_argument("--material-id")
+    commands.add_parser("status", help="Show queue counts and dead-lettered jobs")
+    args = parser.parse_args()
+
+    if args.command == "requeue":
+        asyncio.run(requeue(args.material_id))
+    elif args.command == "status":
+        status()
+    else:
+        asyncio.run(run_worker(args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Standalone benchmarks (run from edurag/backend with `python -m benchmarks.<name>`)"""
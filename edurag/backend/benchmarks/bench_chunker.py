@@ -0,0 +1,120 @@
+"""
+Micro-benchmark: token-window chunker vs the previous LangChain path
+
+The previous chunk_text split on characters (chunk_size * 4), located each
+chunk with text.find() and scanned every page break per chunk, then
+re-tokenized every chunk. On a synthetic document with a header and footer
+repeated on every page this reports, for both paths: time, chunk count,
+token-size spread, and how many chunks got the wrong page.
+
+Usage (from edurag/backend):
+    python -m benchmarks.bench_chunker --pages 1000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import time
+
+# Settings() requires these; nothing connects to them here
+for _name in ("SUPABASE_URL", "SUPABASE_ANON_KEY", "SUPABASE_SERVICE_ROLE_KEY", "OPENAI_API_KEY"):
+    os.environ.setdefault(_name, "unused")
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter  # noqa: E402
+
+from app.services.pdf_processor import PAGE_MARKER, chunk_text, count_tokens  # noqa: E402
+
+WORDS = (
+    "la célula es la unidad básica de la vida y contiene material genético que dirige "
+    "sus funciones el metabolismo transforma energía mediante reacciones químicas "
+    "catalizadas por enzimas la fotosíntesis convierte luz en energía química"
+).split()
+
+HEADER = "Universidad Nacional - Biología General - Unidad 3"
+FOOTER = "Material de uso exclusivo para estudiantes del curso"
+
+
+def synthetic_document(pages: int, seed: int = 0):
+    """Text laid out like extract_text_from_pdf output, plus its page_breaks"""
+    rng = random.Random(seed)
+    parts = []
+    page_breaks = []
+    length = 0
+    for page in range(1, pages + 1):
+        # Some pages (chapter openers, figures) carry only a short caption
+        lines = rng.randint(25, 45) if rng.random() > 0.1 else 1
+        body = "\n".join(
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 16))).capitalize() + "."
+            for _ in range(lines)
+        )
+        page_breaks.append({"page": page, "char_position": length})
+        piece = PAGE_MARKER.format(page=page) + f"{HEADER}\n{body}\n{FOOTER}"
+        parts.append(piece)
+        length += len(piece)
+    return "".join(parts), {"page_breaks": page_breaks}
+
+
+def legacy_chunk_text(text, chunk_size, chunk_overlap, metadata):
+    """The LangChain-based chunk_text this repo used before (page_breaks not copied)"""
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size * 4,
+        chunk_overlap=chunk_overlap * 4,
+        length_function=len,
+        separators=["\n\n", "\n", ". ", " ", ""]
+    )
+    chunks = []
+    page_breaks = metadata.get("page_breaks", [])
+    for idx, piece in enumerate(splitter.split_text(text)):
+        chunk_start_pos = text.find(piece)
+        chunk_page = 1
+        for page_break in page_breaks:
+            if chunk_start_pos >= page_break["char_position"]:
+                chunk_page = page_break["page"]
+        chunks.append({
+            "chunk_text": piece,
+            "chunk_index": idx,
+            "token_count": count_tokens(piece),
+            "metadata": {"page": chunk_page, "char_length": len(piece)}
+        })
+    return chunks
+
+
+def wrong_pages(chunks, text, page_breaks):
+    """Chunks whose page differs from the page of their true position"""
+    positions = [page_break["char_position"] for page_break in page_breaks]
+    wrong = 0
+    search_from = 0
+    for chunk in chunks:
+        start = text.find(chunk["chunk_text"], search_from)
+        search_from = start + 1
+        true_page = sum(1 for position in positions if position <= start) or 1
+        wrong += chunk["metadata"]["page"] != true_page
+    return wrong
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    args = parser.parse_args()
+
+    text, metadata = synthetic_document(args.pages)
+    print(f"Document: {args.pages} pages, {len(text) / 1e6:.1f}M chars\n")
+    print(f"{'path':<12} {'time':>8} {'chunks':>7} {'tokens min/mean/max':>22} {'wrong page':>11}")
+
+    for name, fn in (("langchain", legacy_chunk_text), ("token", chunk_text)):
+        start = time.perf_counter()
+        chunks = fn(text, args.chunk_size, args.chunk_overlap, metadata)
+        elapsed = time.perf_counter() - start
+        sizes = [chunk["token_count"] for chunk in chunks]
+        print(
+            f"{name:<12} {elapsed:>7.2f}s {len(chunks):>7} "
+            f"{min(sizes):>8}/{statistics.mean(sizes):>6.0f}/{max(sizes):>5} "
+            f"{wrong_pages(chunks, text, metadata['page_breaks']):>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Benchmark: streaming ingestion pipeline vs the previous sequential path
+
+Writes a synthetic text PDF (default 1000 pages), then ingests it in a
+fresh subprocess per mode and reports peak RSS, time until the first chunk
+is written (searchable) and total time. Embeddings come from the offline
+fake provider and the writer keeps only a row counter, so no OpenAI key
+or database is needed.
+
+- sequential: extract the whole text, chunk all of it, embed all chunks,
+  then write in batches of 100 (the old process_pdf_file)
+- pipeline: run_ingestion_pipeline (bounded queues between stages)
+
+Usage (from edurag/backend):
+    python -m benchmarks.bench_ingestion --pages 1000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+WORDS = (
+    "la célula es la unidad básica de la vida y contiene material genético que dirige "
+    "sus funciones el metabolismo transforma energía mediante reacciones químicas "
+    "catalizadas por enzimas la fotosíntesis convierte luz en energía química y la "
+    "respiración celular libera esa energía en forma de ATP los tejidos se organizan "
+    "en órganos y sistemas que cooperan para mantener la homeostasis del organismo"
+).split()
+
+LINES_PER_PAGE = 45
+WORDS_PER_LINE = 12
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_synthetic_pdf(path: str, pages: int, seed: int = 0) -> None:
+    """Minimal PDF with `pages` pages of Latin-1 text in Helvetica"""
+    rng = random.Random(seed)
+    objects = []  # body of object n is objects[n - 1]
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(b"")  # filled in once the page tree exists
+    pages_obj = add(b"")
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+
+    page_ids = []
+    for number in range(1, pages + 1):
+        lines = [f"Capitulo {number}"] + [
+            " ".join(rng.choice(WORDS) for _ in range(WORDS_PER_LINE)).capitalize() + "."
+            for _ in range(LINES_PER_PAGE)
+        ]
+        text_ops = ["BT /F1 9 Tf 40 800 Td 11 TL"]
+        text_ops += [f"({_escape(line)}) Tj T*" for line in lines]
+        text_ops.append("ET")
+        stream = "\n".join(text_ops).encode("latin-1")
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_obj, font, content)
+        ))
+
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[pages_obj - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_obj
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, 1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+            len(objects) + 1, catalog, xref
+        ))
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def run_mode(mode: str, pdf_path: str) -> dict:
+    from app.services import pdf_processor
+    from app.services.ingestion_pipeline import run_ingestion_pipeline
+
+    started = time.perf_counter()
+    result = {"first_chunk_seconds": None, "chunks": 0}
+
+    async def write(chunks, embeddings):
+        if result["first_chunk_seconds"] is None:
+            result["first_chunk_seconds"] = round(time.perf_counter() - started, 2)
+        result["chunks"] += len(chunks)
+        return len(chunks)
+
+    if mode == "sequential":
+        text, metadata = await pdf_processor.extract_text_from_pdf(pdf_path)
+        chunks = pdf_processor.chunk_text(text, 500, 50, metadata)
+        embeddings = await pdf_processor.generate_embeddings([chunk["chunk_text"] for chunk in chunks])
+        for i in range(0, len(chunks), 100):
+            await write(chunks[i:i + 100], embeddings[i:i + 100])
+    else:
+        await run_ingestion_pipeline(pdf_path, "benchmark", write_batch=write)
+
+    result["total_seconds"] = round(time.perf_counter() - started, 2)
+    result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    return result
+
+
+def child_env() -> dict:
+    env = dict(os.environ)
+    env.update({
+        "LLM_PROVIDER": "fake",
+        "LLM_FAKE_LATENCY_SECONDS": "0.02",
+        "EMBEDDING_CACHE_ENABLED": "false",
+        "RAG_HYBRID_SEARCH": "false"
+    })
+    # Settings() requires these; nothing connects to them here
+    for name in ("SUPABASE_URL", "SUPABASE_ANON_KEY", "SUPABASE_SERVICE_ROLE_KEY", "OPENAI_API_KEY"):
+        env.setdefault(name, "unused")
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--child", choices=["sequential", "pipeline"], help=argparse.SUPPRESS)
+    parser.add_argument("--pdf", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(run_mode(args.child, args.pdf))))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, "synthetic.pdf")
+        write_synthetic_pdf(pdf_path, args.pages)
+        print(f"Synthetic PDF: {args.pages} pages, {os.path.getsize(pdf_path) / 1e6:.1f} MB\n")
+        print(f"{'mode':<12} {'peak RSS':>10} {'first chunk':>12} {'total':>8} {'chunks':>7}")
+        for mode in ("sequential", "pipeline"):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_ingestion", "--child", mode, "--pdf", pdf_path],
+                capture_output=True, text=True, env=child_env(), check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(
+                f"{mode:<12} {result['peak_rss_mb']:>8.1f}MB {result['first_chunk_seconds']:>11.2f}s "
+                f"{result['total_seconds']:>7.2f}s {result['chunks']:>7}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark: LLM gateway resilience against the offline fake provider
+
+Three scenarios, no network needed:
+- tail latency: p50/p99 of embedding calls without and with hedging
+- brownout: share of calls that still succeed thanks to retries
+- outage: how fast calls fail once the circuit breaker opens
+
+Usage (from edurag/backend):
+    python -m benchmarks.bench_llm_gateway --calls 400 --concurrency 40
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+from app.services.llm_gateway import FakeProvider, LLMGateway, LLMGatewayError
+
+# Per-retry warnings would drown the report
+logging.getLogger("app.services.llm_gateway").setLevel(logging.ERROR)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def run_calls(gateway: LLMGateway, calls: int, concurrency: int):
+    """Fire `calls` embedding requests, at most `concurrency` at a time"""
+    limiter = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def one(i):
+        nonlocal failures
+        async with limiter:
+            start = time.perf_counter()
+            try:
+                await gateway.embed([f"texto {i}"])
+                latencies.append((time.perf_counter() - start) * 1000)
+            except LLMGatewayError:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    return latencies, failures, time.perf_counter() - start
+
+
+def report(name, latencies, failures, elapsed, gateway):
+    stats = gateway.stats()["embeddings"]
+    latency = (
+        f"p50={statistics.median(latencies):7.1f} ms  p99={percentile(latencies, 0.99):7.1f} ms"
+        if latencies else "no successful calls"
+    )
+    print(
+        f"{name:<22} {latency}  ok={len(latencies)} failed={failures}  "
+        f"retries={stats['retries']} hedges={stats['hedges']} hedge_wins={stats['hedge_wins']} "
+        f"rejected={stats['rejected']} breaker={stats['breaker']}  total={elapsed:.2f}s"
+    )
+
+
+async def main_async(args):
+    def gateway(provider, **overrides):
+        options = {
+            "embedding_concurrency": args.concurrency,
+            "embedding_timeout": 5.0,
+            "embedding_deadline": 10.0,
+            "backoff_base": 0.02,
+            "backoff_max": 0.2,
+            **overrides
+        }
+        return LLMGateway(provider, **options)
+
+    print("Tail latency (2% of calls 20x slower)")
+    for hedge_after in (0.0, args.latency * 3):
+        gw = gateway(FakeProvider(latency=args.latency, slow_rate=0.02, slow_factor=20, seed=1), hedge_after=hedge_after)
+        name = f"hedge_after={hedge_after:.2f}s" if hedge_after else "no hedging"
+        report(name, *await run_calls(gw, args.calls, args.concurrency), gw)
+
+    print("\nBrownout (30% of calls fail with 503)")
+    for retries in (0, 3):
+        gw = gateway(
+            FakeProvider(latency=args.latency, failure_rate=0.3, seed=2),
+            max_retries=retries,
+            breaker_failure_threshold=10 ** 6
+        )
+        report(f"max_retries={retries}", *await run_calls(gw, args.calls, args.concurrency), gw)
+
+    print("\nOutage (every call fails)")
+    gw = gateway(FakeProvider(latency=args.latency, failure_rate=1.0, seed=3), max_retries=2)
+    report("breaker threshold=5", *await run_calls(gw, args.calls, args.concurrency), gw)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.05, help="Median fake API latency (s)")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark: local retriever (IVF / flat, float16 / float32) vs exact brute force
+
+Builds a VectorIndex over synthetic clustered unit vectors (topic clusters
+plus noise, similar to embeddings of textbook chunks), then reports
+recall@k against exact float32 brute force and per-query latency.
+
+Usage (from edurag/backend):
+    python -m benchmarks.bench_local_retriever --chunks 200000 --queries 200
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from app.services.local_retriever import VectorIndex
+
+
+def synthetic_embeddings(n: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    data = centers[labels] + 0.9 * rng.standard_normal((n, dim)).astype(np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def run_profile(name, index, queries, truth, k, groups=None):
+    latencies = []
+    recalls = []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        hits = index.search(query, k, groups=groups)
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(len({row for row, _ in hits} & expected) / len(expected))
+    print(
+        f"{name:<28} recall@{k}={statistics.mean(recalls):.3f}  "
+        f"p50={statistics.median(latencies):7.2f} ms  p99={percentile(latencies, 0.99):7.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--materials", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    data = synthetic_embeddings(args.chunks, args.dim, args.clusters, rng)
+    queries = synthetic_embeddings(args.queries, args.dim, args.clusters, rng)
+    groups = np.arange(args.chunks) % args.materials
+
+    start = time.perf_counter()
+    exact = data @ queries.T
+    truth = [set(np.argsort(-exact[:, i])[:args.k].tolist()) for i in range(args.queries)]
+    print(f"Ground truth (float32 brute force, numpy): {(time.perf_counter() - start) * 1000 / args.queries:.2f} ms/query\n")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for dtype in ("float32", "float16"):
+            for index_type, nprobes in (("flat", [None]), ("ivf", [4, 16, 32])):
+                index = VectorIndex(
+                    dim=args.dim,
+                    path=os.path.join(tmp, f"{dtype}-{index_type}.npy"),
+                    dtype=dtype,
+                    index_type=index_type
+                )
+                build_start = time.perf_counter()
+                for group in range(args.materials):
+                    index.add(data[groups == group], group)
+                if index_type == "ivf":
+                    index.train()
+                build_ms = (time.perf_counter() - build_start) * 1000
+                # Rows are added per group, map them back to original ids
+                row_to_id = np.concatenate([np.flatnonzero(groups == g) for g in range(args.materials)])
+                mapped_truth = []
+                id_to_row = np.empty_like(row_to_id)
+                id_to_row[row_to_id] = np.arange(len(row_to_id))
+                for expected in truth:
+                    mapped_truth.append({int(id_to_row[i]) for i in expected})
+
+                print(f"[{dtype} / {index_type}] build {build_ms:.0f} ms, {os.path.getsize(index.path) / 1e6:.0f} MB on disk")
+                for nprobe in nprobes:
+                    if nprobe:
+                        index.nprobe = nprobe
+                    label = f"  nprobe={nprobe}" if nprobe else "  brute force"
+                    run_profile(label, index, queries, mapped_truth, args.k)
+                run_profile("  filtered (1 material)", index, queries[:20], [
+                    {row for row, _ in index.search(q, args.k, groups=[0], exact=True)} for q in queries[:20]
+                ], args.k, groups=[0])
+                print()
+                del index
+
+
+if __name__ == "__main__":
+    main()
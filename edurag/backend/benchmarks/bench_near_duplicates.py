@@ -0,0 +1,145 @@
+"""
+Benchmark: near-duplicate chunk detection (MinHash + LSH)
+
+Grows a NearDuplicateIndex (temporary SQLite file) with synthetic chunks,
+in materials of --material-chunks chunks of one course, and at each corpus
+size looks up probes from a new material of that course:
+
+- near-duplicates of stored chunks: the chunk boundary shifted by
+  --shift-words words and --edit-words words replaced (the same chapter
+  in another course pack, cut and typeset differently)
+- fresh chunks, which must not be linked
+
+It reports the LSH lookup time per chunk next to a brute-force comparison
+against every stored signature (linear in the corpus), recall on the
+near-duplicates, false links on the fresh chunks and the mean true Jaccard
+similarity of the near-duplicate probes. No database or API key is needed.
+
+Usage (from edurag/backend):
+    python -m benchmarks.bench_near_duplicates --sizes 1000 5000 20000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+# Settings() requires these; nothing connects to them here
+for _name in ("SUPABASE_URL", "SUPABASE_ANON_KEY", "SUPABASE_SERVICE_ROLE_KEY", "OPENAI_API_KEY"):
+    os.environ.setdefault(_name, "unused")
+
+from app.services.near_duplicates import NearDuplicateIndex, shingles  # noqa: E402
+
+COURSE = "bench-course"
+
+
+def vocabulary(size: int, rng: random.Random) -> list:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 9))) for _ in range(size)]
+
+
+def make_chunk(words: list, length: int, rng: random.Random) -> str:
+    return " ".join(rng.choice(words) for _ in range(length))
+
+
+def near_duplicate(text: str, words: list, shift: int, edits: int, rng: random.Random) -> str:
+    tokens = text.split()
+    tokens = tokens[shift:] + [rng.choice(words) for _ in range(shift)]
+    for position in rng.sample(range(len(tokens)), edits):
+        tokens[position] = rng.choice(words)
+    return " ".join(tokens)
+
+
+def jaccard(a: str, b: str) -> float:
+    first, second = set(shingles(a)), set(shingles(b))
+    return len(first & second) / len(first | second)
+
+
+def add_material(index: NearDuplicateIndex, texts: list) -> None:
+    material_id = str(uuid.uuid4())
+    chunks = [{"chunk_text": text, "token_count": len(text.split())} for text in texts]
+    index.mark_chunks(material_id, COURSE, chunks)
+    index.commit_material(material_id)
+
+
+def lookup(index: NearDuplicateIndex, texts: list) -> tuple:
+    """(seconds per chunk, chunks linked) for one probe material, removed afterwards"""
+    material_id = str(uuid.uuid4())
+    chunks = [{"chunk_text": text, "token_count": len(text.split())} for text in texts]
+    started = time.perf_counter()
+    linked = index.mark_chunks(material_id, COURSE, chunks)
+    elapsed = time.perf_counter() - started
+    index.remove_material(material_id)
+    return elapsed / len(texts), linked
+
+
+def brute_force_seconds(index: NearDuplicateIndex, signatures: np.ndarray, texts: list) -> float:
+    """Per-chunk time to compare each probe signature with every stored one"""
+    started = time.perf_counter()
+    for text in texts:
+        signature = index.hasher.signature(text)
+        (signatures == signature).mean(axis=1).max()
+    return (time.perf_counter() - started) / len(texts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000], help="Corpus sizes (chunks)")
+    parser.add_argument("--probes", type=int, default=200, help="Near-duplicate and fresh probes per size")
+    parser.add_argument("--chunk-words", type=int, default=300)
+    parser.add_argument("--material-chunks", type=int, default=200)
+    parser.add_argument("--shift-words", type=int, default=8)
+    parser.add_argument("--edit-words", type=int, default=2)
+    parser.add_argument("--vocabulary", type=int, default=5000)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--num-perm", type=int, default=128)
+    parser.add_argument("--bands", type=int, default=16)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    words = vocabulary(args.vocabulary, rng)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = NearDuplicateIndex(
+            os.path.join(tmp, "near_duplicates.sqlite"), args.num_perm, args.bands, args.threshold
+        )
+        corpus: list = []
+        signatures: list = []
+
+        print(f"{args.bands} bands x {index.rows} rows, threshold {args.threshold}, "
+              f"{args.chunk_words}-word chunks\n")
+        print(f"{'chunks':>8} {'lsh/chunk':>11} {'brute/chunk':>12} {'recall':>8} {'false links':>12} "
+              f"{'jaccard':>8}")
+        for size in sorted(args.sizes):
+            while len(corpus) < size:
+                texts = [
+                    make_chunk(words, args.chunk_words, rng)
+                    for _ in range(min(args.material_chunks, size - len(corpus)))
+                ]
+                add_material(index, texts)
+                corpus.extend(texts)
+                signatures.extend(index.hasher.signature(text) for text in texts)
+
+            originals = rng.sample(corpus, min(args.probes, len(corpus)))
+            duplicates = [
+                near_duplicate(text, words, args.shift_words, args.edit_words, rng) for text in originals
+            ]
+            fresh = [make_chunk(words, args.chunk_words, rng) for _ in range(args.probes)]
+
+            dup_seconds, found = lookup(index, duplicates)
+            fresh_seconds, false_links = lookup(index, fresh)
+            brute = brute_force_seconds(index, np.stack(signatures), duplicates)
+            similarity = sum(jaccard(a, b) for a, b in zip(originals, duplicates)) / len(originals)
+            print(
+                f"{len(corpus):>8} {(dup_seconds + fresh_seconds) / 2 * 1000:>9.2f}ms {brute * 1000:>10.2f}ms "
+                f"{found / len(duplicates):>8.3f} {false_links:>12} {similarity:>8.3f}"
+            )
+
+        print(f"\n{index.stats()['canonical_chunks']} canonical chunks indexed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Benchmark: page-parallel OCR vs the previous serial implementation
+
+Renders a synthetic scanned PDF (text drawn into page images, no text
+layer), then OCRs it in a fresh subprocess per mode and reports wall time,
+peak RSS of the process and of its largest child (pdftoppm or an OCR
+pool worker) and the Tesseract time saved by the cache / adaptive DPI.
+Needs the Tesseract (spa+eng) and Poppler binaries.
+
+- serial: convert_from_path on the whole document at 300 dpi, then
+  image_to_string + image_to_data per page in the event loop (the old
+  extract_text_with_ocr)
+- parallel: extract_text_with_ocr (page ranges rasterized lazily, one
+  image_to_data pass per page, pages spread over a process pool), fixed
+  300 dpi, no cache
+- adaptive: parallel, OCR at OCR_LOW_DPI first and 300 dpi only for
+  pages under OCR_MIN_CONFIDENCE
+- cache-cold / cache-warm: adaptive with an empty OCR cache, then again
+  on the same cache (a re-processed material)
+
+Usage (from edurag/backend):
+    python -m benchmarks.bench_ocr --pages 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_ingestion import WORDS
+
+PAGE_SIZE = (1240, 1754)  # A4 at 150 dpi
+LINES_PER_PAGE = 40
+WORDS_PER_LINE = 9
+
+
+def write_scanned_pdf(path: str, pages: int, seed: int = 0) -> None:
+    """PDF whose pages are only images of text, like a scan"""
+    from PIL import Image, ImageDraw, ImageFont
+
+    rng = random.Random(seed)
+    font = ImageFont.load_default(size=24)
+    images = []
+    for number in range(1, pages + 1):
+        image = Image.new("L", PAGE_SIZE, 255)
+        draw = ImageDraw.Draw(image)
+        lines = [f"Capitulo {number}"] + [
+            " ".join(rng.choice(WORDS) for _ in range(WORDS_PER_LINE)).capitalize() + "."
+            for _ in range(LINES_PER_PAGE)
+        ]
+        for row, line in enumerate(lines):
+            draw.text((90, 90 + row * 38), line, fill=0, font=font)
+        images.append(image)
+    images[0].save(path, save_all=True, append_images=images[1:], resolution=150)
+
+
+def peak_rss_mb(who: int) -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def serial_ocr(file_path: str) -> int:
+    """The previous implementation, without its logging"""
+    import pytesseract
+    from pdf2image import convert_from_path
+
+    images = convert_from_path(file_path, dpi=300)
+    chars = 0
+    for image in images:
+        custom_config = r'--oem 3 --psm 6 -l spa+eng'
+        chars += len(pytesseract.image_to_string(image, config=custom_config))
+        pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT, config=custom_config)
+    return chars
+
+
+async def run_mode(mode: str, pdf_path: str) -> dict:
+    from app.services.ocr_service import extract_text_with_ocr, shutdown_ocr_pool
+
+    started = time.perf_counter()
+    if mode == "serial":
+        chars = await serial_ocr(pdf_path)
+    else:
+        text, metadata = await extract_text_with_ocr(pdf_path)
+        chars = len(text)
+        shutdown_ocr_pool()
+    elapsed = time.perf_counter() - started
+    return {
+        "seconds": round(elapsed, 2),
+        "chars": chars,
+        "peak_rss_mb": round(peak_rss_mb(resource.RUSAGE_SELF), 1),
+        "child_peak_rss_mb": round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+        "cache_saved_seconds": 0.0 if mode == "serial" else metadata["ocr_stats"]["cache_saved_seconds"],
+        "adaptive_saved_seconds": 0.0 if mode == "serial" else metadata["ocr_stats"]["adaptive_saved_seconds"]
+    }
+
+
+MODES = {
+    "serial": {},
+    "parallel": {"OCR_ADAPTIVE_DPI": "false", "OCR_CACHE_PATH": ""},
+    "adaptive": {"OCR_ADAPTIVE_DPI": "true", "OCR_CACHE_PATH": ""},
+    "cache-cold": {"OCR_ADAPTIVE_DPI": "true"},
+    "cache-warm": {"OCR_ADAPTIVE_DPI": "true"}
+}
+
+
+def child_env(mode: str, cache_path: str) -> dict:
+    env = dict(os.environ)
+    env.update({"OCR_CACHE_PATH": cache_path, **MODES[mode]})
+    # Settings() requires these; nothing connects to them here
+    for name in ("SUPABASE_URL", "SUPABASE_ANON_KEY", "SUPABASE_SERVICE_ROLE_KEY", "OPENAI_API_KEY"):
+        env.setdefault(name, "unused")
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--child", choices=list(MODES), help=argparse.SUPPRESS)
+    parser.add_argument("--pdf", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(run_mode(args.child, args.pdf))))
+        return
+
+    missing = [binary for binary in ("tesseract", "pdftoppm") if shutil.which(binary) is None]
+    if missing:
+        sys.exit(f"Missing binaries: {', '.join(missing)} (install tesseract-ocr, tesseract-ocr-spa and poppler-utils)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, "scanned.pdf")
+        write_scanned_pdf(pdf_path, args.pages)
+        print(f"Synthetic scanned PDF: {args.pages} pages, {os.path.getsize(pdf_path) / 1e6:.1f} MB, "
+              f"{os.cpu_count()} cores\n")
+        cache_path = os.path.join(tmp, "ocr_cache.sqlite")
+        print(f"{'mode':<11} {'wall time':>10} {'peak RSS':>10} {'child peak':>11} {'chars':>8} "
+              f"{'cache saved':>12} {'adaptive saved':>15}")
+        for mode in MODES:
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_ocr", "--child", mode, "--pdf", pdf_path],
+                capture_output=True, text=True, env=child_env(mode, cache_path), check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(
+                f"{mode:<11} {result['seconds']:>9.2f}s {result['peak_rss_mb']:>8.1f}MB "
+                f"{result['child_peak_rss_mb']:>9.1f}MB {result['chars']:>8} "
+                f"{result['cache_saved_seconds']:>11.2f}s {result['adaptive_saved_seconds']:>14.2f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Benchmark: query latency while a large PDF is being ingested
+
+Runs a steady stream of query-like requests on the event loop (tokenize
+the question, then await simulated I/O, as a RAG query does before and
+around its network calls) and reports their p50 / p99 latency, in a
+fresh subprocess per mode. Embeddings come from the offline fake provider
+and the writer keeps only a row counter, so no OpenAI key or database is
+needed.
+
+- baseline: queries only
+- cpu-pool: queries while run_ingestion_pipeline ingests the synthetic
+  PDF with extraction and tokenization in the CPU pool
+- threads: the same with CPU_POOL_ENABLED=false (extraction in threads of
+  the serving process, as before the CPU pool)
+
+Exits with status 1 if the cpu-pool p99 is more than --max-ratio times
+the baseline p99. With a single core the pool workers and the queries
+still share it, so run it on a multi-core machine.
+
+Usage (from edurag/backend):
+    python -m benchmarks.bench_query_p99 --pages 1000 --max-ratio 2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_ingestion import write_synthetic_pdf
+
+QUESTION = "¿Qué diferencia hay entre la respiración celular y la fotosíntesis en la producción de ATP?"
+
+MODES = {
+    "baseline": {},
+    "cpu-pool": {"CPU_POOL_ENABLED": "true"},
+    "threads": {"CPU_POOL_ENABLED": "false"}
+}
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run_mode(mode: str, pdf_path: str, seconds: float, interval: float) -> dict:
+    from app.services.cpu_pool import start_cpu_pool, stop_cpu_pool
+    from app.services.ingestion_pipeline import run_ingestion_pipeline
+    from app.services.pdf_text import count_tokens
+
+    async def query() -> float:
+        started = time.perf_counter()
+        count_tokens(QUESTION)
+        await asyncio.sleep(0.005)
+        return time.perf_counter() - started
+
+    async def write(chunks, embeddings):
+        return len(chunks)
+
+    # Spawn and warm up the workers before measuring, as the app does at startup
+    await start_cpu_pool()
+    latencies = []
+    ingestion = None
+    if mode != "baseline":
+        ingestion = asyncio.ensure_future(run_ingestion_pipeline(pdf_path, "benchmark", write_batch=write))
+    started = time.perf_counter()
+    try:
+        while (ingestion is not None and not ingestion.done()) or (
+            ingestion is None and time.perf_counter() - started < seconds
+        ):
+            latencies.append(await query())
+            await asyncio.sleep(interval)
+        stats = await ingestion if ingestion is not None else None
+    finally:
+        stop_cpu_pool()
+    return {
+        "queries": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "ingest_seconds": stats["elapsed_seconds"] if stats else None
+    }
+
+
+def child_env(mode: str) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "LLM_PROVIDER": "fake",
+        "LLM_FAKE_LATENCY_SECONDS": "0.02",
+        "EMBEDDING_CACHE_ENABLED": "false",
+        "RAG_HYBRID_SEARCH": "false",
+        "OCR_ENABLED": "false",
+        **MODES[mode]
+    })
+    # Settings() requires these; nothing connects to them here
+    for name in ("SUPABASE_URL", "SUPABASE_ANON_KEY", "SUPABASE_SERVICE_ROLE_KEY", "OPENAI_API_KEY"):
+        env.setdefault(name, "unused")
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=10.0, help="Duration of the baseline run")
+    parser.add_argument("--interval", type=float, default=0.01, help="Pause between queries")
+    parser.add_argument("--max-ratio", type=float, default=2.0, help="Allowed cpu-pool p99 / baseline p99")
+    parser.add_argument("--child", choices=list(MODES), help=argparse.SUPPRESS)
+    parser.add_argument("--pdf", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(run_mode(args.child, args.pdf, args.seconds, args.interval))))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, "synthetic.pdf")
+        write_synthetic_pdf(pdf_path, args.pages)
+        print(f"Synthetic PDF: {args.pages} pages, {os.path.getsize(pdf_path) / 1e6:.1f} MB, "
+              f"{os.cpu_count()} cores\n")
+        print(f"{'mode':<9} {'queries':>8} {'p50':>9} {'p99':>9} {'p99 ratio':>10} {'ingest':>8}")
+        results = {}
+        for mode in MODES:
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_query_p99", "--child", mode, "--pdf", pdf_path,
+                 "--seconds", str(args.seconds), "--interval", str(args.interval)],
+                capture_output=True, text=True, env=child_env(mode), check=True
+            ).stdout
+            result = results[mode] = json.loads(output.strip().splitlines()[-1])
+            ratio = result["p99_ms"] / results["baseline"]["p99_ms"]
+            ingest = f"{result['ingest_seconds']:.2f}s" if result["ingest_seconds"] is not None else "-"
+            print(
+                f"{mode:<9} {result['queries']:>8} {result['p50_ms']:>7.2f}ms {result['p99_ms']:>7.2f}ms "
+                f"{ratio:>9.2f}x {ingest:>8}"
+            )
+
+    ratio = results["cpu-pool"]["p99_ms"] / results["baseline"]["p99_ms"]
+    if ratio > args.max_ratio:
+        sys.exit(f"\nQuery p99 during ingestion is {ratio:.2f}x the baseline (max {args.max_ratio:.2f}x)")
+    print(f"\nQuery p99 during ingestion stays within {args.max_ratio:.2f}x the baseline")
+
+
+if __name__ == "__main__":
+    main()
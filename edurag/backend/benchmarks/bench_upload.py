@@ -0,0 +1,256 @@
+"""
+Benchmark: streamed upload path vs the previous buffered one
+
+Starts the API in a fresh uvicorn subprocess per mode, sends N concurrent
+PDF uploads (default 10 x 40 MB) and reports the server's RSS growth at
+peak and per-request response times. Supabase is replaced by an in-process
+fake whose storage upload takes time proportional to size (--storage-mbps),
+so no network or credentials are needed.
+
+- buffered: the old endpoint (whole file read into memory, uploaded to
+  storage before responding, then written again to a temp file)
+- streamed: upload_pdf_material (file streamed to the spool in fixed
+  blocks; the storage upload streams from the spool after the response,
+  as the ingestion job does)
+
+Usage (from edurag/backend):
+    python -m benchmarks.bench_upload --uploads 10 --size-mb 40
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+
+BLOCK = 1024 * 1024
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class FakeSupabase:
+    """Just enough of the Supabase client for the upload endpoint"""
+
+    def __init__(self, mbps: float):
+        self.seconds_per_byte = 1 / (mbps * 1024 * 1024)
+        self.storage = self
+
+    # storage
+    def list_buckets(self):
+        return [type("Bucket", (), {"name": "course-materials"})()]
+
+    def from_(self, bucket):
+        return self
+
+    def upload(self, path, file, file_options=None):
+        if isinstance(file, bytes):
+            # A bytes body is kept whole until the request finishes
+            time.sleep(len(file) * self.seconds_per_byte)
+            return
+        while block := file.read(BLOCK):
+            time.sleep(len(block) * self.seconds_per_byte)
+
+    # tables
+    def table(self, name):
+        return self
+
+    def insert(self, data):
+        self._row = data
+        return self
+
+    def execute(self):
+        return type("Result", (), {"data": [self._row]})()
+
+
+def create_app(mode: str, mbps: float):
+    from fastapi import FastAPI, File, Form, UploadFile
+    from app.routers import materials
+    from app.services import storage
+
+    fake = FakeSupabase(mbps)
+    storage.get_supabase_client = lambda: fake
+    materials.get_supabase_client = lambda: fake
+
+    async def no_duplicate(content_hash):
+        return None
+
+    async def update_material(material_id, data):
+        return data
+
+    background = set()
+
+    def enqueue(material_id, storage_path, file_path):
+        # Stand-in for the ingestion job: stream the spool to storage, then drop it
+        async def job():
+            await storage.upload_pdf_file_to_storage(file_path, storage_path)
+            os.remove(file_path)
+        task = loop.create_task(job())
+        background.add(task)
+        task.add_done_callback(background.discard)
+        return len(background)
+
+    materials.find_processed_material_by_hash = no_duplicate
+    materials.update_material = update_material
+    materials.enqueue_pdf_processing = enqueue
+
+    loop = None
+
+    @asynccontextmanager
+    async def lifespan(app):
+        nonlocal loop
+        loop = asyncio.get_running_loop()
+        yield
+
+    app = FastAPI(lifespan=lifespan)
+
+    if mode == "streamed":
+        app.include_router(materials.router, prefix="/api/materials")
+    else:
+        @app.post("/api/materials/upload-pdf")
+        async def buffered_upload(
+            file: UploadFile = File(...),
+            title: str = Form(...),
+            course_id: str = Form(...)
+        ):
+            file_content = await file.read()
+            fake.insert({"title": title, "course_id": course_id}).execute()
+            await storage.upload_pdf_to_storage(file_content, file.filename, "benchmark")
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
+                temp_file.write(file_content)
+            os.remove(temp_file.name)
+            return {"status": "pending"}
+
+    @app.get("/_stats")
+    async def stats():
+        while background:
+            await asyncio.sleep(0.1)
+        return {"rss_mb": round(rss_mb(), 1), "peak_rss_mb": round(peak_rss_mb(), 1)}
+
+    return app
+
+
+def serve(mode: str, port: int, mbps: float) -> None:
+    import uvicorn
+    app = create_app(mode, mbps)
+    print(json.dumps({"baseline_rss_mb": round(rss_mb(), 1)}), flush=True)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+async def run_uploads(port: int, pdf_path: str, uploads: int) -> dict:
+    import httpx
+
+    async def upload(client, number):
+        started = time.perf_counter()
+        with open(pdf_path, "rb") as pdf:
+            response = await client.post(
+                "/api/materials/upload-pdf",
+                data={"title": f"Upload {number}", "course_id": "benchmark"},
+                files={"file": ("material.pdf", pdf, "application/pdf")}
+            )
+        response.raise_for_status()
+        return time.perf_counter() - started
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=600) as client:
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(upload(client, i) for i in range(uploads)))
+        all_responded = time.perf_counter() - started
+        stats = (await client.get("/_stats")).json()
+        drained = time.perf_counter() - started
+    latencies.sort()
+    return {
+        **stats,
+        "p50_seconds": latencies[len(latencies) // 2],
+        "max_seconds": latencies[-1],
+        "responded_seconds": all_responded,
+        "stored_seconds": drained
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def child_env(spool_dir: str) -> dict:
+    env = dict(os.environ)
+    env.update({"JOB_SPOOL_DIR": spool_dir, "RAG_HYBRID_SEARCH": "false", "JOB_WORKER_EMBEDDED": "false"})
+    # Settings() requires these; nothing connects to them here
+    for name in ("SUPABASE_URL", "SUPABASE_ANON_KEY", "SUPABASE_SERVICE_ROLE_KEY", "OPENAI_API_KEY"):
+        env.setdefault(name, "unused")
+    return env
+
+
+def run_mode(mode: str, pdf_path: str, uploads: int, mbps: float, tmp: str) -> dict:
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.bench_upload", "--serve", mode,
+         "--port", str(port), "--storage-mbps", str(mbps)],
+        stdout=subprocess.PIPE, text=True, env=child_env(os.path.join(tmp, "spool"))
+    )
+    try:
+        baseline = json.loads(server.stdout.readline())["baseline_rss_mb"]
+        for _ in range(200):
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=0.1):
+                    break
+            except OSError:
+                time.sleep(0.05)
+        result = asyncio.run(run_uploads(port, pdf_path, uploads))
+        result["baseline_rss_mb"] = baseline
+        return result
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=10)
+    parser.add_argument("--size-mb", type=int, default=40)
+    parser.add_argument("--storage-mbps", type=float, default=200.0, help="Simulated storage upload speed")
+    parser.add_argument("--serve", choices=["buffered", "streamed"], help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.storage_mbps)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, "upload.pdf")
+        with open(pdf_path, "wb") as pdf:
+            pdf.write(b"%PDF-1.4\n")
+            for _ in range(args.size_mb):
+                pdf.write(os.urandom(BLOCK))
+        print(f"{args.uploads} concurrent uploads of {args.size_mb} MB "
+              f"(storage at {args.storage_mbps:.0f} MB/s)\n")
+        print(f"{'mode':<10} {'RSS growth':>11} {'per upload':>11} {'p50 resp':>9} "
+              f"{'max resp':>9} {'stored':>8}")
+        for mode in ("buffered", "streamed"):
+            result = run_mode(mode, pdf_path, args.uploads, args.storage_mbps, tmp)
+            growth = result["peak_rss_mb"] - result["baseline_rss_mb"]
+            print(
+                f"{mode:<10} {growth:>9.1f}MB {growth / args.uploads:>9.1f}MB "
+                f"{result['p50_seconds']:>8.2f}s {result['max_seconds']:>8.2f}s "
+                f"{result['stored_seconds']:>7.2f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Script to (re)build the BM25 keyword index from existing material_chunks
+New uploads are indexed automatically; run this once after enabling
+RAG_HYBRID_SEARCH, or to rebuild a lost/corrupted index file.
+"""
+
+import asyncio
+
+from app.core.config import settings
+from app.core.database import init_db, close_db, get_supabase_client, fetch_material_info
+from app.services.bm25_index import bm25_index
+
+PAGE_SIZE = 500
+
+
+async def build_index():
+    if bm25_index is None:
+        print("❌ RAG_HYBRID_SEARCH is disabled, nothing to build")
+        return False
+
+    await init_db()
+    supabase = get_supabase_client()
+
+    materials = supabase.table("materials").select("id, title").eq(
+        "processing_status", "completed"
+    ).execute().data or []
+    print(f"📚 {len(materials)} processed materials\n")
+
+    total_chunks = 0
+    for i, material in enumerate(materials, 1):
+        material_id = material["id"]
+        chunks = []
+        offset = 0
+        while True:
+            page = supabase.table("material_chunks").select(
+                "id, chunk_text, chunk_index, metadata"
+            ).eq("material_id", material_id).order("chunk_index").range(
+                offset, offset + PAGE_SIZE - 1
+            ).execute().data or []
+            chunks.extend(page)
+            if len(page) < PAGE_SIZE:
+                break
+            offset += PAGE_SIZE
+
+        material_info = await fetch_material_info(material_id) or {}
+        indexed = bm25_index.add_material(material_id, material_info, chunks)
+        total_chunks += indexed
+        print(f"   [{i}/{len(materials)}] {material.get('title', material_id)}: {indexed} chunks")
+
+    await close_db()
+    print(f"\n✅ Indexed {total_chunks} chunks into {settings.BM25_INDEX_PATH}")
+    print(f"   {bm25_index.stats()}")
+    return True
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("  EduRAG - BM25 Keyword Index Build")
+    print("=" * 60)
+    print()
+    asyncio.run(build_index())
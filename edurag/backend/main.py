@@ -12,6 +12,10 @@ import time
 
 from app.core.config import settings
 from app.core.database import init_db, close_db
+from app.services.local_retriever import start_local_retriever, stop_local_retriever
+from app.services.cpu_pool import start_cpu_pool, stop_cpu_pool
+from app.services.ingestion_worker import start_embedded_worker, stop_embedded_worker
+from app.services.ocr_service import shutdown_ocr_pool
 from app.routers import auth, materials, analytics, students, courses, enrollments, evaluations
 from app.routers import rag_vector as rag  # Use vector-based RAG
 
@@ -29,8 +33,15 @@ async def lifespan(app: FastAPI):
     logger.info(f"Starting {settings.APP_NAME} v{settings.APP_VERSION}")
     await init_db()
     logger.info("Database initialized")
+    await start_local_retriever()
+    await start_cpu_pool()
+    await start_embedded_worker()
     yield
     logger.info("Shutting down application")
+    await stop_embedded_worker()
+    await stop_local_retriever()
+    shutdown_ocr_pool()
+    stop_cpu_pool()
     await close_db()
     logger.info("Database connections closed")
 
@@ -0,0 +1,201 @@
+"""
+Script to compact material_chunks.metadata on existing rows
+Chunks used to carry a copy of the whole document metadata (page_breaks
+with one entry per page, OCR confidences, totals). New uploads only store
+page, char span and extraction method per chunk; this script:
+
+1. adds materials.document_metadata (jsonb) if missing
+2. stores each material's document-level metadata there, once
+3. rewrites chunk metadata to the compact schema in batches
+4. prints a before/after report of table size and retrieval payload bytes
+
+Needs DATABASE_URL (DDL and size functions are not available over the
+Supabase REST API). Safe to re-run: compact rows are skipped.
+
+Usage:
+    python migrate_chunk_metadata.py [--dry-run] [--batch-size 1000] [--vacuum-full]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from app.core.config import settings
+from app.core.database import init_pool, close_db, get_db_pool, match_material_chunks
+from app.services.pdf_processor import compact_chunk_metadata, document_metadata
+
+REPORT_SAMPLES = 20
+
+
+async def size_report(conn) -> dict:
+    """Table size, metadata bytes and average match_material_chunks payload"""
+    sizes = await conn.fetchrow(
+        """
+        SELECT pg_total_relation_size('material_chunks') AS table_bytes,
+               count(*) AS chunks,
+               coalesce(sum(pg_column_size(metadata)), 0) AS metadata_bytes
+        FROM material_chunks
+        """
+    )
+    report = dict(sizes)
+
+    # Use stored vectors as queries so the payload is a real retrieval result
+    queries = await conn.fetch(
+        "SELECT embedding::text AS embedding FROM material_chunks "
+        "ORDER BY id LIMIT $1",
+        REPORT_SAMPLES
+    )
+    payloads = []
+    for row in queries:
+        query = json.loads(row["embedding"])
+        matches = await match_material_chunks(query, 0.0, settings.RAG_TOP_K)
+        payloads.append(len(json.dumps(matches, default=str).encode("utf-8")))
+    report["payload_bytes"] = sum(payloads) / len(payloads) if payloads else 0
+    return report
+
+
+def print_report(before: dict, after: dict) -> None:
+    def mb(value):
+        return f"{value / 1e6:,.1f} MB"
+
+    rows = [
+        ("material_chunks total size", mb(before["table_bytes"]), mb(after["table_bytes"])),
+        ("metadata column", mb(before["metadata_bytes"]), mb(after["metadata_bytes"])),
+        (
+            "metadata per chunk",
+            f"{before['metadata_bytes'] / max(before['chunks'], 1):,.0f} B",
+            f"{after['metadata_bytes'] / max(after['chunks'], 1):,.0f} B"
+        ),
+        (
+            f"retrieval payload (top {settings.RAG_TOP_K})",
+            f"{before['payload_bytes']:,.0f} B",
+            f"{after['payload_bytes']:,.0f} B"
+        ),
+    ]
+    print(f"\n{'':<30} {'before':>14} {'after':>14}")
+    for label, old, new in rows:
+        print(f"{label:<30} {old:>14} {new:>14}")
+
+
+async def store_document_metadata(conn) -> int:
+    """Copy document-level metadata from each material's first chunk"""
+    rows = await conn.fetch(
+        """
+        SELECT DISTINCT ON (c.material_id) c.material_id, c.metadata
+        FROM material_chunks c
+        JOIN materials m ON m.id = c.material_id
+        WHERE m.document_metadata IS NULL
+        ORDER BY c.material_id, c.chunk_index
+        """
+    )
+    stored = 0
+    for row in rows:
+        fields = document_metadata(row["metadata"] or {})
+        if not fields:
+            continue
+        await conn.execute(
+            "UPDATE materials SET document_metadata = $1 WHERE id = $2",
+            fields,
+            row["material_id"]
+        )
+        stored += 1
+    return stored
+
+
+async def compact_chunks(conn, batch_size: int) -> int:
+    """Rewrite chunk metadata in id order, one batch per transaction"""
+    rewritten = 0
+    last_id = None
+    while True:
+        rows = await conn.fetch(
+            "SELECT id, metadata FROM material_chunks "
+            "WHERE $1::uuid IS NULL OR id > $1::uuid ORDER BY id LIMIT $2",
+            last_id,
+            batch_size
+        )
+        if not rows:
+            return rewritten
+        last_id = rows[-1]["id"]
+
+        ids, values = [], []
+        for row in rows:
+            metadata = row["metadata"] or {}
+            compact = compact_chunk_metadata(metadata)
+            if compact != metadata:
+                ids.append(row["id"])
+                values.append(json.dumps(compact))
+        if ids:
+            async with conn.transaction():
+                await conn.execute(
+                    """
+                    UPDATE material_chunks AS c SET metadata = u.metadata::jsonb
+                    FROM unnest($1::uuid[], $2::text[]) AS u(id, metadata)
+                    WHERE c.id = u.id
+                    """,
+                    ids,
+                    values
+                )
+            rewritten += len(ids)
+        print(f"   ... scanned up to {last_id}, {rewritten} rows rewritten")
+
+
+async def run_migration(conn, batch_size: int, vacuum_full: bool) -> dict:
+    """Apply the migration, returns the size report afterwards"""
+    started = time.perf_counter()
+    await conn.execute("ALTER TABLE materials ADD COLUMN IF NOT EXISTS document_metadata jsonb")
+    stored = await store_document_metadata(conn)
+    print(f"📚 Document metadata stored for {stored} materials")
+
+    print(f"✂️  Compacting chunk metadata (batches of {batch_size})...")
+    rewritten = await compact_chunks(conn, batch_size)
+    print(f"   {rewritten} chunks rewritten in {time.perf_counter() - started:.1f}s")
+
+    # Updated rows leave dead tuples; only VACUUM FULL returns the space
+    # to the OS (and locks the table while it runs)
+    print("🧹 Vacuuming material_chunks...")
+    await conn.execute(
+        "VACUUM (FULL, ANALYZE) material_chunks" if vacuum_full else "VACUUM (ANALYZE) material_chunks"
+    )
+    return await size_report(conn)
+
+
+async def migrate(dry_run: bool, batch_size: int, vacuum_full: bool):
+    await init_pool()
+    pool = get_db_pool()
+    if pool is None:
+        print("❌ DATABASE_URL must be set (DDL is not available over the Supabase REST API)")
+        return False
+
+    async with pool.acquire() as conn:
+        print("📏 Measuring current size...")
+        before = await size_report(conn)
+        if dry_run:
+            after = before
+        else:
+            after = await run_migration(conn, batch_size, vacuum_full)
+
+    await close_db()
+    print_report(before, after)
+    if dry_run:
+        print("\n(dry run, nothing changed)")
+        return True
+    if not vacuum_full:
+        print("\nTable size only shrinks after --vacuum-full; freed space is reused by new rows meanwhile.")
+    print("Rebuild copies of chunk metadata: python build_bm25_index.py, and delete "
+          f"{settings.LOCAL_INDEX_DIR} if RAG_RETRIEVER=local.")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact material_chunks.metadata")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the size report")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--vacuum-full", action="store_true", help="Reclaim disk space (locks the table)")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("  EduRAG - Compact Chunk Metadata")
+    print("=" * 60)
+    print()
+    asyncio.run(migrate(args.dry_run, args.batch_size, args.vacuum_full))
@@ -0,0 +1,167 @@
+"""
+Script to build the vector index of a search profile (RAG_VECTOR_PROFILE)
+material_chunks.embedding keeps the full 1536-dim vectors; each profile
+searches a smaller HNSW index over an expression of them and rescores the
+candidates exactly (see sql/embedding_profiles.sql). This script:
+
+1. checks pgvector >= 0.7 (halfvec, subvector, binary_quantize)
+2. installs match_material_chunks_rerank from sql/embedding_profiles.sql
+3. builds the profile's index with CREATE INDEX CONCURRENTLY: every
+   existing row is re-encoded from its full vector in the background while
+   queries and ingestion keep running (new rows are encoded on insert)
+4. optionally drops the indexes of the other profiles (--drop-others)
+5. prints the size of every embedding index before and after
+
+Switch RAG_VECTOR_PROFILE (and RAG_VECTOR_DIMENSIONS) once the index is
+built. Needs DATABASE_URL (DDL is not available over the Supabase REST
+API). Safe to re-run: an existing valid index is kept, an invalid one left
+by an interrupted build is rebuilt.
+
+Usage:
+    python migrate_embedding_profile.py [--profile halfvec] [--dimensions 512] [--drop-others] [--dry-run]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from app.core.config import settings
+from app.core.database import init_pool, close_db, get_db_pool
+
+PROFILES = ("full", "halfvec", "matryoshka", "binary")
+SQL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sql", "embedding_profiles.sql")
+
+
+def index_name(profile: str, dimensions: int) -> str:
+    if profile == "full":
+        # Name used by docs/DATABASE_ARCHITECTURE.md
+        return "material_chunks_embedding_idx"
+    if profile == "matryoshka":
+        return f"material_chunks_embedding_matryoshka{dimensions}_idx"
+    return f"material_chunks_embedding_{profile}_idx"
+
+
+def index_definition(profile: str, dimensions: int, table: str = "material_chunks") -> str:
+    """CREATE INDEX statement of a profile (expressions as in match_material_chunks_rerank)"""
+    expression, operator_class = {
+        "full": ("embedding", "vector_cosine_ops"),
+        "halfvec": ("(embedding::halfvec(1536))", "halfvec_cosine_ops"),
+        "matryoshka": (f"(subvector(embedding, 1, {dimensions})::halfvec({dimensions}))", "halfvec_cosine_ops"),
+        "binary": ("(binary_quantize(embedding)::bit(1536))", "bit_hamming_ops")
+    }[profile]
+    return (
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name(profile, dimensions)} "
+        f"ON {table} USING hnsw ({expression} {operator_class})"
+    )
+
+
+async def embedding_indexes(conn) -> list:
+    """Name, size and validity of the HNSW indexes on material_chunks"""
+    return await conn.fetch(
+        """
+        SELECT c.relname AS name, pg_relation_size(c.oid) AS bytes, i.indisvalid AS valid
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_am a ON a.oid = c.relam
+        WHERE i.indrelid = 'material_chunks'::regclass AND a.amname = 'hnsw'
+        ORDER BY c.relname
+        """
+    )
+
+
+def print_indexes(title: str, indexes: list) -> None:
+    print(f"\n{title}")
+    if not indexes:
+        print("   (no HNSW indexes)")
+    for index in indexes:
+        state = "" if index["valid"] else "  (invalid)"
+        print(f"   {index['name']:<48} {index['bytes'] / 1e6:>10,.1f} MB{state}")
+
+
+async def check_pgvector(conn) -> bool:
+    version = await conn.fetchval("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+    if version is None:
+        print("❌ The pgvector extension is not installed")
+        return False
+    if tuple(int(part) for part in version.split(".")[:2]) < (0, 7):
+        print(f"❌ pgvector {version} found, 0.7 or newer is needed (halfvec, subvector, binary_quantize)")
+        return False
+    return True
+
+
+async def build_index(conn, profile: str, dimensions: int, maintenance_work_mem: str) -> None:
+    name = index_name(profile, dimensions)
+    existing = {index["name"]: index for index in await embedding_indexes(conn)}
+    if name in existing and not existing[name]["valid"]:
+        print(f"🧹 Dropping invalid index {name} (interrupted build)")
+        await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    elif name in existing:
+        print(f"✅ Index {name} already exists")
+        return
+
+    started = time.perf_counter()
+    print(f"🏗️  Building {name} concurrently (reads and writes continue meanwhile)...")
+    if maintenance_work_mem:
+        # HNSW builds are much faster when the graph fits in memory
+        await conn.execute(f"SET maintenance_work_mem = '{maintenance_work_mem}'")
+    await conn.execute(index_definition(profile, dimensions))
+    print(f"   built in {time.perf_counter() - started:.1f}s")
+
+
+async def migrate(profile: str, dimensions: int, drop_others: bool, dry_run: bool, maintenance_work_mem: str):
+    await init_pool()
+    pool = get_db_pool()
+    if pool is None:
+        print("❌ DATABASE_URL must be set (DDL is not available over the Supabase REST API)")
+        return False
+
+    async with pool.acquire() as conn:
+        before = await embedding_indexes(conn)
+        print_indexes("Embedding indexes:", before)
+        if dry_run:
+            await close_db()
+            print("\n(dry run, nothing changed)")
+            return True
+        if not await check_pgvector(conn):
+            await close_db()
+            return False
+
+        print("\n📝 Installing match_material_chunks_rerank...")
+        with open(SQL_FILE, encoding="utf-8") as f:
+            await conn.execute(f.read())
+
+        # CONCURRENTLY cannot run inside a transaction: plain statements only
+        await build_index(conn, profile, dimensions, maintenance_work_mem)
+
+        if drop_others:
+            keep = index_name(profile, dimensions)
+            for index in await embedding_indexes(conn):
+                if index["name"] != keep and index["name"].startswith("material_chunks_embedding"):
+                    print(f"🗑️  Dropping {index['name']}")
+                    await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index['name']}")
+
+        after = await embedding_indexes(conn)
+
+    await close_db()
+    print_indexes("Embedding indexes after:", after)
+    print(f"\nSet RAG_VECTOR_PROFILE={profile}"
+          + (f" and RAG_VECTOR_DIMENSIONS={dimensions}" if profile == "matryoshka" else "")
+          + " to search with it.")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the vector index of a search profile")
+    parser.add_argument("--profile", choices=PROFILES, default=settings.RAG_VECTOR_PROFILE)
+    parser.add_argument("--dimensions", type=int, default=settings.RAG_VECTOR_DIMENSIONS,
+                        help="Leading dimensions kept by the matryoshka profile")
+    parser.add_argument("--drop-others", action="store_true", help="Drop the indexes of the other profiles")
+    parser.add_argument("--maintenance-work-mem", default="", help="e.g. 1GB, for the index build")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the current indexes")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("  EduRAG - Embedding Search Profile")
+    print("=" * 60)
+    asyncio.run(migrate(args.profile, args.dimensions, args.drop_others, args.dry_run, args.maintenance_work_mem))
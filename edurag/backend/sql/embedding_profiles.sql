@@ -0,0 +1,106 @@
+-- Vector search storage profiles (RAG_VECTOR_PROFILE), pgvector >= 0.7
+-- material_chunks.embedding keeps the full 1536-dim float32 vectors. A
+-- profile adds a smaller HNSW index over an expression of them, used for a
+-- first pass over candidates that are then rescored exactly:
+--
+--   full        embedding                                     vector_cosine_ops
+--   halfvec     embedding::halfvec(1536)                      halfvec_cosine_ops
+--   matryoshka  subvector(embedding, 1, N)::halfvec(N)        halfvec_cosine_ops
+--   binary      binary_quantize(embedding)::bit(1536)         bit_hamming_ops
+--
+-- text-embedding-3 vectors are Matryoshka-trained: their first N dimensions
+-- are what the embeddings API returns for dimensions=N, up to a norm that
+-- cosine distance ignores. Build the index with
+-- migrate_embedding_profile.py (CREATE INDEX CONCURRENTLY), e.g.:
+--
+--   CREATE INDEX CONCURRENTLY material_chunks_embedding_halfvec_idx
+--       ON material_chunks USING hnsw ((embedding::halfvec(1536)) halfvec_cosine_ops);
+
+-- Same contract as match_material_chunks: the threshold and the returned
+-- similarity use the exact cosine similarity of the full vectors
+CREATE OR REPLACE FUNCTION match_material_chunks_rerank(
+    query_embedding vector(1536),
+    match_threshold float,
+    match_count int,
+    filter_course_id uuid DEFAULT NULL,
+    filter_material_id uuid DEFAULT NULL,
+    search_profile text DEFAULT 'halfvec',
+    search_dimensions int DEFAULT 512,
+    candidate_count int DEFAULT 100
+)
+RETURNS TABLE (
+    id uuid,
+    material_id uuid,
+    chunk_text text,
+    chunk_index int,
+    metadata jsonb,
+    similarity float,
+    course_id uuid,
+    material_title text,
+    author text,
+    course_code text,
+    course_name text
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    -- Must match the index expression for the index to be used
+    first_pass text := CASE search_profile
+        WHEN 'halfvec' THEN
+            'mc.embedding::halfvec(1536) <=> $1::halfvec(1536)'
+        WHEN 'matryoshka' THEN
+            format(
+                'subvector(mc.embedding, 1, %1$s)::halfvec(%1$s) <=> subvector($1, 1, %1$s)::halfvec(%1$s)',
+                search_dimensions
+            )
+        WHEN 'binary' THEN
+            'binary_quantize(mc.embedding)::bit(1536) <~> binary_quantize($1)'
+        ELSE
+            'mc.embedding <=> $1'
+    END;
+BEGIN
+    -- An HNSW scan returns at most hnsw.ef_search rows (default 40, max 1000)
+    PERFORM set_config(
+        'hnsw.ef_search', LEAST(GREATEST(candidate_count, match_count, 40), 1000)::text, true
+    );
+
+    RETURN QUERY EXECUTE format(
+        $query$
+        WITH candidates AS (
+            SELECT mc.id
+            FROM material_chunks mc
+            JOIN materials m ON m.id = mc.material_id
+            WHERE ($2::uuid IS NULL OR m.course_id = $2)
+              AND ($3::uuid IS NULL OR mc.material_id = $3)
+            ORDER BY %s
+            LIMIT $4
+        )
+        SELECT
+            mc.id,
+            mc.material_id,
+            mc.chunk_text,
+            mc.chunk_index,
+            mc.metadata,
+            (1 - (mc.embedding <=> $1))::float AS similarity,
+            m.course_id,
+            m.title::text AS material_title,
+            COALESCE(m.author, 'Unknown')::text AS author,
+            c.code::text AS course_code,
+            c.name::text AS course_name
+        FROM candidates
+        JOIN material_chunks mc ON mc.id = candidates.id
+        JOIN materials m ON m.id = mc.material_id
+        LEFT JOIN courses c ON c.id = m.course_id
+        WHERE (1 - (mc.embedding <=> $1)) >= $5
+        ORDER BY mc.embedding <=> $1
+        LIMIT $6
+        $query$,
+        first_pass
+    )
+    USING query_embedding, filter_course_id, filter_material_id,
+          GREATEST(candidate_count, match_count), match_threshold, match_count;
+END;
+$$;
+
+COMMENT ON FUNCTION match_material_chunks_rerank IS
+'match_material_chunks with a first pass on a reduced/quantized HNSW index (search_profile) and exact rescoring of candidate_count candidates with the full vectors';
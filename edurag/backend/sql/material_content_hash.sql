@@ -0,0 +1,10 @@
+-- Content-addressed deduplication of uploaded PDFs
+-- SHA-256 of each uploaded file; a new upload whose hash matches an
+-- already processed material reuses its chunks and embeddings
+-- Enable it with UPLOAD_DEDUP_ENABLED=true once this migration has run
+
+ALTER TABLE materials ADD COLUMN IF NOT EXISTS content_hash text;
+
+CREATE INDEX IF NOT EXISTS materials_content_hash_idx
+    ON materials (content_hash, processed_at DESC)
+    WHERE content_hash IS NOT NULL;
@@ -0,0 +1,109 @@
+-- Near-duplicate chunks across materials (NEAR_DUP_ENABLED)
+-- A chunk that repeats a chunk of another material of the same course
+-- (MinHash/LSH at ingestion, app/services/near_duplicates.py) is stored
+-- with canonical_chunk_id pointing at that row and no embedding: it is
+-- neither embedded nor part of the HNSW index, and vector searches return
+-- the canonical row only.
+
+-- No foreign key: a deleted canonical row hands its embedding to one of
+-- its duplicates (trigger below) instead of unlinking them
+ALTER TABLE material_chunks ADD COLUMN IF NOT EXISTS canonical_chunk_id uuid;
+
+CREATE INDEX IF NOT EXISTS material_chunks_canonical_chunk_id_idx
+    ON material_chunks (canonical_chunk_id)
+    WHERE canonical_chunk_id IS NOT NULL;
+
+-- When a canonical row is deleted (material deleted or re-processed), its
+-- first remaining duplicate becomes canonical with the deleted embedding
+-- and the other duplicates are re-linked to it. AFTER the statement's rows
+-- are gone, so a duplicate deleted by the same statement is never chosen.
+CREATE OR REPLACE FUNCTION promote_near_duplicate_chunk()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    heir uuid;
+BEGIN
+    IF OLD.canonical_chunk_id IS NOT NULL THEN
+        RETURN NULL;
+    END IF;
+
+    SELECT id INTO heir
+    FROM material_chunks
+    WHERE canonical_chunk_id = OLD.id
+    ORDER BY id
+    LIMIT 1;
+
+    IF heir IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    UPDATE material_chunks
+    SET canonical_chunk_id = NULL, embedding = OLD.embedding
+    WHERE id = heir;
+
+    UPDATE material_chunks
+    SET canonical_chunk_id = heir
+    WHERE canonical_chunk_id = OLD.id;
+
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS material_chunks_promote_near_duplicate ON material_chunks;
+CREATE TRIGGER material_chunks_promote_near_duplicate
+    AFTER DELETE ON material_chunks
+    FOR EACH ROW
+    EXECUTE FUNCTION promote_near_duplicate_chunk();
+
+-- A material's duplicate rows scored with their canonical chunk's
+-- embedding (same columns as match_material_chunks). Searches filtered by
+-- material merge these with match_material_chunks, whose canonical rows
+-- may belong to other materials.
+CREATE OR REPLACE FUNCTION match_material_duplicate_chunks(
+    query_embedding vector(1536),
+    match_threshold float,
+    match_count int,
+    filter_material_id uuid
+)
+RETURNS TABLE (
+    id uuid,
+    material_id uuid,
+    chunk_text text,
+    chunk_index int,
+    metadata jsonb,
+    similarity float,
+    course_id uuid,
+    material_title text,
+    author text,
+    course_code text,
+    course_name text
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        mc.id,
+        mc.material_id,
+        mc.chunk_text,
+        mc.chunk_index,
+        mc.metadata,
+        (1 - (canonical.embedding <=> query_embedding))::float AS similarity,
+        m.course_id,
+        m.title::text AS material_title,
+        COALESCE(m.author, 'Unknown')::text AS author,
+        c.code::text AS course_code,
+        c.name::text AS course_name
+    FROM material_chunks mc
+    JOIN material_chunks canonical ON canonical.id = mc.canonical_chunk_id
+    JOIN materials m ON m.id = mc.material_id
+    LEFT JOIN courses c ON c.id = m.course_id
+    WHERE mc.material_id = filter_material_id
+      AND mc.canonical_chunk_id IS NOT NULL
+      AND (1 - (canonical.embedding <=> query_embedding)) >= match_threshold
+    ORDER BY canonical.embedding <=> query_embedding
+    LIMIT match_count;
+$$;
+
+COMMENT ON COLUMN material_chunks.canonical_chunk_id IS
+'Near-duplicate of this chunk (other material, same course) that holds the embedding; NULL for canonical rows';
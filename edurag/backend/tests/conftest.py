@@ -0,0 +1,30 @@
+"""
+Pytest configuration
+
+Settings() requires the Supabase/OpenAI variables and several services open
+their SQLite sidecars at import, so the environment is set up here, before
+any test imports the app: fake credentials (nothing connects to them), the
+offline LLM provider and every sidecar file in a temporary directory.
+"""
+
+import os
+import tempfile
+
+_state_dir = tempfile.mkdtemp(prefix="edurag-tests-")
+
+for _name in ("SUPABASE_URL", "SUPABASE_ANON_KEY", "SUPABASE_SERVICE_ROLE_KEY", "OPENAI_API_KEY"):
+    os.environ.setdefault(_name, "unused")
+os.environ.setdefault("LLM_PROVIDER", "fake")
+
+for _name, _file in {
+    "JOB_QUEUE_PATH": "job_queue.sqlite",
+    "JOB_SPOOL_DIR": "job_spool",
+    "PROGRESS_STORE_PATH": "ingestion_progress.sqlite",
+    "INGEST_CHECKPOINT_PATH": "ingest_checkpoints.sqlite",
+    "OCR_CACHE_PATH": "ocr_cache.sqlite",
+    "BM25_INDEX_PATH": "bm25_index.sqlite",
+    "NEAR_DUP_INDEX_PATH": "near_duplicates.sqlite",
+    "LOCAL_INDEX_DIR": "local_index",
+    "ANSWER_CACHE_VERSIONS_PATH": "answer_cache_versions.sqlite"
+}.items():
+    os.environ[_name] = os.path.join(_state_dir, _file)
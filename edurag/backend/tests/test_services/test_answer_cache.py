@@ -0,0 +1,82 @@
+"""Answer cache: version keys and scoped invalidation"""
+
+from app.services.answer_cache import AnswerCache
+
+QUESTION = [1.0, 0.0, 0.0]
+
+
+def cache_with(cache: AnswerCache, course_id, material_id=None, top_k: int = 5) -> None:
+    versions = cache.current_versions(course_id, material_id)
+    cache.store(QUESTION, course_id, material_id, top_k, versions, {"answer": f"{course_id}/{material_id}"})
+
+
+def hit(cache: AnswerCache, course_id, material_id=None, top_k: int = 5) -> bool:
+    return cache.lookup(QUESTION, course_id, material_id, top_k) is not None
+
+
+def test_version_keys():
+    assert AnswerCache._version_keys(None, None) == ["all", "global"]
+    assert AnswerCache._version_keys("A", None) == ["all", "course:A"]
+    assert AnswerCache._version_keys("A", "m1") == ["all", "course:A", "material:m1"]
+
+
+def test_invalidation_keys():
+    assert AnswerCache._invalidation_keys("A", "m1") == ["global", "course:A", "material:m1"]
+    assert AnswerCache._invalidation_keys("A", None) == ["global", "course:A"]
+    # Without the course, scoped entries cannot be found
+    assert AnswerCache._invalidation_keys(None, "m1") == ["all"]
+
+
+def test_invalidation_is_scoped_to_the_course():
+    cache = AnswerCache()
+    cache_with(cache, "A")
+    cache_with(cache, "A", "m1")
+    cache_with(cache, "B")
+    cache_with(cache, None)
+
+    cache.invalidate("A", "m1")
+
+    assert not hit(cache, "A")
+    assert not hit(cache, "A", "m1")
+    assert not hit(cache, None)
+    assert hit(cache, "B")
+
+
+def test_unknown_course_invalidates_everything():
+    cache = AnswerCache()
+    cache_with(cache, "A")
+    cache_with(cache, "B", "m2")
+    cache.invalidate(None, "m1")
+    assert not hit(cache, "A")
+    assert not hit(cache, "B", "m2")
+
+
+def test_store_with_stale_snapshot_is_not_served():
+    cache = AnswerCache()
+    versions = cache.current_versions("A", None)
+    # Invalidated while the answer was being generated
+    cache.invalidate("A")
+    cache.store(QUESTION, "A", None, 5, versions, {"answer": "old"})
+    assert not hit(cache, "A")
+
+
+def test_similarity_threshold_and_scope():
+    cache = AnswerCache(similarity_threshold=0.95)
+    cache_with(cache, "A")
+    assert cache.lookup([1.0, 0.05, 0.0], "A", None, 5) is not None
+    assert cache.lookup([0.0, 1.0, 0.0], "A", None, 5) is None
+    assert not hit(cache, "A", top_k=3)
+
+
+
+def test_versions_are_shared_through_the_sqlite_file(tmp_path):
+    path = str(tmp_path / "versions.sqlite")
+    web = AnswerCache(versions_path=path)
+    worker = AnswerCache(versions_path=path)
+    cache_with(web, "A")
+    cache_with(web, "B")
+
+    worker.invalidate("A", "m1")
+
+    assert not hit(web, "A")
+    assert hit(web, "B")
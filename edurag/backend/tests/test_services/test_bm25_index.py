@@ -0,0 +1,37 @@
+"""Reciprocal rank fusion of the BM25 and vector legs"""
+
+import pytest
+
+from app.services.bm25_index import reciprocal_rank_fusion
+
+
+def chunk(material_id: str, chunk_index: int, **scores) -> dict:
+    return {"material_id": material_id, "chunk_index": chunk_index, "chunk_text": f"{material_id}-{chunk_index}", **scores}
+
+
+def test_rrf_scores_are_summed_across_lists():
+    vector = [chunk("m1", 0, similarity=0.9), chunk("m1", 1, similarity=0.8)]
+    keyword = [chunk("m1", 1, bm25_score=7.0), chunk("m2", 4, bm25_score=5.0)]
+
+    fused = reciprocal_rank_fusion([vector, keyword], k=60, top_k=3)
+
+    assert [(c["material_id"], c["chunk_index"]) for c in fused] == [("m1", 1), ("m1", 0), ("m2", 4)]
+    assert fused[0]["rrf_score"] == pytest.approx(1 / 62 + 1 / 61, abs=1e-6)
+    assert fused[1]["rrf_score"] == pytest.approx(1 / 61, abs=1e-6)
+
+
+def test_rrf_fills_in_missing_scores_and_truncates():
+    vector = [chunk("m1", 0, similarity=0.9, bm25_score=None)]
+    keyword = [chunk("m1", 0, bm25_score=3.5), chunk("m2", 0, bm25_score=1.0)]
+
+    fused = reciprocal_rank_fusion([vector, keyword], top_k=1)
+
+    assert len(fused) == 1
+    assert fused[0]["similarity"] == 0.9
+    assert fused[0]["bm25_score"] == 3.5
+
+
+def test_rrf_matches_by_id_without_chunk_index():
+    first = [{"id": "a"}, {"id": "b"}]
+    second = [{"id": "b"}]
+    assert [c["id"] for c in reciprocal_rank_fusion([first, second], top_k=2)] == ["b", "a"]
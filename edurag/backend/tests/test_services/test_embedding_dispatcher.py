@@ -0,0 +1,40 @@
+"""Embedding dispatcher: batching, deduplication and failed batches"""
+
+import asyncio
+
+from app.services.embedding_dispatcher import EmbeddingDispatcher
+
+
+def test_concurrent_requests_share_one_batch():
+    calls = []
+
+    async def embed_fn(texts):
+        calls.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+    async def main():
+        dispatcher = EmbeddingDispatcher(embed_fn, window_ms=5)
+        vectors = await asyncio.gather(*(dispatcher.embed(text) for text in ("a", "bb", "a")))
+        return dispatcher, vectors
+
+    dispatcher, vectors = asyncio.run(main())
+    assert vectors == [[1.0], [2.0], [1.0]]
+    assert calls == [["a", "bb"]]
+    assert dispatcher.stats()["deduplicated"] == 1
+
+
+def test_short_result_fails_every_caller():
+    async def embed_fn(texts):
+        return [[0.0]] * (len(texts) - 1)
+
+    async def main():
+        dispatcher = EmbeddingDispatcher(embed_fn, window_ms=5)
+        results = await asyncio.wait_for(
+            asyncio.gather(*(dispatcher.embed(text) for text in ("a", "b")), return_exceptions=True), timeout=5
+        )
+        return dispatcher, results
+
+    dispatcher, results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert dispatcher._inflight == {}
+    assert dispatcher.stats()["failed_batches"] == 1
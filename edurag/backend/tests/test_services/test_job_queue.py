@@ -0,0 +1,116 @@
+"""Job queue: leases, retries, dead-lettering and cancellation"""
+
+import time
+
+import pytest
+
+from app.services.job_queue import CANCELLED, DEAD, DONE, PROCESS_PDF, QUEUED, RUNNING, JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path) -> JobQueue:
+    return JobQueue(str(tmp_path / "jobs.sqlite"), max_attempts=2, backoff_seconds=0.0, backoff_max_seconds=0.0)
+
+
+def status(queue: JobQueue, job_id: int) -> str:
+    return next(job["status"] for job in queue.list_jobs() if job["id"] == job_id)
+
+
+def test_claim_leases_a_job_once(queue):
+    job_id = queue.enqueue(PROCESS_PDF, {"material_id": "m1"})
+    job = queue.claim("w1", lease_seconds=60)
+    assert job["id"] == job_id
+    assert job["status"] == RUNNING
+    assert job["attempts"] == 1
+    assert job["payload"] == {"material_id": "m1"}
+    assert queue.claim("w2", lease_seconds=60) is None
+
+
+def test_delayed_job_is_not_claimed_early(queue):
+    queue.enqueue(PROCESS_PDF, {"material_id": "m1"}, delay=60)
+    assert queue.claim("w1", lease_seconds=60) is None
+
+
+def test_expired_lease_is_claimed_by_another_worker(queue):
+    job_id = queue.enqueue(PROCESS_PDF, {"material_id": "m1"})
+    queue.claim("w1", lease_seconds=0.01)
+    time.sleep(0.05)
+
+    job = queue.claim("w2", lease_seconds=60)
+    assert job["id"] == job_id
+    assert job["attempts"] == 2
+    # w1 lost the job: its heartbeat and completion are refused
+    assert not queue.heartbeat(job_id, "w1", 60)
+    assert not queue.complete(job_id, "w1")
+    assert queue.heartbeat(job_id, "w2", 60)
+    assert queue.complete(job_id, "w2")
+    assert status(queue, job_id) == DONE
+
+
+def test_failures_retry_then_dead_letter(queue):
+    job_id = queue.enqueue(PROCESS_PDF, {"material_id": "m1"})
+
+    job = queue.claim("w1", lease_seconds=60)
+    assert queue.fail(job, "w1", "first") == QUEUED
+
+    job = queue.claim("w1", lease_seconds=60)
+    assert job["attempts"] == 2
+    assert queue.fail(job, "w1", "second") == DEAD
+    assert queue.claim("w1", lease_seconds=60) is None
+    assert queue.list_jobs(DEAD)[0]["last_error"] == "second"
+
+    assert queue.requeue(job_id)
+    assert queue.claim("w1", lease_seconds=60)["attempts"] == 1
+
+
+def test_expired_lease_on_the_last_attempt_is_dead_lettered(queue):
+    job_id = queue.enqueue(PROCESS_PDF, {"material_id": "m1"})
+    for _ in range(2):
+        # The worker dies without calling fail()
+        assert queue.claim("w1", lease_seconds=0.01)["id"] == job_id
+        time.sleep(0.05)
+
+    assert queue.claim("w2", lease_seconds=60) is None
+    dead = queue.list_jobs(DEAD)
+    assert [(job["id"], job["attempts"]) for job in dead] == [(job_id, 2)]
+    assert "Lease expired" in dead[0]["last_error"]
+    assert [job["id"] for job in queue.take_expired()] == [job_id]
+    assert queue.take_expired() == []
+
+
+def test_backoff_delays_the_retry(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"), max_attempts=3, backoff_seconds=60.0)
+    queue.enqueue(PROCESS_PDF, {"material_id": "m1"})
+    assert queue.fail(queue.claim("w1", lease_seconds=60), "w1", "boom") == QUEUED
+    assert queue.claim("w1", lease_seconds=60) is None
+
+
+def test_find_active_and_cancel(queue):
+    queued_id = queue.enqueue(PROCESS_PDF, {"material_id": "m1"})
+    other_id = queue.enqueue(PROCESS_PDF, {"material_id": "m2"})
+    running = queue.claim("w1", lease_seconds=60)
+    assert running["id"] == queued_id
+    assert queue.find_active(PROCESS_PDF, "material_id", "m1")["id"] == queued_id
+
+    cancelled = queue.cancel_active(PROCESS_PDF, "material_id", "m1")
+
+    assert [job["id"] for job in cancelled] == [queued_id]
+    assert status(queue, queued_id) == CANCELLED
+    assert queue.find_active(PROCESS_PDF, "material_id", "m1") is None
+    # The worker running it stops at its next heartbeat and cannot revive it
+    assert not queue.heartbeat(queued_id, "w1", 60)
+    assert queue.fail(running, "w1", "interrupted") is None
+    assert status(queue, queued_id) == CANCELLED
+    assert status(queue, other_id) == QUEUED
+
+
+def test_stats_and_purge(queue):
+    done_id = queue.enqueue(PROCESS_PDF, {"material_id": "m1"})
+    queue.enqueue(PROCESS_PDF, {"material_id": "m2"})
+    queue.claim("w1", lease_seconds=60)
+    queue.complete(done_id, "w1")
+
+    stats = queue.stats()
+    assert (stats[DONE], stats[QUEUED], stats[RUNNING]) == (1, 1, 0)
+    assert queue.purge_done(older_than_seconds=-1) == 1
+    assert queue.stats()[DONE] == 0
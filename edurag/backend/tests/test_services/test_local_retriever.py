@@ -0,0 +1,154 @@
+"""Local retriever: incremental sync, compaction and reload from disk"""
+
+import asyncio
+import uuid
+
+import numpy as np
+import pytest
+
+import app.services.local_retriever as local_retriever
+from app.services.local_retriever import LocalRetriever, VectorIndex
+
+
+class FakeConnection:
+    """Answers the two queries LocalRetriever.sync runs"""
+
+    def __init__(self, database: dict):
+        self.database = database
+
+    async def fetch(self, query: str, *args):
+        if "FROM materials" in query:
+            return [
+                {"material_id": material_id, "processed_at": material["processed_at"],
+                 "course_id": material["course_id"], "material_title": material_id, "author": None,
+                 "course_code": None, "course_name": None}
+                for material_id, material in self.database.items()
+            ]
+        return self.database[args[0]]["chunks"]
+
+
+class FakePool:
+    def __init__(self, database: dict):
+        self.database = database
+
+    def acquire(self, timeout=None):
+        pool = self
+
+        class Acquire:
+            async def __aenter__(self):
+                return FakeConnection(pool.database)
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return Acquire()
+
+
+def material(course_id: str, chunks: int, rng: np.random.Generator, processed_at: str = "t1") -> dict:
+    return {
+        "course_id": course_id,
+        "processed_at": processed_at,
+        "chunks": [
+            {"id": str(uuid.uuid4()), "chunk_index": index, "chunk_text": f"chunk {index}", "metadata": {},
+             "embedding": rng.standard_normal(local_retriever.EMBEDDING_DIM)}
+            for index in range(chunks)
+        ]
+    }
+
+
+@pytest.fixture
+def database(monkeypatch) -> dict:
+    rng = np.random.default_rng(0)
+    database = {f"m{i}": material("A" if i % 2 else "B", 60 if i < 4 else 20, rng) for i in range(10)}
+    monkeypatch.setattr(local_retriever, "get_db_pool", lambda: FakePool(database))
+    return database
+
+
+def search(retriever: LocalRetriever, embedding, **filters) -> list:
+    return asyncio.run(retriever.search(embedding, -1.0, 3, **filters))
+
+
+def test_sync_indexes_completed_materials(tmp_path, database):
+    retriever = LocalRetriever(str(tmp_path))
+    result = asyncio.run(retriever.sync())
+    assert result == {"materials_removed": 0, "materials_added": 10, "chunks_added": 4 * 60 + 6 * 20}
+    assert retriever.ready
+
+    target = database["m5"]["chunks"][3]
+    best = search(retriever, target["embedding"])[0]
+    assert (best["id"], best["material_id"], best["course_id"]) == (target["id"], "m5", "A")
+    assert best["similarity"] == pytest.approx(1.0, abs=1e-2)
+
+    assert {hit["course_id"] for hit in search(retriever, target["embedding"], course_id="B")} == {"B"}
+    assert {hit["material_id"] for hit in search(retriever, target["embedding"], material_id="m6")} == {"m6"}
+    assert search(retriever, target["embedding"], course_id="B", material_id="m5") == []
+
+
+def test_deleted_materials_are_compacted_away(tmp_path, database):
+    retriever = LocalRetriever(str(tmp_path))
+    asyncio.run(retriever.sync())
+    for material_id in ("m0", "m1", "m2", "m3"):
+        del database[material_id]
+
+    result = asyncio.run(retriever.sync())
+
+    assert result["materials_removed"] == 4
+    # Over 30% tombstones: the live rows were copied into a new matrix
+    assert retriever.index.count == retriever.index.live_count == 6 * 20
+    assert retriever.stats()["dead_ratio"] == 0.0
+    target = database["m7"]["chunks"][5]
+    best = search(retriever, target["embedding"], course_id="A")[0]
+    assert (best["id"], best["material_id"]) == (target["id"], "m7")
+
+
+def test_reprocessed_material_is_replaced(tmp_path, database):
+    retriever = LocalRetriever(str(tmp_path))
+    asyncio.run(retriever.sync())
+    database["m4"] = material("B", 5, np.random.default_rng(1), processed_at="t2")
+
+    result = asyncio.run(retriever.sync())
+
+    assert (result["materials_removed"], result["materials_added"], result["chunks_added"]) == (1, 1, 5)
+    target = database["m4"]["chunks"][0]
+    assert search(retriever, target["embedding"], material_id="m4")[0]["id"] == target["id"]
+    assert len(asyncio.run(retriever.search(target["embedding"], -1.0, 50, material_id="m4"))) == 5
+
+
+def test_restart_reloads_the_persisted_index(tmp_path, database):
+    retriever = LocalRetriever(str(tmp_path))
+    asyncio.run(retriever.sync())
+    for material_id in ("m0", "m1", "m2", "m3"):
+        del database[material_id]
+    asyncio.run(retriever.sync())
+
+    reloaded = LocalRetriever(str(tmp_path))
+    result = asyncio.run(reloaded.sync())
+
+    assert result["materials_added"] == result["materials_removed"] == 0
+    assert reloaded.index.live_count == 6 * 20
+    target = database["m9"]["chunks"][2]
+    best = search(reloaded, target["embedding"], course_id="A")[0]
+    assert (best["id"], best["material_id"]) == (target["id"], "m9")
+
+    # Later syncs keep the in-memory state (the stale file is not reloaded)
+    del database["m9"]
+    asyncio.run(reloaded.sync())
+    assert search(reloaded, target["embedding"], material_id="m9") == []
+    assert reloaded.index.live_count == 5 * 20
+
+
+def test_ivf_search_finds_the_nearest_rows():
+    rng = np.random.default_rng(0)
+    index = VectorIndex(dim=32, index_type="ivf", nlist=8, nprobe=8, dtype="float32")
+    vectors = rng.standard_normal((2000, 32)).astype(np.float32)
+    index.add(vectors[:1000], group=0)
+    index.add(vectors[1000:], group=1)
+    index.train()
+
+    hits = index.search(vectors[1500], 1, -1.0, None)
+    assert hits[0][0] == 1500
+    assert index.search(vectors[1500], 1, -1.0, [0])[0][0] < 1000
+
+    index.remove_group(1)
+    assert index.live_count == 1000
+    assert all(row < 1000 for row, _ in index.search(vectors[1500], 5, -1.0, None))
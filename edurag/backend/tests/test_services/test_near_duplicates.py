@@ -0,0 +1,134 @@
+"""Near-duplicate chunks: MinHash estimates and LSH linking"""
+
+import random
+
+import numpy as np
+import pytest
+
+from app.services.near_duplicates import MinHasher, NearDuplicateIndex, shingles
+
+rng = random.Random(0)
+WORDS = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 9))) for _ in range(3000)]
+
+
+def text(length: int = 200, seed: int = 0) -> str:
+    generator = random.Random(seed)
+    return " ".join(generator.choice(WORDS) for _ in range(length))
+
+
+def edited(source: str, edits: int, seed: int = 1) -> str:
+    generator = random.Random(seed)
+    words = source.split()
+    for position in generator.sample(range(len(words)), edits):
+        words[position] = generator.choice(WORDS)
+    return " ".join(words)
+
+
+def jaccard(a: str, b: str) -> float:
+    first, second = set(shingles(a)), set(shingles(b))
+    return len(first & second) / len(first | second)
+
+
+def chunks(*texts) -> list:
+    return [{"chunk_text": value, "token_count": len(value.split())} for value in texts]
+
+
+@pytest.fixture
+def index(tmp_path) -> NearDuplicateIndex:
+    return NearDuplicateIndex(str(tmp_path / "near_duplicates.sqlite"), num_perm=128, bands=16, threshold=0.8)
+
+
+def test_shingles_are_normalized_word_ngrams():
+    assert shingles("Uno, DOS tres cuatro cinco seis") == ["uno dos tres cuatro cinco", "dos tres cuatro cinco seis"]
+    assert shingles("tres palabras nada") == ["tres palabras nada"]
+
+
+def test_minhash_estimates_jaccard():
+    hasher = MinHasher(num_perm=256)
+    original = text()
+    for edits in (0, 2, 10, 40):
+        other = edited(original, edits)
+        estimate = float(np.mean(hasher.signature(original) == hasher.signature(other)))
+        assert estimate == pytest.approx(jaccard(original, other), abs=0.1)
+
+
+def test_short_chunks_have_no_signature():
+    assert MinHasher().signature("demasiado corto para enlazar") is None
+
+
+def test_near_duplicate_is_linked_after_commit(index):
+    original = text(seed=1)
+    index.mark_chunks("m1", "course", chunks(original))
+    duplicate = chunks(edited(original, 2))
+    # m1 is still pending: nothing to link to yet
+    assert index.mark_chunks("m2", "course", duplicate) == 0
+    index.remove_material("m2")
+
+    index.commit_material("m1")
+    duplicate = chunks(edited(original, 2))
+    assert index.mark_chunks("m2", "course", duplicate) == 1
+    canonical_id = duplicate[0]["canonical_chunk_id"]
+    assert canonical_id == index._db.execute("SELECT chunk_id FROM signatures WHERE material_id = 'm1'").fetchone()[0]
+
+
+def test_unrelated_chunks_and_other_courses_are_not_linked(index):
+    original = text(seed=1)
+    index.mark_chunks("m1", "course", chunks(original))
+    index.commit_material("m1")
+    assert index.mark_chunks("m2", "course", chunks(text(seed=2), edited(original, 60))) == 0
+    assert index.mark_chunks("m3", "other-course", chunks(original)) == 0
+
+
+def test_chunks_of_the_same_material_are_not_linked(index):
+    original = text(seed=1)
+    index.mark_chunks("m1", "course", chunks(original))
+    index.commit_material("m1")
+    assert index.mark_chunks("m1", "course", chunks(original)) == 0
+
+
+def test_remove_material_forgets_signatures_and_links(index):
+    original = text(seed=1)
+    index.mark_chunks("m1", "course", chunks(original))
+    index.commit_material("m1")
+    index.mark_chunks("m2", "course", chunks(original))
+    index.commit_material("m2")
+    assert index.stats()["duplicate_chunks"] == 1
+
+    assert index.remove_material("m1") == 1
+
+    stats = index.stats()
+    assert (stats["canonical_chunks"], stats["duplicate_chunks"]) == (0, 0)
+    assert index.mark_chunks("m3", "course", chunks(original)) == 0
+
+
+def test_failed_bulk_reprocess_keeps_the_committed_signatures(index):
+    original = text(seed=1)
+    index.mark_chunks("m1", "course", chunks(original))
+    index.commit_material("m1")
+
+    # Re-processing m1 through the loader: it stages new rows, then its
+    # transaction rolls back and the committed rows stay in material_chunks
+    index.discard_pending("m1")
+    index.mark_chunks("m1", "course", chunks(text(seed=2)))
+    assert index.discard_pending("m1") == 1
+
+    assert index.stats()["canonical_chunks"] == 1
+    duplicate = chunks(edited(original, 2))
+    assert index.mark_chunks("m2", "course", duplicate) == 1
+
+
+def test_commit_replaces_the_previous_run(index):
+    original, replacement = text(seed=1), text(seed=2)
+    index.mark_chunks("m1", "course", chunks(original))
+    index.commit_material("m1")
+    index.mark_chunks("m1", "course", chunks(replacement))
+    index.commit_material("m1")
+
+    assert index.stats()["canonical_chunks"] == 1
+    assert index.mark_chunks("m2", "course", chunks(original)) == 0
+    assert index.mark_chunks("m3", "course", chunks(replacement)) == 1
+
+
+def test_bands_must_divide_permutations(tmp_path):
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(str(tmp_path / "bad.sqlite"), num_perm=100, bands=16)
@@ -0,0 +1,60 @@
+"""Ingestion progress: completion estimate and persisted records"""
+
+import pytest
+
+from app.services.progress_store import ProgressStore, estimate
+
+
+def progress(**fields) -> dict:
+    record = {
+        "stage": "embedding", "started_at": 100.0, "pages_total": 10, "pages_extracted": 0, "pages_ocr": 0,
+        "chunks_created": 0, "chunks_embedded": 0, "chunks_stored": 0
+    }
+    record.update(fields)
+    return record
+
+
+def test_nothing_read_yet():
+    assert estimate(progress(), 110.0) == {"percent": 0.0, "elapsed_seconds": 10.0, "eta_seconds": None}
+
+
+def test_half_read_nothing_stored():
+    result = estimate(progress(pages_extracted=5, chunks_created=20), 110.0)
+    assert result["percent"] == 25.0
+    # 10s for a quarter of the work
+    assert result["eta_seconds"] == 30.0
+
+
+def test_chunk_total_is_extrapolated_from_pages_read():
+    # 20 chunks from half the pages: about 40 in total, 10 stored
+    result = estimate(progress(pages_extracted=5, chunks_created=20, chunks_stored=10), 130.0)
+    assert result["percent"] == pytest.approx((0.5 + 10 / 40) / 2 * 100)
+
+
+def test_ocr_pages_count_as_read():
+    assert estimate(progress(pages_extracted=2, pages_ocr=10, chunks_created=30, chunks_stored=30), 110.0)["percent"] == 100.0
+
+
+def test_completed_is_done_whatever_the_counters():
+    result = estimate(progress(stage="completed"), 150.0)
+    assert result == {"percent": 100.0, "elapsed_seconds": 50.0, "eta_seconds": 0.0}
+
+
+def test_store_publishes_throttled_updates_and_final_stage(tmp_path):
+    store = ProgressStore(str(tmp_path / "progress.sqlite"), min_interval=3600)
+    store.start("m1")
+    store.update("m1", pages_total=4, pages_extracted=1)
+    # Throttled: the persisted row still has the start record
+    assert store.get("m1")["pages_extracted"] == 0
+
+    store.update("m1", stage="embedding", pages_extracted=2)
+    assert store.get("m1")["pages_extracted"] == 2
+
+    store.finish("m1", "failed", "boom")
+    final = store.get("m1")
+    assert final["stage"] == "failed"
+    assert final["error"] == "boom"
+    # Not tracked any more
+    store.update("m1", pages_extracted=4)
+    assert store.get("m1")["pages_extracted"] == 2
+    assert store.get("unknown") is None
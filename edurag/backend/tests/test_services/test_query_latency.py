@@ -0,0 +1,78 @@
+"""Query p99 latency while the CPU pool runs an ingestion load"""
+
+import asyncio
+import time
+
+import pytest
+
+tiktoken = pytest.importorskip("tiktoken")
+try:
+    # The pool's workers load it when they start; it is downloaded on first use
+    tiktoken.get_encoding("cl100k_base")
+except Exception as e:
+    pytest.skip(f"tiktoken cl100k_base encoding unavailable: {e}", allow_module_level=True)
+
+from app.core.config import settings  # noqa: E402
+from app.services.cpu_pool import run_in_cpu_pool, start_cpu_pool, stop_cpu_pool  # noqa: E402
+from app.services.llm_gateway import FakeProvider, LLMGateway  # noqa: E402
+from app.services.pdf_text import count_tokens, tokenize  # noqa: E402
+
+QUESTION = "¿Qué diferencia hay entre la respiración celular y la fotosíntesis en la producción de ATP?"
+PAGE = "La fotosíntesis convierte la energía luminosa en energía química almacenada en glucosa. " * 400
+QUERIES = 200
+# The loaded p99 may grow by this factor, plus this slack for scheduler noise
+MAX_RATIO = 3.0
+SLACK_SECONDS = 0.05
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def query_latencies(gateway: LLMGateway) -> list:
+    """Latency of sequential queries: tokenize the question, embed it, answer"""
+    latencies = []
+    for _ in range(QUERIES):
+        started = time.perf_counter()
+        count_tokens(QUESTION)
+        await gateway.embed([QUESTION])
+        await gateway.chat([{"role": "user", "content": QUESTION}])
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+async def ingest_pages(stop: asyncio.Event) -> int:
+    """Tokenize pages in the CPU pool, as extraction and chunking do, until stopped"""
+    pages = 0
+    while not stop.is_set():
+        await asyncio.gather(*(run_in_cpu_pool(tokenize, PAGE) for _ in range(4)))
+        pages += 4
+    return pages
+
+
+def test_p99_during_ingestion_stays_near_idle(monkeypatch):
+    monkeypatch.setattr(settings, "CPU_POOL_ENABLED", True)
+    gateway = LLMGateway(FakeProvider(latency=0.005, seed=0))
+
+    async def main():
+        await start_cpu_pool()
+        try:
+            idle = await query_latencies(gateway)
+            stop = asyncio.Event()
+            ingestion = asyncio.ensure_future(ingest_pages(stop))
+            # Let the workers get busy before measuring
+            await asyncio.sleep(0.2)
+            loaded = await query_latencies(gateway)
+            stop.set()
+            return idle, loaded, await ingestion
+        finally:
+            stop_cpu_pool()
+
+    idle, loaded, pages = asyncio.run(main())
+
+    assert pages > 0
+    idle_p99, loaded_p99 = percentile(idle, 0.99), percentile(loaded, 0.99)
+    assert loaded_p99 <= idle_p99 * MAX_RATIO + SLACK_SECONDS, (
+        f"p99 {loaded_p99 * 1000:.1f}ms during ingestion vs {idle_p99 * 1000:.1f}ms idle"
+    )
@@ -0,0 +1,36 @@
+"""MMR selection of the re-ranking stage"""
+
+import numpy as np
+
+from app.services.reranker import mmr_select
+
+
+def unit(*rows) -> np.ndarray:
+    vectors = np.asarray(rows, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_mmr_without_diversity_is_relevance_order():
+    candidates = unit([1, 0], [1, 0.01], [0, 1])
+    relevance = np.array([0.9, 0.95, 0.5], dtype=np.float32)
+    assert mmr_select(candidates, relevance, 3, diversity=0.0) == [1, 0, 2]
+
+
+def test_mmr_skips_near_duplicates():
+    # 0 and 1 are the same passage; 2 is less relevant but new
+    candidates = unit([1, 0], [1, 0.01], [0, 1])
+    relevance = np.array([0.9, 0.89, 0.6], dtype=np.float32)
+    assert mmr_select(candidates, relevance, 2, diversity=0.5) == [0, 2]
+
+
+def test_mmr_zero_vectors_are_never_redundant():
+    candidates = np.zeros((3, 2), dtype=np.float32)
+    relevance = np.array([0.2, 0.9, 0.5], dtype=np.float32)
+    assert mmr_select(candidates, relevance, 3, diversity=0.7) == [1, 2, 0]
+
+
+def test_mmr_k_bounds():
+    candidates = unit([1, 0], [0, 1])
+    relevance = np.array([0.5, 0.4], dtype=np.float32)
+    assert mmr_select(candidates, relevance, 5, diversity=0.3) == [0, 1]
+    assert mmr_select(candidates, relevance, 0, diversity=0.3) == []
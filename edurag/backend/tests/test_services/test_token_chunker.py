@@ -0,0 +1,81 @@
+"""TokenChunker: character offsets, window sizes, overlap and pages"""
+
+import bisect
+
+import pytest
+
+tiktoken = pytest.importorskip("tiktoken")
+try:
+    # app.services.pdf_text loads it at import; it is downloaded on first use
+    tiktoken.get_encoding("cl100k_base")
+except Exception as e:
+    pytest.skip(f"tiktoken cl100k_base encoding unavailable: {e}", allow_module_level=True)
+
+from app.services.pdf_processor import TokenChunker  # noqa: E402
+from app.services.pdf_text import PAGE_MARKER, tokenize  # noqa: E402
+
+PAGES = [
+    "Introducción a las bases de datos. " * 40,
+    "Modelo relacional.\nClaves primarias y foráneas. " * 35,
+    "Normalización: primera, segunda y tercera forma normal! " * 30
+]
+
+
+def chunk_pages(chunk_size: int, chunk_overlap: int):
+    """Chunks of PAGES fed page by page, the document text and its token starts"""
+    chunker = TokenChunker(chunk_size, chunk_overlap)
+    chunks = []
+    document = ""
+    token_starts = []
+    for page_number, text in enumerate(PAGES, 1):
+        page = PAGE_MARKER.format(page=page_number) + text
+        # Pages are tokenized separately, as the chunker does
+        token_starts.extend(len(document) + offset for offset in tokenize(page)[1])
+        document += page
+        chunks.extend(chunker.add_page(page_number, text))
+    chunks.extend(chunker.finish())
+    return chunks, document, token_starts
+
+
+def tokens_between(token_starts, start: int, end: int) -> int:
+    return bisect.bisect_left(token_starts, end) - bisect.bisect_left(token_starts, start)
+
+
+@pytest.mark.parametrize("chunk_size,chunk_overlap", [(120, 20), (64, 0), (200, 50)])
+def test_offsets_point_at_the_chunk_text(chunk_size, chunk_overlap):
+    chunks, document, token_starts = chunk_pages(chunk_size, chunk_overlap)
+    assert len(chunks) > 3
+    for chunk in chunks:
+        metadata = chunk["metadata"]
+        assert document[metadata["char_start"]:metadata["char_end"]] == chunk["chunk_text"]
+        assert 0 < chunk["token_count"] <= chunk_size
+        assert tokens_between(token_starts, metadata["char_start"], metadata["char_end"]) == chunk["token_count"]
+
+
+@pytest.mark.parametrize("chunk_size,chunk_overlap", [(120, 20), (200, 50)])
+def test_consecutive_chunks_share_exactly_the_overlap(chunk_size, chunk_overlap):
+    chunks, _, token_starts = chunk_pages(chunk_size, chunk_overlap)
+    for previous, current in zip(chunks, chunks[1:]):
+        shared = tokens_between(token_starts, current["metadata"]["char_start"], previous["metadata"]["char_end"])
+        assert shared == chunk_overlap
+
+
+def test_chunks_cover_the_document_in_order():
+    chunks, document, _ = chunk_pages(120, 20)
+    assert [chunk["chunk_index"] for chunk in chunks] == list(range(len(chunks)))
+    assert chunks[0]["metadata"]["char_start"] == 0
+    assert chunks[-1]["metadata"]["char_end"] == len(document)
+
+
+def test_pages_follow_the_page_markers():
+    chunks, document, _ = chunk_pages(120, 20)
+    page_starts = [document.index(PAGE_MARKER.format(page=page)) for page in range(1, len(PAGES) + 1)]
+    for chunk in chunks:
+        expected = bisect.bisect_right(page_starts, chunk["metadata"]["char_start"])
+        assert chunk["metadata"]["page"] == expected
+    assert {chunk["metadata"]["page"] for chunk in chunks} == {1, 2, 3}
+
+
+def test_overlap_must_be_smaller_than_the_window():
+    with pytest.raises(ValueError):
+        TokenChunker(chunk_size=50, chunk_overlap=50)